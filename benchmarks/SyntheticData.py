@@ -0,0 +1,137 @@
+#!/usr/bin/python
+
+"""Generate synthetic API responses for the benchmarks
+
+The responses have the shape of the real ones (GA API v4 batchGet reports and Baidu Tongji getData results)
+with values that repeat the way web analytics dimensions do: a limited number of page paths, countries and
+sources/mediums shared by many rows. The generators are seeded, so every run benchmarks the same data.
+
+"""
+
+import random
+
+
+SITECONTENTDIMENSIONS = ['ga:date', 'ga:sourceMedium', 'ga:country', 'ga:landingPagePath', 'ga:hostname',
+                         'ga:pagePath', 'ga:previousPagePath', 'ga:pageDepth', 'ga:exitPagePath']
+SITECONTENTMETRICS = [('ga:pageviews', 'INTEGER'), ('ga:uniquePageviews', 'INTEGER'), ('ga:timeOnPage', 'TIME'),
+                      ('ga:avgTimeOnPage', 'TIME'), ('ga:entrances', 'INTEGER'), ('ga:bounceRate', 'PERCENT'),
+                      ('ga:exitRate', 'PERCENT'), ('ga:pageValue', 'CURRENCY'), ('ga:entranceRate', 'PERCENT'),
+                      ('ga:pageviewsPerSession', 'FLOAT'), ('ga:exits', 'INTEGER'),
+                      ('ga:avgSessionDuration', 'TIME'), ('ga:sessions', 'INTEGER')]
+SOURCEMEDIUMS = ['google / organic', '(direct) / (none)', 'bing / organic', 'facebook.com / referral',
+                 'newsletter / email', 'baidu / organic', 'google / cpc', '(not set)']
+COUNTRIES = ['United States', 'Canada', 'Mexico', 'Japan', 'China', 'Australia', 'Germany', 'France',
+             'United Kingdom', 'Korea', 'Philippines', 'Malaysia', 'Singapore', 'Taiwan', 'Hong Kong']
+BAIDUMETRICS = ['pv_count', 'visitor_count', 'ip_count', 'bounce_ratio', 'avg_visit_time']
+
+
+def get_page_paths(num_page_paths, seed=0):
+    """ Generate page paths with one to four levels
+
+    Args:
+        num_page_paths (int): number of distinct page paths
+        seed (int): seed of the random number generator
+
+    Returns:
+        page_paths (list of str): page paths, e.g. /shop/vitamins/item-12
+    """
+    rng = random.Random(seed)
+    sections = ['shop', 'blog', 'about', 'support', 'science', 'events', 'careers', 'news']
+    page_paths = ['(entrance)', '/']
+    while len(page_paths) < num_page_paths:
+        levels = [rng.choice(sections)] + ['level{i}-{j}'.format(i=i, j=rng.randrange(50))
+                                           for i in range(rng.randrange(4))]
+        page_paths.append('/' + '/'.join(levels))
+    return page_paths
+
+
+def get_num_distinct_values(num_rows):
+    """ Get the number of distinct page paths for a report size (roughly the square root of the rows) """
+    return max(10, int(num_rows ** 0.5))
+
+
+def get_sitecontent_rows(num_rows, seed=0):
+    """ Generate the dimension values of a daily site content report
+
+    Args:
+        num_rows (int): number of rows
+        seed (int): seed of the random number generator
+
+    Returns:
+        rows (list of lists): dimension values of each row in the order of SITECONTENTDIMENSIONS
+    """
+    rng = random.Random(seed)
+    page_paths = get_page_paths(get_num_distinct_values(num_rows), seed)
+    rows = []
+    for i in range(num_rows):
+        rows.append(['2019-01-{day:02d}'.format(day=1 + i % 28),
+                     rng.choice(SOURCEMEDIUMS),
+                     rng.choice(COUNTRIES),
+                     rng.choice(page_paths),
+                     'www.example.com',
+                     rng.choice(page_paths),
+                     rng.choice(page_paths),
+                     str(rng.randrange(1, 20)),
+                     rng.choice(page_paths)])
+    return rows
+
+
+def get_metric_value(rng, metric_type):
+    """ Generate a metric value formatted the way GA formats it """
+    if metric_type == 'INTEGER':
+        return str(rng.randrange(0, 5000))
+    return '{value:.4f}'.format(value=rng.random() * 100)
+
+
+def get_ga_v4_response(num_rows, seed=0, metrics=None):
+    """ Generate a GA API v4 batchGet response with one site content report
+
+    Args:
+        num_rows (int): number of rows in the report
+        seed (int): seed of the random number generator
+        metrics (list of tuples): (name, type) of each metric (defaults to the first 10 SITECONTENTMETRICS)
+
+    Returns:
+        response (dict): response in the format returned by GA
+    """
+    rng = random.Random(seed)
+    if metrics is None:
+        metrics = SITECONTENTMETRICS[:10]
+    rows = [{'dimensions': dimension_values,
+             'metrics': [{'values': [get_metric_value(rng, metric_type) for (metric_name, metric_type) in metrics]}]}
+            for dimension_values in get_sitecontent_rows(num_rows, seed)]
+    report = {'columnHeader': {'dimensions': list(SITECONTENTDIMENSIONS),
+                               'metricHeader': {'metricHeaderEntries': [{'name': metric_name, 'type': metric_type}
+                                                                        for (metric_name, metric_type) in metrics]}},
+              'data': {'rows': rows,
+                       'rowCount': num_rows,
+                       'isDataGolden': True}}
+    response = {'reports': [report]}
+    return response
+
+
+def get_baidu_response(num_rows, seed=0):
+    """ Generate a Baidu Tongji getData response for a report by district
+
+    Args:
+        num_rows (int): number of rows in the report
+        seed (int): seed of the random number generator
+
+    Returns:
+        response (dict): response in the format returned by Baidu Analytics
+    """
+    rng = random.Random(seed)
+    dimension_items = [[{'name': 'District {i}'.format(i=i), 'area': 'china,province{j}'.format(j=i % 34)}]
+                       for i in range(num_rows)]
+    metric_items = []
+    for i in range(num_rows):
+        metric_items.append([rng.randrange(0, 10000),
+                             rng.randrange(0, 5000),
+                             rng.randrange(0, 5000),
+                             '--' if i % 17 == 0 else round(rng.random() * 100, 2),
+                             '--' if i % 13 == 0 else rng.randrange(0, 600)])
+    response = {'header': {'status': 0, 'desc': 'success', 'failures': []},
+                'body': {'data': [{'result': {'total': num_rows,
+                                              'fields': ['visit_district_title'] + BAIDUMETRICS,
+                                              'items': [dimension_items, metric_items, [], []]}}]}}
+    return response
@@ -0,0 +1,296 @@
+#!/usr/bin/python
+
+"""Benchmark the response decoding and transform hot paths
+
+Times the following on synthetic data (see SyntheticData.py) of 10k, 100k and 1M rows:
+    1) GoogleAnalytics.api_response_to_dataframe_v4
+    2) BaiduAnalytics.api_response_to_pandas (untyped and with the schema of its report method)
+    3) DailySiteContent.transform
+    4) update_column_names
+    5) the FeatureExtractors functions
+
+No API is called: the GoogleAnalytics, BaiduAnalytics and DailySiteContent objects are created without
+running their constructors. The results are saved as JSON. With --compare, the results are compared with a
+previous results file and every benchmark that got slower than the threshold is flagged as a regression
+(the exit code is 1 if there is any).
+
+Example:
+    python -m benchmarks --output benchmarks/results/baseline.json
+    (make a change)
+    python -m benchmarks --output benchmarks/results/change.json --compare benchmarks/results/baseline.json --threshold 0.1
+
+"""
+
+from benchmarks.SyntheticData import get_ga_v4_response, get_baidu_response, get_sitecontent_rows, \
+    SITECONTENTMETRICS
+from webanalytics.googleanalytics.GoogleApi import GoogleAnalytics
+from webanalytics.baiduanalytics.BaiduApi import BaiduAnalytics
+from webanalytics.googleanalytics.examples.sitecontent import DailySiteContent
+from webanalytics.googleanalytics.examples.tools.GoogleAnalyticsColumnRenamer import update_column_names, COLUMNMAPPER
+from webanalytics.googleanalytics.examples.tools.FeatureExtractors import get_page_path_levels, \
+    extract_page_path_level_n, extract_source_medium
+from common.util.Logging import check_logger
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+
+DEFAULTSIZES = [10000, 100000, 1000000]
+DEFAULTREPEAT = 3
+DEFAULTTHRESHOLD = 0.1  # 10% slower is a regression
+
+
+def get_ga_api():
+    """ Create a GoogleAnalytics object without services (no credentials or network needed) """
+    ga_api = GoogleAnalytics.__new__(GoogleAnalytics)
+    ga_api.logging_obj = check_logger(None)
+    ga_api.profile_id = '0'
+    return ga_api
+
+
+def get_baidu_api():
+    """ Create a BaiduAnalytics object without credentials """
+    return BaiduAnalytics(site_id='0', username=None, password=None, token=None, logger=check_logger(None))
+
+
+def setup_ga_decode_v4(num_rows):
+    return get_ga_api(), get_ga_v4_response(num_rows)
+
+
+def run_ga_decode_v4(state):
+    (ga_api, response) = state
+    ga_api.api_response_to_dataframe_v4(response)
+
+
+def setup_baidu_decode(num_rows):
+    return get_baidu_api(), get_baidu_response(num_rows)
+
+
+def run_baidu_decode(state):
+    (baidu_api, response) = state
+    baidu_api.api_response_to_pandas(response)
+
+
+def run_baidu_decode_typed(state):
+    (baidu_api, response) = state
+    baidu_api.api_response_to_pandas(response, report_method='visit/district/a')
+
+
+def setup_sitecontent_transform(num_rows):
+    response_df = get_ga_api().api_response_to_dataframe_v4(get_ga_v4_response(num_rows, metrics=SITECONTENTMETRICS))
+    export = DailySiteContent.__new__(DailySiteContent)
+    export.logger = check_logger(None)
+    export.ga_view_id = 0
+    return export, response_df
+
+
+def run_sitecontent_transform(state):
+    (export, response_df) = state
+    # transform renames the columns of its input, so it gets its own (shallow) copy
+    export.transform(response_df.copy(deep=False))
+
+
+def setup_update_column_names(num_rows):
+    ga_column_names = list(COLUMNMAPPER)
+    return [ga_column_names[i % len(ga_column_names)] for i in range(num_rows)]
+
+
+def run_update_column_names(ga_column_list):
+    update_column_names(ga_column_list)
+
+
+def setup_page_path_levels(num_rows):
+    return [row[5] for row in get_sitecontent_rows(num_rows)]
+
+
+def run_page_path_levels(page_paths):
+    for page_path in page_paths:
+        page_path_levels_list = get_page_path_levels(page_path)
+        extract_page_path_level_n(page_path_levels_list, 1)
+        extract_page_path_level_n(page_path_levels_list, 2)
+
+
+def setup_source_medium(num_rows):
+    return [row[1] for row in get_sitecontent_rows(num_rows)]
+
+
+def run_source_medium(source_mediums):
+    for source_medium in source_mediums:
+        extract_source_medium(source_medium)
+
+
+# name: (setup function that builds the input for a number of rows, function that is timed)
+BENCHMARKS = {'ga_decode_v4': (setup_ga_decode_v4, run_ga_decode_v4),
+              'baidu_decode': (setup_baidu_decode, run_baidu_decode),
+              'baidu_decode_typed': (setup_baidu_decode, run_baidu_decode_typed),
+              'sitecontent_transform': (setup_sitecontent_transform, run_sitecontent_transform),
+              'update_column_names': (setup_update_column_names, run_update_column_names),
+              'feature_extractors_page_path_levels': (setup_page_path_levels, run_page_path_levels),
+              'feature_extractors_source_medium': (setup_source_medium, run_source_medium)}
+
+
+def time_benchmark(name, num_rows, repeat):
+    """ Time one benchmark for one number of rows
+
+    Args:
+        name (str): name of the benchmark in BENCHMARKS
+        num_rows (int): number of rows of the synthetic data
+        repeat (int): number of timed runs
+
+    Returns:
+        result (dict): min, median and all run times in seconds and the median rows per second
+    """
+    (setup_fn, run_fn) = BENCHMARKS[name]
+    state = setup_fn(num_rows)
+    run_seconds = []
+    for i in range(repeat):
+        gc.collect()
+        start_time = time.perf_counter()
+        run_fn(state)
+        run_seconds.append(time.perf_counter() - start_time)
+    median_seconds = statistics.median(run_seconds)
+    result = {'min_seconds': min(run_seconds),
+              'median_seconds': median_seconds,
+              'run_seconds': run_seconds,
+              'rows_per_second': num_rows / median_seconds if median_seconds > 0 else None}
+    return result
+
+
+def get_environment():
+    """ Describe the environment the benchmarks ran in, so results of different machines are not mixed up """
+    try:
+        git_commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                             cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        git_commit = None
+    environment = {'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'git_commit': git_commit,
+                   'python': platform.python_version(),
+                   'pandas': pd.__version__,
+                   'numpy': np.__version__,
+                   'platform': platform.platform(),
+                   'processor': platform.processor()}
+    return environment
+
+
+def run_benchmarks(names, sizes, repeat):
+    """ Run benchmarks
+
+    Args:
+        names (list of str): names of the benchmarks to run
+        sizes (list of int): numbers of rows to run each benchmark with
+        repeat (int): number of timed runs of each benchmark and size
+
+    Returns:
+        results_dict (dict): environment and results keyed by benchmark name and then by number of rows
+    """
+    results_dict = {'environment': get_environment(), 'repeat': repeat, 'results': dict()}
+    for name in names:
+        results_dict['results'][name] = dict()
+        for num_rows in sizes:
+            result = time_benchmark(name, num_rows, repeat)
+            results_dict['results'][name][str(num_rows)] = result
+            print("{name:<40} {num_rows:>9} rows  median={median:9.4f}s  min={min:9.4f}s".format(
+                name=name,
+                num_rows=num_rows,
+                median=result['median_seconds'],
+                min=result['min_seconds']))
+    return results_dict
+
+
+def compare_results(results_dict, baseline_dict, threshold):
+    """ Compare results with baseline results
+
+    Benchmarks are compared on their median run time.
+
+    Args:
+        results_dict (dict): results of run_benchmarks
+        baseline_dict (dict): earlier results of run_benchmarks
+        threshold (float): relative slowdown above which a benchmark is a regression (0.1 = 10% slower)
+
+    Returns:
+        regressions (list of tuples): (name, number of rows, ratio of the median times) of each regression
+    """
+    regressions = []
+    print("\n{name:<40} {num_rows:>9}  {baseline:>10}  {current:>10}  {ratio:>7}".format(
+        name='benchmark', num_rows='rows', baseline='baseline', current='current', ratio='ratio'))
+    for name, size_results in results_dict['results'].items():
+        for num_rows, result in size_results.items():
+            baseline_result = baseline_dict.get('results', {}).get(name, {}).get(num_rows)
+            if baseline_result is None:
+                continue
+            ratio = result['median_seconds'] / baseline_result['median_seconds']
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = 'REGRESSION'
+                regressions.append((name, int(num_rows), ratio))
+            elif ratio < 1 / (1 + threshold):
+                flag = 'faster'
+            print("{name:<40} {num_rows:>9}  {baseline:>9.4f}s  {current:>9.4f}s  {ratio:>6.2f}x  {flag}".format(
+                name=name,
+                num_rows=num_rows,
+                baseline=baseline_result['median_seconds'],
+                current=result['median_seconds'],
+                ratio=ratio,
+                flag=flag))
+    return regressions
+
+
+def main(argv):
+    """ Main method
+
+    Args:
+        argv: command line arguments (see --help)
+
+    Returns:
+        exit_code (int): 1 if a regression was found and 0 otherwise
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the response decoding and transform hot paths')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULTSIZES),
+                        help='comma-separated numbers of rows (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=DEFAULTREPEAT,
+                        help='timed runs per benchmark and size (default: %(default)s)')
+    parser.add_argument('--only', default=None,
+                        help='comma-separated names of the benchmarks to run (default: all of {names})'.format(
+                            names=', '.join(BENCHMARKS)))
+    parser.add_argument('--output', default=None, help='path of the JSON file to save the results to')
+    parser.add_argument('--compare', default=None, help='path of a JSON results file to compare with')
+    parser.add_argument('--threshold', type=float, default=DEFAULTTHRESHOLD,
+                        help='relative slowdown flagged as a regression (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown_names = [name for name in names if name not in BENCHMARKS]
+    if unknown_names:
+        parser.error('unknown benchmarks: {names}'.format(names=', '.join(unknown_names)))
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    results_dict = run_benchmarks(names, sizes, args.repeat)
+    if args.output is not None:
+        output_dir = os.path.dirname(os.path.abspath(args.output))
+        os.makedirs(output_dir, exist_ok=True)
+        with open(args.output, 'w') as output_file:
+            json.dump(results_dict, output_file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline_dict = json.load(baseline_file)
+        regressions = compare_results(results_dict, baseline_dict, args.threshold)
+        if regressions:
+            print("\n{num} regression(s) beyond {threshold:.0%}".format(num=len(regressions),
+                                                                        threshold=args.threshold))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
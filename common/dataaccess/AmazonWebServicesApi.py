@@ -8,14 +8,23 @@ from common.util.Logging import Logging
 from common.util.OSHelpers import get_log_filepath
 from common.util.ListMethods import is_in
 from common.util.DateTimeMethods import get_curr_datetime_str
+from common.dataaccess.S3TransferProfiles import S3TransferProfiles, MINPARTSIZE, DEFAULTPARTSIZE
 
 import boto3
 import logging
 import io
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import gzip
-from boto3.s3.transfer import TransferConfig
+from concurrent.futures import ThreadPoolExecutor
+import os
 import re
+import time
+
+
+# Transfer settings and measured throughput shared by all S3Bucket objects in the process
+_TRANSFER_PROFILES = S3TransferProfiles()
 
 
 class AwsInitializer:
@@ -120,6 +129,234 @@ class S3(AwsInitializer):
         return out
 
 
+class S3ObjectReader(io.RawIOBase):
+    """Seekable read-only file object over a S3 object that fetches the bytes it reads with ranged GETs
+
+    Parquet readers (e.g. pyarrow.parquet.read_table) read the footer first and then only the column chunks of
+    the columns and row groups they need, so reading a few columns of a large file only downloads those bytes.
+    """
+
+    def __init__(self, client, bucket_name, key, size=None):
+        """ Create a DataAccess.AmazonWebServicesApi.S3ObjectReader object
+
+        Args:
+            client (botocore.client.S3): S3 client
+            bucket_name (str): name of the bucket
+            key (str): key of the object
+            size (int): size of the object in bytes (defaults to the ContentLength of a HEAD request)
+
+        Example:
+            reader = S3ObjectReader(s3_bucket_obj.client, 'usanapa', 'google_analytics/daily_site_content/View=1/data.parquet')
+            table = pyarrow.parquet.read_table(reader, columns=['PagePath', 'Pageviews'])
+        """
+        super().__init__()
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        if size is None:
+            size = client.head_object(Bucket=bucket_name, Key=key)['ContentLength']
+        self.size = size
+        self.position = 0
+        self.block_start = 0
+        self.block = b''  # bytes of the last GET, so small reads inside it do not send another request
+        self.num_requests = 0
+        self.num_bytes = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position = self.position + offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError("Invalid whence ({whence})".format(whence=whence))
+        return self.position
+
+    def read(self, size=-1):
+        """ Read bytes from the current position
+
+        Args:
+            size (int): number of bytes to read (all bytes up to the end of the object if negative)
+
+        Returns:
+            data (bytes): bytes read (fewer than size at the end of the object)
+        """
+        end = self.size if size is None or size < 0 else min(self.size, self.position + size)
+        if end <= self.position:
+            return b''
+        block_end = self.block_start + len(self.block)
+        if self.block_start <= self.position and end <= block_end:
+            data = self.block[self.position - self.block_start:end - self.block_start]
+        else:
+            obj = self.client.get_object(Bucket=self.bucket_name, Key=self.key,
+                                         Range='bytes={start}-{end}'.format(start=self.position, end=end - 1))
+            data = obj['Body'].read()
+            self.num_requests = self.num_requests + 1
+            self.num_bytes = self.num_bytes + len(data)
+            (self.block_start, self.block) = (self.position, data)
+        self.position = self.position + len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class S3ObjectWriter(io.RawIOBase):
+    """Write-only file object that streams its bytes into a S3 object with a multipart upload
+
+    Bytes are buffered until a part is full and the full parts are uploaded in the background, so at most
+    (max_concurrency + 1) parts are held in memory no matter how large the object is. An object smaller than one
+    part is uploaded with a single PUT when the writer is closed. Nothing is written to the local disk.
+    """
+
+    def __init__(self, client, bucket_name, key, part_size=DEFAULTPARTSIZE, max_concurrency=4, extra_args_dict=None):
+        """ Create a DataAccess.AmazonWebServicesApi.S3ObjectWriter object
+
+        Args:
+            client (botocore.client.S3): S3 client
+            bucket_name (str): name of the bucket
+            key (str): key of the object
+            part_size (int): size of each part in bytes (raised to 5 MB if smaller)
+            max_concurrency (int): maximum number of parts uploaded at the same time
+            extra_args_dict (dict): extra arguments of the upload, e.g. {'ContentType': 'application/octet-stream'}
+
+        Example:
+            with S3ObjectWriter(s3_bucket_obj.client, 'usanapa', 'google_analytics/data.parquet') as writer:
+                pyarrow.parquet.write_table(table, writer)
+        """
+        super().__init__()
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = max(part_size, MINPARTSIZE)
+        self.max_concurrency = max_concurrency
+        self.extra_args_dict = dict(extra_args_dict or {})
+        self.buffer = bytearray()
+        self.num_bytes = 0
+        self.upload_id = None
+        self.executor = None
+        self.part_futures = []
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.num_bytes
+
+    def write(self, data):
+        """ Write bytes to the object
+
+        Args:
+            data (bytes-like): bytes to write
+
+        Returns:
+            num_bytes (int): number of bytes written
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed S3ObjectWriter")
+        self.buffer.extend(data)
+        num_bytes = len(memoryview(data).cast('B'))
+        self.num_bytes = self.num_bytes + num_bytes
+        while len(self.buffer) >= self.part_size:
+            part = bytes(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+            self.upload_part(part)
+        return num_bytes
+
+    def upload_part(self, part):
+        """ Upload a part in the background (starting the multipart upload on the first part)
+
+        Args:
+            part (bytes): bytes of the part
+
+        Returns:
+
+        """
+        if self.upload_id is None:
+            response = self.client.create_multipart_upload(Bucket=self.bucket_name, Key=self.key,
+                                                           **self.extra_args_dict)
+            self.upload_id = response['UploadId']
+            self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        # wait for the oldest part so the parts held in memory stay bounded
+        pending_futures = [future for future in self.part_futures if not future.done()]
+        if len(pending_futures) >= self.max_concurrency:
+            pending_futures[0].result()
+        part_number = len(self.part_futures) + 1
+        self.part_futures.append(self.executor.submit(self.client.upload_part,
+                                                      Bucket=self.bucket_name,
+                                                      Key=self.key,
+                                                      UploadId=self.upload_id,
+                                                      PartNumber=part_number,
+                                                      Body=part))
+
+    def close(self):
+        """ Upload the remaining bytes and complete the upload (aborting it if a part failed)
+
+        Returns:
+
+        """
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                self.client.put_object(Bucket=self.bucket_name, Key=self.key, Body=bytes(self.buffer),
+                                       **self.extra_args_dict)
+            else:
+                if self.buffer:
+                    self.upload_part(bytes(self.buffer))
+                parts = [{'ETag': future.result()['ETag'], 'PartNumber': part_number}
+                         for part_number, future in enumerate(self.part_futures, start=1)]
+                self.client.complete_multipart_upload(Bucket=self.bucket_name, Key=self.key,
+                                                      UploadId=self.upload_id,
+                                                      MultipartUpload={'Parts': parts})
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self.buffer = bytearray()
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+            super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # do not complete an object whose writing failed
+            try:
+                self.abort()
+            finally:
+                self.buffer = bytearray()
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                super().close()
+            return False
+        self.close()
+        return False
+
+    def abort(self):
+        """ Abort the multipart upload (if it was started) so S3 does not keep its parts
+
+        Returns:
+
+        """
+        if self.upload_id is not None:
+            for future in self.part_futures:
+                future.cancel()
+            self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id)
+            self.upload_id = None
+
+
 class S3Bucket(S3):
     """Interact with an AWS S3 bucket
 
@@ -129,8 +366,11 @@ class S3Bucket(S3):
     https://gist.github.com/uhho/a1490ae2abd112b556dcd539750aa151
     """
 
+    MAXDOWNLOADWORKERS = 10  # botocore keeps at most 10 connections per client by default
+    PARQUETROWGROUPSIZE = 100000  # rows converted to Arrow and written at a time by pandas_to_s3_parquet
+
     def __init__(self, bucket_name, creds_profile_name='default', region_name='us-east-1', logging_obj=None,
-                 create_datetime=None):
+                 create_datetime=None, transfer_profiles=None):
         """ Create a DataAccess.AmazonWebServicesApi.S3Bucket object
 
         Args:
@@ -139,6 +379,8 @@ class S3Bucket(S3):
             region_name (str): name of the AWS region
             logging_obj (common.Util.Logging.Logging): logger
             create_datetime (str): creation datetime stamp to use in S3 keys for uploading new objects
+            transfer_profiles (common.dataaccess.S3TransferProfiles.S3TransferProfiles): picks the multipart settings
+                of uploads (defaults to the S3TransferProfiles shared by all S3Bucket objects in the process)
 
         Example:
             from DataAccess.AmazonWebServicesApi import S3Bucket
@@ -150,6 +392,7 @@ class S3Bucket(S3):
         if create_datetime is None:
             create_datetime = get_curr_datetime_str()
         self.create_datetime = create_datetime
+        self.transfer_profiles = transfer_profiles if transfer_profiles is not None else _TRANSFER_PROFILES
 
     def get_bucket_policy(self):
         return self.client.get_bucket_policy(Bucket=self.bucket_name)
@@ -161,6 +404,8 @@ class S3Bucket(S3):
         """ Uploads a file to S3
 
         This method can be used for uploading very large files as it makes use of parallel processing on multiple threads.
+        The multipart threshold, part size and concurrency are picked by the bucket's transfer profiles from the size
+        of the file and the throughput of earlier uploads to the bucket. The throughput of the upload is logged.
 
         Args:
             full_file_path: (str)
@@ -168,41 +413,124 @@ class S3Bucket(S3):
             extra_args_dict: (dict)
 
         Returns:
-            None
+            transfer: (dict) size, duration, MB per second and multipart settings of the upload
 
         Example:
             from DataAccess.AmazonWebServicesApi import S3Bucket
             s3_bucket_obj = S3Bucket('usanapa', 'default')
             s3_bucket_obj.upload_file("data-files/myfile.json", "google_analytics/usana.com/daily_regional_summary/2018-01-05/2019-01-21 05:30", {'ACL': 'public-read', 'ContentType': 'text/json'})
         """
-        config = TransferConfig(multipart_threshold=1024 * 25, max_concurrency=10,
-                                multipart_chunksize=1024 * 25, use_threads=True)
+        num_bytes = os.path.getsize(full_file_path)
+        profile = self.transfer_profiles.get_profile(self.bucket_name, num_bytes)
+        start_time = time.perf_counter()
         self.resource.meta.client.upload_file(full_file_path, self.bucket_name, key,
                                               ExtraArgs=extra_args_dict,
-                                              Config=config)
+                                              Config=profile.to_transfer_config())
+        transfer = self.record_transfer(key, num_bytes, time.perf_counter() - start_time, profile)
+        return transfer
+
+    def record_transfer(self, key, num_bytes, seconds, profile, learn=True):
+        """ Report the throughput of an upload and let the transfer profiles learn from it
 
-    def s3_to_pandas_parquet(self, key, **args):
+        Args:
+            key: (str) key of the uploaded object
+            num_bytes: (int) size of the object in bytes
+            seconds: (float) duration of the upload
+            profile: (common.dataaccess.S3TransferProfiles.TransferProfile) multipart settings of the upload
+            learn: (bool) whether the transfer profiles learn the bucket's throughput from the upload
+
+        Returns:
+            transfer: (dict) size, duration, MB per second and multipart settings of the upload
+        """
+        mb_per_second = self.transfer_profiles.record_transfer(self.bucket_name, num_bytes, seconds, profile, learn)
+        transfer = dict(profile.to_dict(), key=key, num_bytes=num_bytes, seconds=seconds, mb_per_second=mb_per_second)
+        self.logging_obj.log(self.logging_obj.INFO,
+                             """method='common.dataaccess.AmazonWebServicesApi.S3Bucket.record_transfer'
+                             message='Uploaded object'
+                             bucket='{bucket_name}'
+                             key='{key}'
+                             num_bytes='{num_bytes}'
+                             seconds='{seconds:.3f}'
+                             mb_per_second='{mb_per_second}'
+                             multipart_chunksize='{multipart_chunksize}'
+                             max_concurrency='{max_concurrency}'
+                             """.format(bucket_name=self.bucket_name,
+                                        key=key,
+                                        num_bytes=num_bytes,
+                                        seconds=seconds,
+                                        mb_per_second=None if mb_per_second is None else round(mb_per_second, 2),
+                                        multipart_chunksize=profile.multipart_chunksize,
+                                        max_concurrency=profile.max_concurrency))
+        return transfer
+
+    def s3_to_pandas_parquet(self, key, columns=None, filters=None, **args):
         """ Read a S3 Parquet file to a Pandas DataFrame
 
+        If columns or filters are given, only the footer and the column chunks of the needed columns and row groups
+        are downloaded (see s3_to_arrow_table).
+
         Args:
             key (str):
+            columns (list of str): names of the columns to read (defaults to all columns)
+            filters (list of tuples): pyarrow filters on the rows to read, e.g. [('PagePath', '>=', '/shop')]
+                Row groups whose statistics show that no row matches are not downloaded.
 
         Returns:
             df (pandas.DataFrame):
 
         """
+        if columns is not None or filters is not None:
+            (table, num_bytes) = self.s3_to_arrow_table(key, columns, filters)
+            return table.to_pandas()
         obj = self.client.get_object(Bucket=self.bucket_name, Key=key)
         df = pd.read_parquet(io.BytesIO(obj['Body'].read()), **args)
         return df
 
-    def s3_to_pandas_parquets(self, objects_path):
+    def s3_to_arrow_table(self, key, columns=None, filters=None):
+        """ Read a S3 Parquet file to an Arrow table
+
+        Without columns and filters the whole file is downloaded with one GET. Otherwise the file is read through
+        a S3ObjectReader: the footer is fetched with a ranged GET and then only the column chunks of the needed
+        columns in the row groups that can match the filters.
+
+        Args:
+            key (str): key of the Parquet file
+            columns (list of str): names of the columns to read (defaults to all columns)
+            filters (list of tuples): pyarrow filters on the rows to read, e.g. a PagePath prefix:
+                [('PagePath', '>=', '/shop/'), ('PagePath', '<', '/shop0')]
+
+        Returns:
+            table (pyarrow.Table): data of the file
+            num_bytes (int): number of bytes downloaded
+
+        """
+        if columns is not None or filters is not None:
+            reader = S3ObjectReader(self.client, self.bucket_name, key)
+            table = pq.read_table(reader, columns=columns, filters=filters)
+            return table, reader.num_bytes
+        obj = self.client.get_object(Bucket=self.bucket_name, Key=key)
+        body = obj['Body'].read()
+        # the table's buffers are decoded from the downloaded bytes without copying them into a file object first
+        table = pq.read_table(pa.BufferReader(body), columns=columns)
+        return table, len(body)
+
+    def s3_to_pandas_parquets(self, objects_path, columns=None, filters=None, max_workers=MAXDOWNLOADWORKERS):
         """ Read multiple Parquet files under a specified path in S3
 
+        The files are downloaded and decoded into Arrow tables concurrently on a pool of max_workers threads.
+        The tables are concatenated without copying their data (columns that differ in type between files are
+        promoted to a common type) and converted to pandas once.
+        Like pd.concat(..., ignore_index=True), the indexes stored in the files are dropped and the result gets
+        a new RangeIndex.
+
         Args:
             objects_path (str): path to objects in S3
+            columns (list of str): names of the columns to read (defaults to all columns)
+            filters (list of tuples): pyarrow filters on the rows to read (see s3_to_arrow_table)
+            max_workers (int): maximum number of files downloaded at the same time
 
         Returns:
-            df (pandas.DataFrame): result set
+            df (pandas.DataFrame): result set (empty if there are no files)
 
         """
         if not objects_path.endswith('/'):
@@ -211,10 +539,50 @@ class S3Bucket(S3):
         if not key_list:
             self.logging_obj.log(self.logging_obj.WARN, "message='No files found in {bucket_name}/{prefix}'".format(bucket_name=self.bucket_name,
                                                                                                                     prefix=objects_path))
-        dfs = [self.s3_to_pandas_parquet(key) for key in key_list]
-        df = pd.concat(dfs, ignore_index=True)
+            return pd.DataFrame()
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(key_list)))) as executor:
+            results = list(executor.map(lambda key: self.s3_to_arrow_table(key, columns, filters), key_list))
+        tables = [self.drop_index_columns(table) for (table, num_bytes) in results]
+        try:
+            table = pa.concat_tables(tables, promote_options='permissive')
+        except TypeError:
+            # pyarrow < 14
+            table = pa.concat_tables(tables, promote=True)
+        df = table.to_pandas().reset_index(drop=True)
+        seconds = time.perf_counter() - start_time
+        num_bytes = sum(num_bytes for (table, num_bytes) in results)
+        self.logging_obj.log(self.logging_obj.INFO,
+                             """method='common.dataaccess.AmazonWebServicesApi.S3Bucket.s3_to_pandas_parquets'
+                             message='Read Parquet files'
+                             prefix='{prefix}'
+                             num_files='{num_files}'
+                             num_rows='{num_rows}'
+                             num_bytes='{num_bytes}'
+                             seconds='{seconds:.3f}'
+                             """.format(prefix=objects_path,
+                                        num_files=len(key_list),
+                                        num_rows=df.shape[0],
+                                        num_bytes=num_bytes,
+                                        seconds=seconds))
         return df
 
+    def drop_index_columns(self, table):
+        """ Drop the columns in which pandas stored the index of a DataFrame written to Parquet
+
+        Args:
+            table (pyarrow.Table): table read from a Parquet file
+
+        Returns:
+            table (pyarrow.Table): table without the index columns listed in its pandas metadata
+        """
+        pandas_metadata = table.schema.pandas_metadata or {}
+        index_column_names = [name for name in pandas_metadata.get('index_columns', [])
+                              if isinstance(name, str) and name in table.column_names]
+        if index_column_names:
+            table = table.drop_columns(index_column_names)
+        return table
+
     def pandas_to_s3(self, df, key):
         """ Put Pandas DataFrame into S3 bucket
 
@@ -243,22 +611,45 @@ class S3Bucket(S3):
         obj = self.client.put_object(Bucket=self.bucket_name, Key=key, Body=gz_buffer.getvalue())
         return obj
 
-    def pandas_to_s3_parquet(self, df, key, flat_file_path='data-files/mydata.parq'):
+    def pandas_to_s3_parquet(self, df, key, flat_file_path=None, row_group_size=PARQUETROWGROUPSIZE):
         """ Put Pandas DataFrame into S3 bucket in Parquet format
 
+        By default the DataFrame is converted to Arrow and written one row group at a time straight into
+        a S3ObjectWriter, so no local file is needed, memory stays bounded and concurrent calls are independent.
+
         Args:
             df: (pandas.DataFrame) data to put into S3 bucket
             key: (str) key or path to data in S3
-            flat_file_path: path to the location of the Parquet file to be created
+            flat_file_path: path to a local Parquet file to write first and then upload (if given)
+            row_group_size: (int) number of rows in each row group
 
         Returns:
+            transfer: (dict) size, duration, MB per second and multipart settings of the upload
 
         """
-        # put DF in a flat file of the format Parquet
-        df.to_parquet(flat_file_path)
-
-        # write stream to S3
-        self.upload_file(flat_file_path, key)
+        if flat_file_path is not None:
+            # put DF in a flat file of the format Parquet
+            df.to_parquet(flat_file_path)
+            # write stream to S3
+            return self.upload_file(flat_file_path, key)
+
+        # the deep in-memory size (string contents included) is practically always larger than the compressed
+        # Parquet size, so the parts are large enough for the 10,000 parts limit
+        profile = self.transfer_profiles.get_profile(self.bucket_name,
+                                                     int(df.memory_usage(index=False, deep=True).sum()))
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        start_time = time.perf_counter()
+        with S3ObjectWriter(self.client, self.bucket_name, key, part_size=profile.multipart_chunksize,
+                            max_concurrency=profile.max_concurrency) as s3_object_writer:
+            with pq.ParquetWriter(s3_object_writer, schema) as parquet_writer:
+                for start_row in range(0, max(df.shape[0], 1), row_group_size):
+                    table = pa.Table.from_pandas(df.iloc[start_row:start_row + row_group_size], schema=schema,
+                                                 preserve_index=False)
+                    parquet_writer.write_table(table)
+        # the duration includes the conversion to Parquet, so it is reported but not learned from
+        transfer = self.record_transfer(key, s3_object_writer.num_bytes, time.perf_counter() - start_time, profile,
+                                        learn=False)
+        return transfer
 
     def s3_to_pandas(self, key):
         """ Get data as a Pandas DataFrame from S3
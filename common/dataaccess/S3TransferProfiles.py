@@ -0,0 +1,182 @@
+#!/usr/bin/python
+
+"""Pick S3 multipart transfer settings from object size and measured throughput
+
+Contains classes used for choosing the multipart threshold, part (chunk) size and concurrency of S3 uploads:
+    1) TransferProfile: the settings of one transfer (convertible to a boto3 TransferConfig)
+    2) S3TransferProfiles: picks a TransferProfile for a bucket and object size, learns each bucket's throughput
+       per connection from finished transfers and applies per-bucket overrides
+
+Without measurements, parts are DEFAULTPARTSIZE. Once a bucket has measured transfers, parts are sized so that
+one part takes about TARGETPARTSECONDS on one connection. Parts are made smaller for objects that would otherwise
+not keep every connection busy. Parts are always at least 5 MB (the S3 minimum for every part but the last) and
+large enough that an object has at most 10,000 parts.
+
+Multipart upload limits: https://docs.aws.amazon.com/AmazonS3/latest/userguide/qfacts.html
+
+"""
+
+from boto3.s3.transfer import TransferConfig
+import math
+import threading
+
+
+MB = 1024 * 1024
+MINPARTSIZE = 5 * MB
+MAXPARTSIZE = 5 * 1024 * MB
+MAXPARTS = 10000
+DEFAULTPARTSIZE = 8 * MB
+DEFAULTMAXCONCURRENCY = 10
+TARGETPARTSECONDS = 2  # measured throughput sizes parts to take about this long on one connection
+THROUGHPUTSMOOTHING = 0.3  # weight of the latest transfer in the moving average of the throughput
+
+
+class TransferProfile:
+    """Multipart settings of one S3 transfer"""
+
+    def __init__(self, multipart_threshold, multipart_chunksize, max_concurrency):
+        """ Create a common.dataaccess.S3TransferProfiles.TransferProfile object
+
+        Args:
+            multipart_threshold: (int) size in bytes from which objects are uploaded in parts
+            multipart_chunksize: (int) size of each part in bytes
+            max_concurrency: (int) maximum number of parts transferred at the same time
+        """
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.max_concurrency = max_concurrency
+
+    def to_transfer_config(self):
+        """ Get the boto3 TransferConfig of the profile
+
+        Returns:
+            config: (boto3.s3.transfer.TransferConfig) transfer configuration
+        """
+        config = TransferConfig(multipart_threshold=self.multipart_threshold,
+                                multipart_chunksize=self.multipart_chunksize,
+                                max_concurrency=self.max_concurrency,
+                                use_threads=True)
+        return config
+
+    def to_dict(self):
+        return {'multipart_threshold': self.multipart_threshold,
+                'multipart_chunksize': self.multipart_chunksize,
+                'max_concurrency': self.max_concurrency}
+
+
+class S3TransferProfiles:
+    """Pick TransferProfiles per bucket and object size and learn the throughput of each bucket"""
+
+    def __init__(self, max_concurrency=DEFAULTMAXCONCURRENCY, target_part_seconds=TARGETPARTSECONDS):
+        """ Create a common.dataaccess.S3TransferProfiles.S3TransferProfiles object
+
+        Args:
+            max_concurrency: (int) maximum number of parts transferred at the same time
+            target_part_seconds: (float) seconds one part should take on one connection once throughput is measured
+
+        Example:
+            transfer_profiles = S3TransferProfiles()
+            transfer_profiles.set_bucket_override('mybucket', multipart_chunksize=64 * 1024 * 1024)
+            profile = transfer_profiles.get_profile('mybucket', 2 * 1024 ** 3)
+        """
+        self.max_concurrency = max_concurrency
+        self.target_part_seconds = target_part_seconds
+        self.lock = threading.Lock()
+        self.bucket_overrides = dict()
+        self.connection_bytes_per_second = dict()  # moving average of the throughput of one connection per bucket
+
+    def set_bucket_override(self, bucket_name, multipart_threshold=None, multipart_chunksize=None,
+                            max_concurrency=None):
+        """ Fix some settings of the transfers of a bucket (settings that are None are still picked automatically)
+
+        Args:
+            bucket_name: (str) name of the bucket
+            multipart_threshold: (int) size in bytes from which objects are uploaded in parts
+            multipart_chunksize: (int) size of each part in bytes (raised to 5 MB if smaller)
+            max_concurrency: (int) maximum number of parts transferred at the same time
+
+        Returns:
+
+        """
+        override = {'multipart_threshold': multipart_threshold,
+                    'multipart_chunksize': multipart_chunksize,
+                    'max_concurrency': max_concurrency}
+        with self.lock:
+            self.bucket_overrides[bucket_name] = {name: value for (name, value) in override.items()
+                                                  if value is not None}
+
+    def get_throughput(self, bucket_name):
+        """ Get the measured throughput of one connection to a bucket
+
+        Args:
+            bucket_name: (str) name of the bucket
+
+        Returns:
+            bytes_per_second: (float) moving average of the bytes per second of one connection (None if unmeasured)
+        """
+        with self.lock:
+            return self.connection_bytes_per_second.get(bucket_name)
+
+    def get_profile(self, bucket_name, object_size=None):
+        """ Pick the settings of a transfer
+
+        Args:
+            bucket_name: (str) name of the bucket
+            object_size: (int) size of the object in bytes (if known)
+
+        Returns:
+            profile: (TransferProfile) settings of the transfer
+        """
+        with self.lock:
+            override = dict(self.bucket_overrides.get(bucket_name, {}))
+            connection_bytes_per_second = self.connection_bytes_per_second.get(bucket_name)
+
+        part_size = override.get('multipart_chunksize')
+        if part_size is None:
+            if connection_bytes_per_second is None:
+                part_size = DEFAULTPARTSIZE
+            else:
+                part_size = int(connection_bytes_per_second * self.target_part_seconds)
+            if object_size is not None:
+                # small enough to keep every connection busy, large enough for the 10,000 parts limit
+                part_size = min(part_size, math.ceil(object_size / override.get('max_concurrency',
+                                                                               self.max_concurrency)))
+                part_size = max(part_size, math.ceil(object_size / MAXPARTS))
+            part_size = int(math.ceil(part_size / MB) * MB)  # whole MBs
+        part_size = min(max(part_size, MINPARTSIZE), MAXPARTSIZE)
+
+        max_concurrency = override.get('max_concurrency', self.max_concurrency)
+        if object_size is not None:
+            max_concurrency = max(1, min(max_concurrency, math.ceil(object_size / part_size)))
+
+        # objects smaller than one part are uploaded with a single request
+        multipart_threshold = max(override.get('multipart_threshold', part_size), MINPARTSIZE)
+        profile = TransferProfile(multipart_threshold, part_size, max_concurrency)
+        return profile
+
+    def record_transfer(self, bucket_name, num_bytes, seconds, profile, learn=True):
+        """ Measure the throughput of a finished transfer and learn from it
+
+        Args:
+            bucket_name: (str) name of the bucket
+            num_bytes: (int) size of the transferred object in bytes
+            seconds: (float) duration of the transfer
+            profile: (TransferProfile) settings the transfer used
+            learn: (bool) whether to update the bucket's throughput (False if seconds includes more than the transfer)
+
+        Returns:
+            mb_per_second: (float) throughput of the transfer in MB per second (None if it took no measurable time)
+        """
+        if seconds <= 0:
+            return None
+        bytes_per_second = num_bytes / seconds
+        # objects below the threshold (and the short tail of small objects) do not tell much about the throughput
+        if learn and num_bytes >= profile.multipart_threshold:
+            num_connections = max(1, min(profile.max_concurrency, math.ceil(num_bytes / profile.multipart_chunksize)))
+            with self.lock:
+                previous = self.connection_bytes_per_second.get(bucket_name)
+                latest = bytes_per_second / num_connections
+                self.connection_bytes_per_second[bucket_name] = latest if previous is None else \
+                    THROUGHPUTSMOOTHING * latest + (1 - THROUGHPUTSMOOTHING) * previous
+        mb_per_second = bytes_per_second / MB
+        return mb_per_second
@@ -0,0 +1,179 @@
+#!/usr/bin/python
+
+""" Persistent on-disk cache for pandas DataFrames
+
+Contains a class used for caching DataFrames (e.g. parsed API responses) on disk.
+Each entry is stored as a compressed Parquet file with a small JSON metadata file next to it,
+so a cache hit skips both the network call and the parsing of the response.
+
+Entries that are final (e.g. golden Google Analytics data) never expire.
+All other entries expire after a configurable time to live (TTL).
+
+"""
+
+from common.util.Logging import check_logger
+from common.util.OSHelpers import get_cache_dir
+
+import hashlib
+import json
+import os
+import threading
+import time
+import pandas as pd
+
+
+DEFAULTTTLSECONDS = 6 * 60 * 60  # non-final entries are re-requested after 6 hours
+
+
+def get_fingerprint(key_obj):
+    """ Get a stable fingerprint of a JSON-serializable object
+
+    Args:
+        key_obj: (dict) object to fingerprint, e.g. the parameters of an API request
+
+    Returns:
+        fingerprint: (str) SHA-256 hex digest of the object
+
+    Example:
+        fingerprint = get_fingerprint({'viewId': '1234', 'startDate': '2019-01-01', 'endDate': '2019-01-01'})
+    """
+    key_json = json.dumps(key_obj, sort_keys=True, separators=(',', ':'), default=str)
+    fingerprint = hashlib.sha256(key_json.encode('utf-8')).hexdigest()
+    return fingerprint
+
+
+class DataFrameCache:
+    """Cache pandas DataFrames on disk as compressed Parquet files"""
+
+    def __init__(self, cache_dir=None, ttl_seconds=DEFAULTTTLSECONDS, compression='zstd', logging_obj=None):
+        """ Create a common.util.DataFrameCache.DataFrameCache object
+
+        Args:
+            cache_dir: (str) directory to store the cache entries in (defaults to the user's home directory > Cache > DataFrameCache)
+            ttl_seconds: (int) seconds after which entries that are not final expire
+            compression: (str) Parquet compression codec
+            logging_obj: (common.Util.Logging.Logging) logger
+
+        Example:
+            from common.util.DataFrameCache import DataFrameCache
+            response_cache = DataFrameCache(ttl_seconds=3600)
+        """
+        if cache_dir is None:
+            cache_dir = get_cache_dir('DataFrameCache')
+        else:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.compression = compression
+        self.logging_obj = check_logger(logging_obj)
+
+    def get_entry_paths(self, fingerprint):
+        """ Get the paths of the data and metadata files of an entry
+
+        Args:
+            fingerprint: (str) fingerprint of the entry's key
+
+        Returns:
+            data_path: (str) path to the Parquet file
+            metadata_path: (str) path to the JSON metadata file
+        """
+        entry_path = os.path.join(self.cache_dir, fingerprint)
+        return entry_path + '.parquet', entry_path + '.json'
+
+    def is_expired(self, metadata):
+        """ Check whether an entry has expired
+
+        Args:
+            metadata: (dict) metadata of the entry
+
+        Returns:
+            out: (bool) indicates whether or not the entry has expired
+        """
+        if metadata.get('is_final'):
+            return False
+        out = time.time() - metadata.get('created_at', 0) > self.ttl_seconds
+        return out
+
+    def get(self, key_obj):
+        """ Get an entry from the cache
+
+        Args:
+            key_obj: (dict) key of the entry, e.g. the parameters of an API request
+
+        Returns:
+            df: (pandas.DataFrame) cached data or None if there is no valid entry
+            metadata: (dict) metadata of the entry or None if there is no valid entry
+        """
+        fingerprint = get_fingerprint(key_obj)
+        data_path, metadata_path = self.get_entry_paths(fingerprint)
+        try:
+            with open(metadata_path) as metadata_file:
+                metadata = json.load(metadata_file)
+        except (OSError, ValueError):
+            return None, None
+
+        if self.is_expired(metadata):
+            log_msg = """
+                        method='common.util.DataFrameCache.DataFrameCache.get'
+                        message='Cache entry has expired'
+                        fingerprint='{fingerprint}'
+                        """.format(fingerprint=fingerprint)
+            self.logging_obj.log(self.logging_obj.DEBUG, log_msg)
+            return None, None
+
+        try:
+            df = pd.read_parquet(data_path)
+        except Exception as ex:
+            log_msg = """
+                        method='common.util.DataFrameCache.DataFrameCache.get'
+                        message='Could not read cache entry'
+                        fingerprint='{fingerprint}'
+                        exception_message='{ex_msg}'
+                        """.format(fingerprint=fingerprint,
+                                   ex_msg=str(ex))
+            self.logging_obj.log(self.logging_obj.WARN, log_msg)
+            return None, None
+        return df, metadata
+
+    def put(self, key_obj, df, is_final=False, metadata=None):
+        """ Put an entry into the cache
+
+        The files are written to temporary paths first and then moved into place,
+        so other processes never read a partially written entry.
+
+        Args:
+            key_obj: (dict) key of the entry, e.g. the parameters of an API request
+            df: (pandas.DataFrame) data to cache
+            is_final: (bool) final entries never expire
+            metadata: (dict) extra metadata to store with the entry
+
+        Returns:
+            metadata: (dict) metadata of the entry
+        """
+        fingerprint = get_fingerprint(key_obj)
+        data_path, metadata_path = self.get_entry_paths(fingerprint)
+        entry_metadata = dict(metadata or {})
+        entry_metadata.update({'key': key_obj,
+                               'is_final': bool(is_final),
+                               'created_at': time.time(),
+                               'num_rows': int(df.shape[0])})
+        tmp_suffix = '.{pid}.{thread_id}.tmp'.format(pid=os.getpid(), thread_id=threading.get_ident())
+        df.to_parquet(data_path + tmp_suffix, compression=self.compression, index=False)
+        os.replace(data_path + tmp_suffix, data_path)
+        with open(metadata_path + tmp_suffix, 'w') as metadata_file:
+            json.dump(entry_metadata, metadata_file, default=str)
+        os.replace(metadata_path + tmp_suffix, metadata_path)
+        return entry_metadata
+
+    def invalidate(self, key_obj):
+        """ Remove an entry from the cache
+
+        Args:
+            key_obj: (dict) key of the entry
+
+        Returns:
+
+        """
+        for path in self.get_entry_paths(get_fingerprint(key_obj)):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+
+""" Helper methods that can be performed on pandas DataFrames
+"""
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+def to_categorical(values):
+    """ Dictionary-encode values into a categorical array
+
+    Each distinct value is stored once (in the categories) and every row only holds an integer code.
+
+    Args:
+        values: (tuple or list of str) values, e.g. the values of one dimension of a GA report
+
+    Returns:
+        categorical: (pandas.Categorical) dictionary-encoded values (categories in order of first appearance)
+
+    Example:
+        countries = to_categorical(('Japan', 'China', 'Japan'))
+    """
+    codes, categories = pd.factorize(pd.Series(list(values), dtype=object), sort=False)
+    categorical = pd.Categorical.from_codes(codes, categories=categories)
+    return categorical
+
+
+def unify_categories(data_dfs, column_names=None):
+    """ Give the categorical columns of several dataframes the same categories
+
+    pandas falls back to object columns when it concatenates or merges categorical columns
+    whose categories differ, so the categories are unified first.
+
+    Args:
+        data_dfs: (list of pandas.DataFrame) dataframes with the same columns
+        column_names: (list of str) columns to unify (defaults to the categorical columns of the first dataframe)
+
+    Returns:
+        data_dfs: (list of pandas.DataFrame) dataframes whose categorical columns have the same categories
+    """
+    if len(data_dfs) < 2:
+        return data_dfs
+    if column_names is None:
+        column_names = list(data_dfs[0].select_dtypes('category').columns)
+    data_dfs = [data_df.copy(deep=False) for data_df in data_dfs]
+    for column_name in column_names:
+        columns = [data_df[column_name] for data_df in data_dfs]
+        if not all(isinstance(column.dtype, pd.CategoricalDtype) for column in columns):
+            continue
+        categories = union_categoricals([column.values for column in columns]).categories
+        for data_df, column in zip(data_dfs, columns):
+            data_df[column_name] = column.cat.set_categories(categories)
+    return data_dfs
+
+
+def concat_dataframes(data_dfs):
+    """ Concatenate dataframes and keep their categorical columns categorical
+
+    Args:
+        data_dfs: (list of pandas.DataFrame) dataframes with the same columns
+
+    Returns:
+        data_df: (pandas.DataFrame) rows of all dataframes (empty if there are none)
+
+    Example:
+        data_df = concat_dataframes([data_df1, data_df2])
+    """
+    if not data_dfs:
+        return pd.DataFrame()
+    if len(data_dfs) == 1:
+        return data_dfs[0]
+    data_df = pd.concat(unify_categories(data_dfs), ignore_index=True)
+    return data_df
@@ -0,0 +1,619 @@
+#!/usr/bin/python
+
+""" Record and replay HTTP traffic
+
+Contains classes used for profiling and benchmarking API wrappers without network access:
+    1) Cassette: compressed file of recorded HTTP exchanges (interactions)
+    2) RecordingHttp: httplib2-compatible HTTP object that sends real requests and records them
+       (e.g. Google API requests, see webanalytics.googleanalytics.GoogleApi.init)
+    3) ReplayHttp: httplib2-compatible HTTP object that answers requests from a cassette in-process
+    4) CassetteServer: local HTTP/1.1 stand-in server that answers requests from a cassette
+       (or forwards them to the real API and records them) for clients that only take a base URL
+       (e.g. BaiduAnalytics.BASE_URL)
+    5) StandInHttp: httplib2-compatible HTTP object that sends every request to a CassetteServer
+
+Replayed traffic can be slowed down and made to fail with configurable latency and failure injection.
+Credentials (passwords, tokens, API keys) are redacted before interactions are recorded and matched.
+
+Example:
+    # Record once
+    cassette = Cassette('cassettes/ga.json.gz')
+    ga = GoogleAnalytics(ga_settings=ga_settings, http=RecordingHttp(cassette, get_credentials('analytics', ga_settings)))
+    ...
+    cassette.save()
+
+    # Replay offline through the local stand-in server
+    with CassetteServer(Cassette('cassettes/ga.json.gz'), latency_seconds=0.2, failure_rate=0.05) as server:
+        ga = GoogleAnalytics(ga_settings=ga_settings, http=StandInHttp(server.base_url))
+
+"""
+
+from common.util.Logging import check_logger
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import base64
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import httplib2
+from googleapiclient.http import build_http
+
+
+REDACTEDKEYS = ('password', 'token', 'username', 'access_token', 'refresh_token', 'client_secret', 'key')
+REDACTEDVALUE = 'REDACTED'
+# Headers that describe the recorded transfer rather than the content, so they are not replayed
+SKIPPEDRESPONSEHEADERS = ('connection', 'content-encoding', 'content-length', 'keep-alive', 'status',
+                          'transfer-encoding', '-content-encoding')
+
+
+def redact(obj):
+    """ Redact the credentials in a JSON-like object
+
+    Args:
+        obj: (dict, list or scalar) object to redact, e.g. a request body
+
+    Returns:
+        redacted_obj: copy of obj where the values of REDACTEDKEYS are replaced by REDACTEDVALUE
+    """
+    if isinstance(obj, dict):
+        return {key: REDACTEDVALUE if key.lower() in REDACTEDKEYS else redact(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [redact(value) for value in obj]
+    return obj
+
+
+def normalize_uri(uri):
+    """ Get the part of a URI used to match requests
+
+    The scheme and host are dropped, so requests sent to a stand-in server match the recorded requests.
+    Query parameters are sorted and credentials are removed.
+
+    Args:
+        uri: (str) URI of a request
+
+    Returns:
+        normalized_uri: (str) path and query of the URI
+    """
+    parsed_uri = urllib.parse.urlsplit(uri)
+    query_list = sorted((key, value) for key, value in urllib.parse.parse_qsl(parsed_uri.query, keep_blank_values=True)
+                        if key.lower() not in REDACTEDKEYS)
+    normalized_uri = parsed_uri.path or '/'
+    if query_list:
+        normalized_uri = normalized_uri + '?' + urllib.parse.urlencode(query_list)
+    return normalized_uri
+
+
+def normalize_body(body):
+    """ Get the redacted form of a request body
+
+    Args:
+        body: (str or bytes) body of a request
+
+    Returns:
+        normalized_body: (str) JSON bodies are redacted and re-serialized with sorted keys, other bodies are kept as is
+    """
+    if body is None:
+        return ''
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    try:
+        normalized_body = json.dumps(redact(json.loads(body)), sort_keys=True, separators=(',', ':'))
+    except ValueError:
+        normalized_body = body
+    return normalized_body
+
+
+def get_interaction_key(method, uri, body):
+    """ Get the key used to match a request with the recorded interactions
+
+    Args:
+        method: (str) HTTP method
+        uri: (str) URI of the request
+        body: (str or bytes) body of the request
+
+    Returns:
+        key: (str) method, normalized URI and fingerprint of the normalized body
+    """
+    body_fingerprint = hashlib.sha256(normalize_body(body).encode('utf-8')).hexdigest()
+    key = '{method} {uri} {body_fingerprint}'.format(method=(method or 'GET').upper(),
+                                                     uri=normalize_uri(uri),
+                                                     body_fingerprint=body_fingerprint)
+    return key
+
+
+def encode_content(content):
+    """ Encode response content for a cassette file
+
+    Args:
+        content: (bytes) response content
+
+    Returns:
+        content_str: (str) content as text (or base64 if it is not UTF-8)
+        content_encoding: (str) utf-8 or base64
+    """
+    try:
+        return content.decode('utf-8'), 'utf-8'
+    except UnicodeDecodeError:
+        return base64.b64encode(content).decode('ascii'), 'base64'
+
+
+def decode_content(interaction):
+    """ Decode the response content of an interaction
+
+    Args:
+        interaction: (dict) recorded interaction
+
+    Returns:
+        content: (bytes) response content
+    """
+    if interaction.get('content_encoding') == 'base64':
+        return base64.b64decode(interaction['content'])
+    return interaction['content'].encode('utf-8')
+
+
+class FaultInjector:
+    """Add latency to replayed responses and make some of them fail"""
+
+    def __init__(self, latency_seconds=0, failure_rate=0, failure_status=503, seed=None):
+        """ Create a common.util.HttpCassette.FaultInjector object
+
+        Args:
+            latency_seconds: (float) seconds to wait before each response
+            failure_rate: (float) fraction of the requests that fail (between 0 and 1)
+            failure_status: (int) HTTP status of the failed requests, e.g. 429 or 503
+            seed: (int) seed of the random number generator, for repeatable failures
+        """
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def inject(self):
+        """ Wait for the latency and decide whether the request fails
+
+        Returns:
+            status: (int) failure_status if the request fails and None otherwise
+        """
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with self.lock:
+            is_failure = self.random.random() < self.failure_rate
+        if is_failure:
+            return self.failure_status
+        return None
+
+
+class Cassette:
+    """Store recorded HTTP interactions in a gzip-compressed JSON file"""
+
+    def __init__(self, path, logging_obj=None):
+        """ Create a common.util.HttpCassette.Cassette object
+
+        The interactions in the file are loaded if the file exists.
+
+        Args:
+            path: (str) path to the cassette file (e.g. cassettes/ga.json.gz)
+            logging_obj: (common.Util.Logging.Logging) logger
+        """
+        self.path = path
+        self.logging_obj = check_logger(logging_obj)
+        self.lock = threading.Lock()
+        self.interactions = []
+        # Index of the next interaction to replay for each key (identical requests are replayed in recorded order)
+        self.play_counts = dict()
+        if os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.interactions)
+
+    def load(self):
+        """ Load the interactions from the cassette file
+
+        Returns:
+
+        """
+        with gzip.open(self.path, 'rt', encoding='utf-8') as cassette_file:
+            interactions = json.load(cassette_file)
+        with self.lock:
+            self.interactions = interactions
+            self.play_counts = dict()
+
+    def save(self):
+        """ Save the interactions to the cassette file
+
+        Returns:
+
+        """
+        cassette_dir = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(cassette_dir, exist_ok=True)
+        tmp_path = self.path + '.{pid}.tmp'.format(pid=os.getpid())
+        with self.lock:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as cassette_file:
+                json.dump(self.interactions, cassette_file)
+        os.replace(tmp_path, self.path)
+        log_msg = """
+                    method='common.util.HttpCassette.Cassette.save'
+                    message='Saved cassette'
+                    path='{path}'
+                    num_interactions='{num_interactions}'
+                    """.format(path=self.path,
+                               num_interactions=len(self.interactions))
+        self.logging_obj.log(self.logging_obj.INFO, log_msg)
+
+    def record(self, method, uri, body, status, headers, content):
+        """ Record an interaction
+
+        Args:
+            method: (str) HTTP method of the request
+            uri: (str) URI of the request
+            body: (str or bytes) body of the request
+            status: (int) HTTP status of the response
+            headers: (dict) headers of the response
+            content: (bytes) content of the response
+
+        Returns:
+
+        """
+        content_str, content_encoding = encode_content(content)
+        interaction = {'key': get_interaction_key(method, uri, body),
+                       'method': (method or 'GET').upper(),
+                       'uri': normalize_uri(uri),
+                       'body': normalize_body(body),
+                       'status': int(status),
+                       'headers': {key.lower(): value for key, value in headers.items()
+                                   if key.lower() not in SKIPPEDRESPONSEHEADERS},
+                       'content': content_str,
+                       'content_encoding': content_encoding,
+                       'recorded_at': time.time()}
+        with self.lock:
+            self.interactions.append(interaction)
+
+    def play(self, method, uri, body):
+        """ Find the recorded interaction for a request
+
+        Identical requests are answered with their recorded interactions in order; once all of them have been
+        played, the last one is repeated.
+
+        Args:
+            method: (str) HTTP method of the request
+            uri: (str) URI of the request
+            body: (str or bytes) body of the request
+
+        Returns:
+            interaction: (dict) recorded interaction or None if the request was never recorded
+        """
+        key = get_interaction_key(method, uri, body)
+        with self.lock:
+            matches = [interaction for interaction in self.interactions if interaction['key'] == key]
+            if not matches:
+                return None
+            play_count = self.play_counts.get(key, 0)
+            self.play_counts[key] = play_count + 1
+        interaction = matches[min(play_count, len(matches) - 1)]
+        return interaction
+
+
+def get_missing_interaction_response(method, uri):
+    """ Get the response to a request that is not in the cassette
+
+    Args:
+        method: (str) HTTP method of the request
+        uri: (str) URI of the request
+
+    Returns:
+        status: (int) 404
+        headers: (dict) response headers
+        content: (bytes) JSON error in the format of Google APIs
+    """
+    error = {'error': {'code': 404,
+                       'message': 'No recorded interaction for {method} {uri}'.format(method=method,
+                                                                                      uri=normalize_uri(uri)),
+                       'status': 'NOT_FOUND'}}
+    return 404, {'content-type': 'application/json; charset=UTF-8'}, json.dumps(error).encode('utf-8')
+
+
+def get_failure_response(status):
+    """ Get the response to a request that fails because of failure injection
+
+    Args:
+        status: (int) HTTP status of the failure
+
+    Returns:
+        status: (int) HTTP status of the failure
+        headers: (dict) response headers
+        content: (bytes) JSON error in the format of Google APIs
+    """
+    error = {'error': {'code': status, 'message': 'Injected failure', 'status': 'UNAVAILABLE'}}
+    return status, {'content-type': 'application/json; charset=UTF-8'}, json.dumps(error).encode('utf-8')
+
+
+def to_httplib2_response(status, headers, content):
+    """ Build the response tuple returned by httplib2.Http.request
+
+    Args:
+        status: (int) HTTP status
+        headers: (dict) response headers
+        content: (bytes) response content
+
+    Returns:
+        resp: (httplib2.Response) response
+        content: (bytes) response content
+    """
+    resp_headers = dict(headers)
+    resp_headers['status'] = str(status)
+    resp_headers['content-length'] = str(len(content))
+    return httplib2.Response(resp_headers), content
+
+
+class RecordingHttp:
+    """httplib2-compatible HTTP object that sends real requests and records them in a cassette"""
+
+    def __init__(self, cassette, credentials=None):
+        """ Create a common.util.HttpCassette.RecordingHttp object
+
+        httplib2.Http objects are not thread-safe, so each thread sends its requests with its own HTTP object.
+
+        Args:
+            cassette: (common.util.HttpCassette.Cassette) cassette to record the interactions in
+            credentials: (oauth2client.client.OAuth2Credentials) credentials used to authorize the requests
+        """
+        self.cassette = cassette
+        self.credentials = credentials
+        self.thread_https = threading.local()
+
+    def get_http(self):
+        """ Get the HTTP object of the current thread
+
+        Returns:
+            http: (httplib2.Http) HTTP object (authorized if the object has credentials)
+        """
+        http = getattr(self.thread_https, 'http', None)
+        if http is None:
+            http = build_http()
+            if self.credentials is not None:
+                http = self.credentials.authorize(http=http)
+            self.thread_https.http = http
+        return http
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+                connection_type=None):
+        """ Send a request and record it (same signature as httplib2.Http.request)
+
+        Returns:
+            resp: (httplib2.Response) response
+            content: (bytes) response content
+        """
+        resp, content = self.get_http().request(uri, method, body=body, headers=headers, redirections=redirections,
+                                                connection_type=connection_type)
+        self.cassette.record(method, uri, body, resp.status, dict(resp), content)
+        return resp, content
+
+
+class ReplayHttp:
+    """httplib2-compatible HTTP object that answers requests from a cassette without any network access"""
+
+    def __init__(self, cassette, latency_seconds=0, failure_rate=0, failure_status=503, seed=None):
+        """ Create a common.util.HttpCassette.ReplayHttp object
+
+        Args:
+            cassette: (common.util.HttpCassette.Cassette) cassette with the recorded interactions
+            latency_seconds: (float) seconds to wait before each response
+            failure_rate: (float) fraction of the requests that fail (between 0 and 1)
+            failure_status: (int) HTTP status of the failed requests, e.g. 429 or 503
+            seed: (int) seed of the random number generator, for repeatable failures
+        """
+        self.cassette = cassette
+        self.fault_injector = FaultInjector(latency_seconds, failure_rate, failure_status, seed)
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+                connection_type=None):
+        """ Answer a request from the cassette (same signature as httplib2.Http.request)
+
+        Returns:
+            resp: (httplib2.Response) response
+            content: (bytes) response content
+        """
+        failure_status = self.fault_injector.inject()
+        if failure_status is not None:
+            return to_httplib2_response(*get_failure_response(failure_status))
+        interaction = self.cassette.play(method, uri, body)
+        if interaction is None:
+            return to_httplib2_response(*get_missing_interaction_response(method, uri))
+        return to_httplib2_response(interaction['status'], interaction['headers'], decode_content(interaction))
+
+
+class StandInHttp:
+    """httplib2-compatible HTTP object that sends every request to a local stand-in server"""
+
+    def __init__(self, base_url):
+        """ Create a common.util.HttpCassette.StandInHttp object
+
+        Args:
+            base_url: (str) base URL of the stand-in server, e.g. CassetteServer.base_url
+        """
+        self.base_url = base_url.rstrip('/')
+        self.thread_https = threading.local()
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+                connection_type=None):
+        """ Send a request to the stand-in server instead of its host (same signature as httplib2.Http.request)
+
+        Returns:
+            resp: (httplib2.Response) response
+            content: (bytes) response content
+        """
+        http = getattr(self.thread_https, 'http', None)
+        if http is None:
+            http = self.thread_https.http = httplib2.Http()
+        parsed_uri = urllib.parse.urlsplit(uri)
+        stand_in_uri = self.base_url + urllib.parse.urlunsplit(('', '', parsed_uri.path, parsed_uri.query, ''))
+        return http.request(stand_in_uri, method, body=body, headers=headers, redirections=redirections)
+
+
+class _CassetteRequestHandler(BaseHTTPRequestHandler):
+    """Answer the requests of a CassetteServer"""
+
+    # HTTP/1.1 keeps connections alive, so clients that reuse connections are measured realistically
+    protocol_version = 'HTTP/1.1'
+
+    def handle_cassette_request(self):
+        content_length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(content_length) if content_length else None
+        server = self.server.cassette_server
+        failure_status = server.fault_injector.inject()
+        if failure_status is not None:
+            (status, headers, content) = get_failure_response(failure_status)
+        elif server.upstream_url is not None:
+            (status, headers, content) = server.forward(self.command, self.path, body, self.headers)
+            server.cassette.record(self.command, self.path, body, status, headers, content)
+        else:
+            interaction = server.cassette.play(self.command, self.path, body)
+            if interaction is None:
+                (status, headers, content) = get_missing_interaction_response(self.command, self.path)
+            else:
+                (status, headers, content) = (interaction['status'], interaction['headers'],
+                                              decode_content(interaction))
+        self.send_response(status)
+        for key, value in headers.items():
+            if key.lower() not in SKIPPEDRESPONSEHEADERS:
+                self.send_header(key, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = handle_cassette_request
+    do_POST = handle_cassette_request
+    do_PUT = handle_cassette_request
+    do_PATCH = handle_cassette_request
+    do_DELETE = handle_cassette_request
+
+    def log_message(self, format, *args):
+        # Requests are not logged to stderr
+        pass
+
+
+class CassetteServer:
+    """Local HTTP/1.1 stand-in server that replays (or records) a cassette"""
+
+    def __init__(self, cassette, host='127.0.0.1', port=0, latency_seconds=0, failure_rate=0, failure_status=503,
+                 seed=None, upstream_url=None, logging_obj=None):
+        """ Create a common.util.HttpCassette.CassetteServer object
+
+        Args:
+            cassette: (common.util.HttpCassette.Cassette) cassette with the recorded interactions
+            host: (str) host to listen on
+            port: (int) port to listen on (0 picks a free port)
+            latency_seconds: (float) seconds to wait before each response
+            failure_rate: (float) fraction of the requests that fail (between 0 and 1)
+            failure_status: (int) HTTP status of the failed requests, e.g. 429 or 503
+            seed: (int) seed of the random number generator, for repeatable failures
+            upstream_url: (str) if set, requests are forwarded to this URL (e.g. https://api.baidu.com)
+                and recorded instead of being replayed
+            logging_obj: (common.Util.Logging.Logging) logger
+
+        Example:
+            with CassetteServer(Cassette('cassettes/baidu.json.gz')) as server:
+                baidu_api = BaiduAnalytics(site_id, username, password, token,
+                                           base_url=server.get_url(BaiduAnalytics.BASE_URL))
+        """
+        self.cassette = cassette
+        self.host = host
+        self.port = port
+        self.fault_injector = FaultInjector(latency_seconds, failure_rate, failure_status, seed)
+        self.upstream_url = upstream_url.rstrip('/') if upstream_url else None
+        self.logging_obj = check_logger(logging_obj)
+        self.http_server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """ Base URL of the running server, e.g. http://127.0.0.1:54321 """
+        return 'http://{host}:{port}'.format(host=self.host, port=self.port)
+
+    def get_url(self, url):
+        """ Get the URL on the stand-in server that corresponds to a URL of the real API
+
+        Args:
+            url: (str) URL of the real API, e.g. BaiduAnalytics.BASE_URL
+
+        Returns:
+            stand_in_url: (str) same path and query on the stand-in server
+        """
+        parsed_url = urllib.parse.urlsplit(url)
+        stand_in_url = self.base_url + urllib.parse.urlunsplit(('', '', parsed_url.path, parsed_url.query, ''))
+        return stand_in_url
+
+    def forward(self, method, path, body, headers):
+        """ Forward a request to the upstream API
+
+        Args:
+            method: (str) HTTP method
+            path: (str) path and query of the request
+            body: (bytes) body of the request
+            headers: (http.client.HTTPMessage) headers of the request
+
+        Returns:
+            status: (int) HTTP status of the response
+            headers: (dict) headers of the response
+            content: (bytes) content of the response
+        """
+        forwarded_headers = {key: value for key, value in headers.items()
+                             if key.lower() not in ('host', 'connection', 'content-length', 'accept-encoding')}
+        request = urllib.request.Request(self.upstream_url + path, data=body, headers=forwarded_headers,
+                                         method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, dict(response.headers), response.read()
+        except urllib.error.HTTPError as ex:
+            return ex.code, dict(ex.headers), ex.read()
+
+    def start(self):
+        """ Start serving on a background thread
+
+        Returns:
+            server: (common.util.HttpCassette.CassetteServer) the started server
+        """
+        self.http_server = ThreadingHTTPServer((self.host, self.port), _CassetteRequestHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.cassette_server = self
+        self.port = self.http_server.server_address[1]
+        self.thread = threading.Thread(target=self.http_server.serve_forever, daemon=True)
+        self.thread.start()
+        log_msg = """
+                    method='common.util.HttpCassette.CassetteServer.start'
+                    message='Started cassette server'
+                    base_url='{base_url}'
+                    mode='{mode}'
+                    """.format(base_url=self.base_url,
+                               mode='record' if self.upstream_url else 'replay')
+        self.logging_obj.log(self.logging_obj.INFO, log_msg)
+        return self
+
+    def stop(self):
+        """ Stop the server (and save the cassette if it was recording)
+
+        Returns:
+
+        """
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+        if self.upstream_url is not None:
+            self.cassette.save()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+
+""" Keep-alive HTTP(S) connections to one host
+
+Contains a thread-safe pool of persistent http.client connections to one host (e.g. the Baidu Tongji API).
+Connections are kept open between requests, so consecutive requests skip the TCP and TLS handshakes.
+Each thread takes an idle connection from the pool (or opens a new one) and returns it when the response
+has been read. Responses are requested gzip-encoded and decoded transparently.
+
+The SSL context belongs to the pool, so its certificate verification policy does not change the process-wide
+default used by urllib and other libraries.
+
+"""
+
+from http import client as http_client
+from urllib.parse import urlsplit
+import gzip
+import queue
+import ssl
+import threading
+
+
+def get_ssl_context(verify=True):
+    """ Get an SSL context for a connection pool
+
+    Args:
+        verify: (bool) whether to verify the server's certificate and host name
+
+    Returns:
+        ssl_context: (ssl.SSLContext) SSL context
+    """
+    if verify:
+        return ssl.create_default_context()
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
+
+
+class HttpConnectionPool:
+    """Thread-safe pool of keep-alive connections to one HTTP(S) host"""
+
+    # errors of a connection the server closed while it was idle in the pool
+    STALECONNECTIONERRORS = (http_client.RemoteDisconnected, http_client.BadStatusLine, BrokenPipeError,
+                             ConnectionResetError, ConnectionAbortedError)
+
+    def __init__(self, base_url, ssl_context=None, max_idle_connections=8, timeout=60):
+        """ Create a common.util.HttpConnectionPool.HttpConnectionPool object
+
+        Args:
+            base_url: (str) scheme, host and (optional) port of the server, e.g. https://api.baidu.com
+                (the path, if any, is ignored)
+            ssl_context: (ssl.SSLContext) SSL context of the HTTPS connections (defaults to get_ssl_context())
+            max_idle_connections: (int) maximum number of idle connections kept open
+            timeout: (float) socket timeout of each connection in seconds
+
+        Example:
+            pool = HttpConnectionPool('https://api.baidu.com')
+            (status, headers, content) = pool.request('POST', '/json/tongji/v1/ReportService/getData', body=data)
+            pool.close()
+        """
+        url_parts = urlsplit(base_url)
+        if url_parts.scheme not in ('http', 'https'):
+            raise ValueError("Unsupported URL scheme '{scheme}' in '{url}'".format(scheme=url_parts.scheme,
+                                                                                   url=base_url))
+        self.scheme = url_parts.scheme
+        self.host = url_parts.hostname
+        self.port = url_parts.port
+        self.ssl_context = ssl_context if ssl_context is not None or self.scheme == 'http' else get_ssl_context()
+        self.timeout = timeout
+        self.idle_connections = queue.LifoQueue(maxsize=max_idle_connections)
+        self.lock = threading.Lock()
+        self.num_connections_opened = 0
+        self.num_requests = 0
+
+    def new_connection(self):
+        """ Open a new connection to the host
+
+        Returns:
+            connection: (http.client.HTTPConnection) connection (connected on its first request)
+        """
+        with self.lock:
+            self.num_connections_opened = self.num_connections_opened + 1
+        if self.scheme == 'https':
+            return http_client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self.ssl_context)
+        return http_client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def get_connection(self):
+        """ Take an idle connection from the pool or open a new one
+
+        Returns:
+            connection: (http.client.HTTPConnection) connection
+            is_reused: (bool) True if the connection was idle in the pool
+        """
+        try:
+            return self.idle_connections.get_nowait(), True
+        except queue.Empty:
+            return self.new_connection(), False
+
+    def put_connection(self, connection):
+        """ Return a connection to the pool (or close it if the pool is full)
+
+        Args:
+            connection: (http.client.HTTPConnection) connection whose response has been read
+
+        Returns:
+
+        """
+        try:
+            self.idle_connections.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(self, method, path, body=None, headers=None):
+        """ Send a request on a pooled connection and read its response
+
+        A request on a reused connection that the server has closed in the meantime is sent again on a new
+        connection.
+
+        Args:
+            method: (str) HTTP method, e.g. POST
+            path: (str) path (and query) of the request
+            body: (bytes) body of the request
+            headers: (dict) headers of the request
+
+        Returns:
+            status: (int) HTTP status of the response
+            headers: (dict) headers of the response (lower case names)
+            content: (bytes) decoded body of the response
+        """
+        request_headers = {'Accept-Encoding': 'gzip', 'Connection': 'keep-alive'}
+        request_headers.update(headers or {})
+        with self.lock:
+            self.num_requests = self.num_requests + 1
+        (connection, is_reused) = self.get_connection()
+        while True:
+            try:
+                connection.request(method, path, body=body, headers=request_headers)
+                response = connection.getresponse()
+                content = response.read()
+                break
+            except self.STALECONNECTIONERRORS:
+                connection.close()
+                if not is_reused:
+                    raise
+                (connection, is_reused) = (self.new_connection(), False)
+            except BaseException:
+                connection.close()
+                raise
+        response_headers = {name.lower(): value for (name, value) in response.getheaders()}
+        if response.will_close:
+            connection.close()
+        else:
+            self.put_connection(connection)
+        if response_headers.get('content-encoding', '').lower() == 'gzip':
+            content = gzip.decompress(content)
+        return response.status, response_headers, content
+
+    def close(self):
+        """ Close all idle connections
+
+        Returns:
+
+        """
+        while True:
+            try:
+                self.idle_connections.get_nowait().close()
+            except queue.Empty:
+                break
@@ -20,3 +20,20 @@ def is_in(element, collection: iter):
     """
     out = element in collection
     return out
+
+
+def chunk_list(collection: list, chunk_size):
+    """ Split a list into consecutive chunks
+
+    Args:
+        collection: (list) list to split
+        chunk_size: (int) maximum number of elements in each chunk
+
+    Returns:
+        chunks: (list of lists) consecutive chunks of collection
+
+    Example:
+        my_chunks = chunk_list(['a', 'b', 'c', 'd', 'e'], 2)  # [['a', 'b'], ['c', 'd'], ['e']]
+    """
+    chunks = [collection[i:i + chunk_size] for i in range(0, len(collection), chunk_size)]
+    return chunks
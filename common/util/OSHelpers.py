@@ -96,6 +96,25 @@ def get_log_filepath(app_name='Python App'):
     return log_filepath
 
 
+def get_cache_dir(cache_name='Python App'):
+    """ Get the full path of a cache directory
+
+    Returns the directory where cached data is stored.
+    This is just the user's home directory > Cache > cache_name.
+    The directory is created if it does not exist yet.
+
+    Args:
+        cache_name: (string) name of the cache
+
+    Returns:
+        cache_dir: (string) full path to the cache directory
+
+    """
+    cache_dir = get_user_home_dir() + os.sep + 'Cache' + os.sep + cache_name
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
 def get_operating_system():
     """ Get operating system
 
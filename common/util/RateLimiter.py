@@ -0,0 +1,56 @@
+#!/usr/bin/python
+
+""" Rate limiting helpers
+
+Contains a thread-safe token bucket used for keeping API calls under a requests per second quota.
+
+"""
+
+import threading
+import time
+
+
+class TokenBucketRateLimiter:
+    """Thread-safe token bucket rate limiter"""
+
+    def __init__(self, rate, capacity=None):
+        """ Create a common.util.RateLimiter.TokenBucketRateLimiter object
+
+        Tokens are added to the bucket at a constant rate up to its capacity.
+        Each call takes tokens out of the bucket and waits if there are not enough tokens.
+
+        Args:
+            rate: (float) tokens added per second, i.e. the sustained requests per second
+            capacity: (float) maximum number of tokens in the bucket, i.e. the burst size (defaults to rate)
+
+        Example:
+            rate_limiter = TokenBucketRateLimiter(rate=10)
+            rate_limiter.acquire()
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(self.rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """ Take tokens out of the bucket, waiting until they are available
+
+        Args:
+            tokens: (float) number of tokens to take
+
+        Returns:
+            waited_seconds: (float) time spent waiting for tokens
+        """
+        waited_seconds = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens = self.tokens - tokens
+                    return waited_seconds
+                wait_seconds = (tokens - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+            waited_seconds = waited_seconds + wait_seconds
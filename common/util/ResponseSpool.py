@@ -0,0 +1,273 @@
+#!/usr/bin/python
+
+""" Spool raw API responses to compressed NDJSON files
+
+Contains classes used for keeping an audit trail of raw API responses without holding them in memory.
+Each response is written as one JSON line to a compressed file as soon as it arrives.
+The file is kept in a local archive directory or uploaded to an S3 prefix when it is closed.
+
+zstd compression is used if the zstandard library is installed and gzip otherwise.
+
+"""
+
+from common.util.Logging import check_logger
+from common.util.OSHelpers import get_cache_dir
+
+import gzip
+import io
+import json
+import os
+import threading
+import time
+import uuid
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSIONEXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def get_default_compression():
+    """ Get the best compression available
+
+    Returns:
+        compression: (str) zstd if the zstandard library is installed and gzip otherwise
+    """
+    if zstandard is not None:
+        return 'zstd'
+    return 'gzip'
+
+
+def open_compressed_writer(raw_file, compression):
+    """ Wrap a binary file object in a compressing text writer
+
+    Args:
+        raw_file: (file object) binary file object to write to
+        compression: (str) gzip or zstd
+
+    Returns:
+        writer: (io.TextIOWrapper) text writer that compresses what is written to it
+    """
+    if compression == 'zstd':
+        compressed_file = zstandard.ZstdCompressor().stream_writer(raw_file)
+    else:
+        compressed_file = gzip.GzipFile(fileobj=raw_file, mode='wb')
+    writer = io.TextIOWrapper(compressed_file, encoding='utf-8')
+    return writer
+
+
+def open_compressed_reader(raw_file, compression):
+    """ Wrap a binary file object in a decompressing text reader
+
+    Args:
+        raw_file: (file object) binary file object to read from
+        compression: (str) gzip or zstd
+
+    Returns:
+        reader: (io.TextIOWrapper) text reader that decompresses what is read from it
+    """
+    if compression == 'zstd':
+        compressed_file = zstandard.ZstdDecompressor().stream_reader(raw_file)
+    else:
+        compressed_file = gzip.GzipFile(fileobj=raw_file, mode='rb')
+    reader = io.TextIOWrapper(compressed_file, encoding='utf-8')
+    return reader
+
+
+class SpoolHandle:
+    """Reference to a closed spool file"""
+
+    def __init__(self, name, compression, num_records, file_path=None, s3_bucket=None, s3_key=None):
+        """ Create a common.util.ResponseSpool.SpoolHandle object
+
+        Args:
+            name: (str) name of the spool file
+            compression: (str) gzip or zstd
+            num_records: (int) number of records in the file
+            file_path: (str) path to the file in the local archive directory (None if it was uploaded to S3)
+            s3_bucket: (common.dataaccess.AmazonWebServicesApi.S3Bucket) bucket the file was uploaded to
+            s3_key: (str) key of the file in S3
+        """
+        self.name = name
+        self.compression = compression
+        self.num_records = num_records
+        self.file_path = file_path
+        self.s3_bucket = s3_bucket
+        self.s3_key = s3_key
+
+    def get_location(self):
+        """ Get the location of the spool file
+
+        Returns:
+            location: (str) s3://bucket/key or the local file path
+        """
+        if self.s3_key is not None:
+            return 's3://{bucket_name}/{key}'.format(bucket_name=self.s3_bucket.bucket_name, key=self.s3_key)
+        return self.file_path
+
+    def iter_records(self):
+        """ Iterate over the records of the spool file one at a time
+
+        Yields:
+            record: (dict) record as it was written
+        """
+        if self.s3_key is not None:
+            raw_file = self.s3_bucket.client.get_object(Bucket=self.s3_bucket.bucket_name, Key=self.s3_key)['Body']
+        else:
+            raw_file = open(self.file_path, 'rb')
+        try:
+            reader = open_compressed_reader(raw_file, self.compression)
+            for line in reader:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            raw_file.close()
+
+    def __repr__(self):
+        return "SpoolHandle(location='{location}', num_records={num_records})".format(
+            location=self.get_location(),
+            num_records=self.num_records)
+
+
+class SpoolWriter:
+    """Write records to a compressed NDJSON spool file"""
+
+    def __init__(self, spool, name):
+        """ Create a common.util.ResponseSpool.SpoolWriter object (use ResponseSpool.open)
+
+        Args:
+            spool: (common.util.ResponseSpool.ResponseSpool) spool the file belongs to
+            name: (str) name of the spool file
+        """
+        self.spool = spool
+        self.name = name
+        self.file_path = os.path.join(spool.spool_dir, name)
+        self.num_records = 0
+        # Several threads may write the pages of one query
+        self.lock = threading.Lock()
+        self.raw_file = open(self.file_path + '.tmp', 'wb')
+        self.writer = open_compressed_writer(self.raw_file, spool.compression)
+
+    def write(self, record):
+        """ Write a record as one JSON line
+
+        Args:
+            record: (dict) JSON-serializable record, e.g. a raw API response
+
+        Returns:
+
+        """
+        line = json.dumps(record, separators=(',', ':'), default=str)
+        with self.lock:
+            self.writer.write(line)
+            self.writer.write('\n')
+            self.num_records = self.num_records + 1
+
+    def close(self):
+        """ Close the spool file and move it to its archive location
+
+        Returns:
+            handle: (common.util.ResponseSpool.SpoolHandle) reference to the closed file
+        """
+        with self.lock:
+            self.writer.close()
+            if not self.raw_file.closed:
+                self.raw_file.close()
+            os.replace(self.file_path + '.tmp', self.file_path)
+        return self.spool.archive(self)
+
+    def abort(self):
+        """ Close the spool file and delete it
+
+        Returns:
+
+        """
+        with self.lock:
+            self.writer.close()
+            if not self.raw_file.closed:
+                self.raw_file.close()
+            os.remove(self.file_path + '.tmp')
+
+
+class ResponseSpool:
+    """Archive raw API responses as compressed NDJSON files in a local directory or an S3 prefix"""
+
+    def __init__(self, spool_dir=None, s3_bucket=None, s3_prefix=None, compression=None, logging_obj=None):
+        """ Create a common.util.ResponseSpool.ResponseSpool object
+
+        Args:
+            spool_dir: (str) directory the files are written to (and kept in if there is no s3_bucket)
+                Defaults to the user's home directory > Cache > ResponseSpool.
+            s3_bucket: (common.dataaccess.AmazonWebServicesApi.S3Bucket) bucket to upload the files to when they are closed
+            s3_prefix: (str) S3 prefix to upload the files under
+            compression: (str) gzip or zstd (defaults to zstd if the zstandard library is installed)
+            logging_obj: (common.Util.Logging.Logging) logger
+
+        Example:
+            from common.util.ResponseSpool import ResponseSpool
+            response_spool = ResponseSpool(s3_bucket=s3_bucket_obj, s3_prefix='google_analytics/raw_responses')
+        """
+        if spool_dir is None:
+            spool_dir = get_cache_dir('ResponseSpool')
+        else:
+            os.makedirs(spool_dir, exist_ok=True)
+        if compression is None:
+            compression = get_default_compression()
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError("zstd compression requires the zstandard library (pip install zstandard)")
+        if compression not in COMPRESSIONEXTENSIONS:
+            raise ValueError("compression must be one of {compressions}".format(
+                compressions=list(COMPRESSIONEXTENSIONS)))
+        self.spool_dir = spool_dir
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix
+        self.compression = compression
+        self.logging_obj = check_logger(logging_obj)
+
+    def open(self, name_prefix):
+        """ Open a new spool file
+
+        Args:
+            name_prefix: (str) prefix of the file name, e.g. the parameters of the query
+                A timestamp and a random suffix are added so names never collide.
+
+        Returns:
+            writer: (common.util.ResponseSpool.SpoolWriter) writer for the new file
+        """
+        name = '{name_prefix}_{timestamp}_{suffix}.ndjson{extension}'.format(
+            name_prefix=name_prefix,
+            timestamp=time.strftime('%Y%m%dT%H%M%S'),
+            suffix=uuid.uuid4().hex[:8],
+            extension=COMPRESSIONEXTENSIONS[self.compression])
+        writer = SpoolWriter(self, name)
+        return writer
+
+    def archive(self, writer):
+        """ Move a closed spool file to its archive location
+
+        Args:
+            writer: (common.util.ResponseSpool.SpoolWriter) writer of the closed file
+
+        Returns:
+            handle: (common.util.ResponseSpool.SpoolHandle) reference to the archived file
+        """
+        if self.s3_bucket is None:
+            handle = SpoolHandle(writer.name, self.compression, writer.num_records, file_path=writer.file_path)
+        else:
+            s3_key = writer.name if not self.s3_prefix else self.s3_prefix.rstrip('/') + '/' + writer.name
+            self.s3_bucket.upload_file(writer.file_path, s3_key)
+            os.remove(writer.file_path)
+            handle = SpoolHandle(writer.name, self.compression, writer.num_records,
+                                 s3_bucket=self.s3_bucket, s3_key=s3_key)
+        log_msg = """
+                    method='common.util.ResponseSpool.ResponseSpool.archive'
+                    message='Archived raw responses'
+                    location='{location}'
+                    num_records='{num_records}'
+                    """.format(location=handle.get_location(),
+                               num_records=handle.num_records)
+        self.logging_obj.log(self.logging_obj.DEBUG, log_msg)
+        return handle
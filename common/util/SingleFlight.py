@@ -0,0 +1,84 @@
+#!/usr/bin/python
+
+""" Coalesce concurrent identical calls into one call
+
+Contains a class used for sharing one in-flight call between all threads that make the same call at the same time
+(e.g. several ETL tasks that ask an API for the same report). The first thread (the leader) makes the call.
+Threads that make the same call while it is in flight (the followers) wait for it and get its result.
+Calls that start after the in-flight call has finished make a new call.
+
+"""
+
+import threading
+
+
+class _Call:
+    """State of one in-flight call"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+        self.num_followers = 0
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key"""
+
+    def __init__(self):
+        """ Create a common.util.SingleFlight.SingleFlight object
+
+        Example:
+            from common.util.SingleFlight import SingleFlight
+            report_flights = SingleFlight()
+            (result, is_shared) = report_flights.do(('site_id', 'visit/district/a'), get_report, 'visit/district/a')
+        """
+        self.lock = threading.Lock()
+        self.calls = dict()
+        self.num_calls = 0
+        self.num_shared = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """ Call fn unless a call with the same key is in flight, in which case wait for that call
+
+        The result is the same object for the leader and all followers, so callers that modify it must copy it.
+        If the call raises an exception, the leader and all followers raise it.
+
+        Args:
+            key: (hashable) key of the call, e.g. the parameters of an API request
+            fn: (callable) function to call
+            *args: positional arguments of fn
+            **kwargs: keyword arguments of fn
+
+        Returns:
+            result: result of fn
+            is_shared: (bool) True if the result came from a call made by another thread
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = _Call()
+                self.calls[key] = call
+                self.num_calls = self.num_calls + 1
+                is_leader = True
+            else:
+                call.num_followers = call.num_followers + 1
+                self.num_shared = self.num_shared + 1
+                is_leader = False
+
+        if not is_leader:
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as ex:
+            call.exception = ex
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, call.num_followers > 0
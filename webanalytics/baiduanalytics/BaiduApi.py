@@ -9,22 +9,63 @@ Uses the Tongji API to access data from Baidu Analytics. The following APIs are
 
 from common.util.Logging import check_logger
 from common.util.ListMethods import is_in
+from common.util.SingleFlight import SingleFlight
+from common.util.RateLimiter import TokenBucketRateLimiter
+from common.util.DataFrameMethods import concat_dataframes, to_categorical
+from common.util.DateTimeMethods import add_days_to_date_str, get_curr_date_str
+from common.util.HttpConnectionPool import HttpConnectionPool, get_ssl_context
+from webanalytics.baiduanalytics.ReportSchemas import get_report_schema, get_dimension_dtype, get_metric_dtype
 
+from concurrent.futures import ThreadPoolExecutor
 import inspect
+import threading
+import time
 import json
-import urllib.request
 import urllib.parse
 import pandas as pd
-import os, ssl
+import os
 import numpy as np
 
 
+# Identical report requests made concurrently by any BaiduAnalytics objects in the process share one call
+_REPORT_FLIGHTS = SingleFlight()
+
+# Requests of all BaiduAnalytics objects that use the same account share one rate limit
+_ACCOUNT_RATE_LIMITERS = dict()
+_ACCOUNT_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def get_account_rate_limiter(base_url, username, requests_per_second):
+    """ Get the rate limiter of a Baidu Analytics account (created on first use)
+
+    Args:
+        base_url (str): URL of the getData method
+        username (str): Baidu Analytics username
+        requests_per_second (float): maximum number of requests per second of the account
+            (only used when the rate limiter is created)
+
+    Returns:
+        rate_limiter (common.util.RateLimiter.TokenBucketRateLimiter): rate limiter of the account
+    """
+    with _ACCOUNT_RATE_LIMITERS_LOCK:
+        rate_limiter = _ACCOUNT_RATE_LIMITERS.get((base_url, username))
+        if rate_limiter is None:
+            rate_limiter = TokenBucketRateLimiter(requests_per_second)
+            _ACCOUNT_RATE_LIMITERS[(base_url, username)] = rate_limiter
+    return rate_limiter
+
+
 class BaiduAnalytics:
     """Interact with Baidu Analytics (BA)"""
 
     BASE_URL = "https://api.baidu.com/json/tongji/v1/ReportService/getData"
+    MAXRESULTS = 10000  # the Tongji API returns at most 10,000 rows per request
+    MAXCONCURRENTREQUESTS = 4
+    DEFAULTREQUESTSPERSECOND = 5
+    FINALAFTERDAYS = 2  # days after which Baidu Analytics data no longer changes (cached reports never expire)
 
-    def __init__(self, site_id, username, password, token, logger=None):
+    def __init__(self, site_id, username, password, token, logger=None, base_url=None,
+                 requests_per_second=DEFAULTREQUESTSPERSECOND, verify_ssl=None, response_cache=None):
         """ Create a DataAccess.BaiduApi.BaiduAnalytics object
 
         Args:
@@ -40,21 +81,50 @@ class BaiduAnalytics:
                 In Baidu Analytics (translated page), go to Management > Other settings > Data export service.
                 Accept and open it and the token will display on the screen.
             logger (common.util.Logging.Logging): logger
+            base_url (str): URL of the getData method (defaults to BASE_URL)
+                e.g. the URL on a common.util.HttpCassette.CassetteServer to replay recorded traffic
+            requests_per_second (float): maximum number of requests per second of the account
+                (the limit is shared by all BaiduAnalytics objects of the same username and is set by the first one)
+            verify_ssl (bool): whether to verify the certificate of the API
+                (defaults to True only if the PYTHONHTTPSVERIFY environment variable is set).
+                The policy only applies to this object's connections, not to the rest of the process.
+            response_cache (common.util.DataFrameCache.DataFrameCache): on-disk cache for query_report results
+                Reports that end at least FINALAFTERDAYS days ago are cached forever and all other reports expire
+                after the cache's TTL.
         """
         self.site_id = site_id
         self.username = username
         self.password = password
         self.token = token
         self.logger = check_logger(logger)
+        self.response_cache = response_cache
+        if base_url is not None:
+            self.BASE_URL = base_url
+        self.rate_limiter = get_account_rate_limiter(self.BASE_URL, username, requests_per_second)
+        if verify_ssl is None:
+            verify_ssl = bool(os.environ.get('PYTHONHTTPSVERIFY', ''))
+        # keep-alive connections shared by all threads using this object
+        self.http_pool = HttpConnectionPool(self.BASE_URL,
+                                            ssl_context=get_ssl_context(verify_ssl),
+                                            max_idle_connections=self.MAXCONCURRENTREQUESTS)
+        url_parts = urllib.parse.urlsplit(self.BASE_URL)
+        self.request_path = url_parts.path + ('?' + url_parts.query if url_parts.query else '')
+
+    def get_report_api_response(self, report_method, start_date, end_date, metrics_cs_list, start_index=None,
+                                max_results=None, site_id=None):
+        """ Get a report (or one page of a report) from Baidu Analytics
 
-    def get_report_api_response(self, report_method, start_date, end_date, metrics_cs_list):
-        """ Get a report from Baidu Analytics
+        Identical requests (same site, user, report, dates and metrics) made concurrently in the process
+        share one in-flight call. Every caller gets its own shallow copy of the result.
 
         Args:
             method (str): usually corresponds to the report to be queried
             start_date (str): date of the format yyyymmdd
             end_date (str): date of the format yyyymmdd
             metrics_cs_list (str): metric names, comma-separated list
+            start_index (int): index of the first row to get (starting at 0)
+            max_results (int): maximum number of rows to get (at most MAXRESULTS)
+            site_id (str): ID of the site (defaults to the object's site_id)
 
         Returns:
             result (dict): result from Baidu Analytics API call
@@ -68,24 +138,69 @@ class BaiduAnalytics:
                                                  metrics_cs_list="pv_count,visitor_count,avg_visit_time")
 
         """
-        # Begin insecure statement
-        if (not os.environ.get('PYTHONHTTPSVERIFY', '') and
-                getattr(ssl, '_create_unverified_context', None)):
-            ssl._create_default_https_context = ssl._create_unverified_context
-        # End of insecure statement
+        if site_id is None:
+            site_id = self.site_id
+        flight_key = (self.BASE_URL, site_id, self.username, report_method, start_date, end_date, metrics_cs_list,
+                      start_index, max_results)
+        (result, is_shared) = _REPORT_FLIGHTS.do(flight_key,
+                                                 self.request_report_api_response,
+                                                 report_method,
+                                                 start_date,
+                                                 end_date,
+                                                 metrics_cs_list,
+                                                 start_index,
+                                                 max_results,
+                                                 site_id)
+        if is_shared:
+            log_msg = """method=DataAccess.BaiduApi.BaiduAnalytics.{method}
+                         message='Shared the result of an identical in-flight request'
+                         report_method='{report_method}'""".format(method=inspect.stack()[0][3],
+                                                                      report_method=report_method)
+            self.logger.log(self.logger.DEBUG, log_msg)
+        return dict(result)
+
+    def request_report_api_response(self, report_method, start_date, end_date, metrics_cs_list, start_index=None,
+                                    max_results=None, site_id=None):
+        """ Send a report request to Baidu Analytics within the account's rate limit (see get_report_api_response)
+
+        The request is sent on a keep-alive connection of the object's connection pool.
+
+        Args:
+            report_method (str): usually corresponds to the report to be queried
+            start_date (str): date of the format yyyymmdd
+            end_date (str): date of the format yyyymmdd
+            metrics_cs_list (str): metric names, comma-separated list
+            start_index (int): index of the first row to get (starting at 0)
+            max_results (int): maximum number of rows to get (at most MAXRESULTS)
+            site_id (str): ID of the site (defaults to the object's site_id)
+
+        Returns:
+            result (dict): result from Baidu Analytics API call
+        """
         body = {"header": {"account_type": 1,
                            "password": self.password,
                            "token": self.token,
                            "username": self.username},
-                "body": {"siteId": self.site_id,
+                "body": {"siteId": site_id if site_id is not None else self.site_id,
                          "method": report_method,
                          "start_date": start_date,
                          "end_date": end_date,
                          "metrics": metrics_cs_list}}
+        if start_index is not None:
+            body["body"]["start_index"] = start_index
+        if max_results is not None:
+            body["body"]["max_results"] = max_results
         data = bytes(json.dumps(body), 'utf8')
-        req = urllib.request.Request(self.BASE_URL, data)
-        response = urllib.request.urlopen(req)
-        the_page = response.read()
+        self.rate_limiter.acquire()
+        (status, headers, the_page) = self.http_pool.request('POST', self.request_path, body=data,
+                                                             headers={'Content-Type': 'application/json'})
+        if status != 200:
+            log_msg = """method=DataAccess.BaiduApi.BaiduAnalytics.{method}
+                         message='HTTP error getting data from Baidu Analytics'
+                         status='{status}'""".format(method=inspect.stack()[0][3],
+                                                       status=status)
+            self.logger.log(self.logger.ERROR, log_msg)
+            raise Exception(log_msg)
         result = json.loads(the_page.decode("utf-8"))
         if result['header']['status'] != 0:
             log_msg = """method=DataAccess.BaiduApi.BaiduAnalytics.{method} 
@@ -96,47 +211,216 @@ class BaiduAnalytics:
             raise Exception(log_msg)
         return result
 
+    def query_report(self, report_method, start_date, end_date, metrics_cs_list, max_results=None, site_id=None):
+        """ Get all pages of a report from Baidu Analytics as one DataFrame
+
+        The first page is requested on its own. Its total says how many rows the report has, so the start index
+        of every remaining page is known and the remaining pages are requested concurrently
+        (up to MAXCONCURRENTREQUESTS at a time, within the account's rate limit).
+        Each page is decoded with api_response_to_pandas (using the report method's schema, see ReportSchemas.py)
+        and the pages are concatenated in order.
+
+        If the object has a response_cache, the DataFrame is cached, keyed by site, report method, dates and metrics.
+        Reports without rows are cached as an empty DataFrame, so they are not requested again either.
+
+        Args:
+            report_method (str): usually corresponds to the report to be queried
+            start_date (str): date of the format yyyymmdd
+            end_date (str): date of the format yyyymmdd
+            metrics_cs_list (str): metric names, comma-separated list
+            max_results (int): number of rows per page (defaults to MAXRESULTS)
+            site_id (str): ID of the site (defaults to the object's site_id)
+
+        Returns:
+            api_responses (list of dict): result of each page's API call (empty if the data comes from the cache)
+            response_df (pandas.DataFrame): all rows of the report (None if the report has no rows)
+
+        Example:
+            from webanalytics.baiduanalytics.BaiduApi import BaiduAnalytics
+            baidu_api = BaiduAnalytics(site_id="12615124", username="un", password="pwd", token="32b43nk")
+            (api_responses, response_df) = baidu_api.query_report(report_method="visit/district/a",
+                                                                   start_date="20190101",
+                                                                   end_date="20190107",
+                                                                   metrics_cs_list="pv_count,visitor_count")
+        """
+        if max_results is None:
+            max_results = self.MAXRESULTS
+        if site_id is None:
+            site_id = self.site_id
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = {'api': 'BaiduTongjiGetData',
+                         'siteId': site_id,
+                         'method': report_method,
+                         'startDate': start_date,
+                         'endDate': end_date,
+                         'metrics': metrics_cs_list}
+            (response_df, cache_metadata) = self.response_cache.get(cache_key)
+            if response_df is not None:
+                return [], response_df if not response_df.empty else None
+
+        first_response = self.get_report_api_response(report_method, start_date, end_date, metrics_cs_list,
+                                                      start_index=0, max_results=max_results, site_id=site_id)
+        total = first_response["body"]["data"][0]["result"]["total"]
+        start_indexes = list(range(max_results, total, max_results))
+        api_responses = [first_response]
+        if start_indexes:
+            log_msg = """method=DataAccess.BaiduApi.BaiduAnalytics.{method}
+                         message='Getting the remaining pages concurrently'
+                         total='{total}'
+                         num_pages='{num_pages}'""".format(method=inspect.stack()[0][3],
+                                                             total=total,
+                                                             num_pages=len(start_indexes) + 1)
+            self.logger.log(self.logger.INFO, log_msg)
+            with ThreadPoolExecutor(max_workers=min(self.MAXCONCURRENTREQUESTS, len(start_indexes))) as executor:
+                api_responses.extend(executor.map(
+                    lambda start_index: self.get_report_api_response(report_method, start_date, end_date,
+                                                                     metrics_cs_list, start_index=start_index,
+                                                                     max_results=max_results, site_id=site_id),
+                    start_indexes))
+
+        response_dfs = [response_df for response_df in
+                        (self.api_response_to_pandas(api_response, report_method) for api_response in api_responses)
+                        if response_df is not None and not response_df.empty]
+        response_df = concat_dataframes(response_dfs) if response_dfs else None
+        if cache_key is not None:
+            self.response_cache.put(cache_key, response_df if response_df is not None else pd.DataFrame(),
+                                    is_final=self.is_report_final(end_date))
+        return api_responses, response_df
+
+    def is_report_final(self, end_date):
+        """ Check whether the data of a report can no longer change
+
+        Args:
+            end_date (str): last day of the report (yyyymmdd or yyyy-mm-dd)
+
+        Returns:
+            out (bool): True if the report ends at least FINALAFTERDAYS days ago
+        """
+        final_date = add_days_to_date_str(get_curr_date_str(), -self.FINALAFTERDAYS).replace('-', '')
+        out = end_date.replace('-', '') <= final_date
+        return out
+
+    def get_reports(self, report_requests, max_workers=MAXCONCURRENTREQUESTS):
+        """ Get several reports (of one or more sites of the account) from Baidu Analytics concurrently
+
+        The reports are queried with query_report on a pool of max_workers threads. All requests stay within the
+        account's rate limit. A report that fails does not stop the others: its exception is returned in failures.
+
+        Args:
+            report_requests (list of tuples): (site_id, report_method, start_date, end_date, metrics_cs_list)
+                of each report
+            max_workers (int): maximum number of reports queried at the same time
+
+        Returns:
+            response_dfs (dict): DataFrame of each report that succeeded (None if it has no rows),
+                keyed by its tuple in report_requests
+            timings (dict): seconds each report took (including failed ones), keyed by its tuple in report_requests
+            failures (dict): exception of each report that failed, keyed by its tuple in report_requests
+
+        Example:
+            from webanalytics.baiduanalytics.BaiduApi import BaiduAnalytics
+            baidu_api = BaiduAnalytics(site_id="12615124", username="un", password="pwd", token="32b43nk")
+            (response_dfs, timings, failures) = baidu_api.get_reports(
+                [("12615124", "visit/district/a", "20190101", "20190107", "pv_count,visitor_count"),
+                 ("12615124", "source/all/a", "20190101", "20190107", "pv_count,visitor_count"),
+                 ("13517893", "visit/district/a", "20190101", "20190107", "pv_count,visitor_count")])
+        """
+        response_dfs = dict()
+        timings = dict()
+        failures = dict()
+
+        def run_report_request(report_request):
+            (site_id, report_method, start_date, end_date, metrics_cs_list) = report_request
+            start_time = time.perf_counter()
+            try:
+                (api_responses, response_df) = self.query_report(report_method, start_date, end_date,
+                                                                 metrics_cs_list, site_id=site_id)
+                response_dfs[report_request] = response_df
+            except Exception as ex:
+                failures[report_request] = ex
+                log_msg = """method=DataAccess.BaiduApi.BaiduAnalytics.get_reports
+                             message='Failed to get report'
+                             site_id='{site_id}'
+                             report_method='{report_method}'
+                             start_date='{start_date}'
+                             end_date='{end_date}'
+                             error='{error}'""".format(site_id=site_id,
+                                                         report_method=report_method,
+                                                         start_date=start_date,
+                                                         end_date=end_date,
+                                                         error=ex)
+                self.logger.log(self.logger.ERROR, log_msg)
+            timings[report_request] = time.perf_counter() - start_time
+
+        report_requests = [tuple(report_request) for report_request in report_requests]
+        start_time = time.perf_counter()
+        if report_requests:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(report_requests)))) as executor:
+                list(executor.map(run_report_request, report_requests))
+        log_msg = """method=DataAccess.BaiduApi.BaiduAnalytics.{method}
+                     message='Got reports'
+                     num_reports='{num_reports}'
+                     num_failures='{num_failures}'
+                     seconds='{seconds:.3f}'""".format(method=inspect.stack()[0][3],
+                                                         num_reports=len(report_requests),
+                                                         num_failures=len(failures),
+                                                         seconds=time.perf_counter() - start_time)
+        self.logger.log(self.logger.INFO, log_msg)
+        return response_dfs, timings, failures
+
     def get_response_fields(self, api_response):
         response_fields = api_response["body"]["data"][0]["result"]["fields"]
         return response_fields
 
-    def api_response_to_pandas(self, api_response):
+    def api_response_to_pandas(self, api_response, report_method=None):
         """ Convert an API response to a Pandas DataFrame
 
+        The response is decoded column by column: each dimension column is built from items[0]
+        and each metric column from items[1]. Baidu reports missing metric values as '--';
+        these become NaN and the metric columns are cast to numeric dtypes in the same pass.
+        If the report method is given, the columns get the dtypes of its schema (see ReportSchemas.py):
+        categorical dimensions and nullable integer or float metrics.
+
         Args:
             api_response (dict):
+            report_method (str): report method of the response (if None, dimensions are object columns)
 
         Returns:
             response_df (pandas.DataFrame):
 
         """
-        if api_response["body"]["data"][0]["result"]["total"] > 0:
-            dimension_fields = list(api_response["body"]["data"][0]["result"]["items"][0][0][0].keys())
-            response_dimensions = api_response["body"]["data"][0]["result"]["items"][0]
-            response_metrics = api_response["body"]["data"][0]["result"]["items"][1]
+        result = api_response["body"]["data"][0]["result"]
+        if result["total"] > 0:
+            response_dimensions = result["items"][0]
+            response_metrics = result["items"][1]
+            dimension_fields = list(response_dimensions[0][0].keys())
             num_metrics = len(response_metrics[0])
             response_fields = self.get_response_fields(api_response)
             metric_fields = response_fields[-num_metrics:]
-            dimensions_list = []
+            schema = get_report_schema(report_method) if report_method is not None else None
+            columns_dict = dict()
             for field in dimension_fields:
-                field_iter_list = []
-                for item in response_dimensions:
-                    field_iter_list.append(item[0][field])
-                dimensions_list.append(field_iter_list)
-            iter = 0
-            response_list = []
-            for item in response_metrics:
-                item_json = {}
-                dim_items_iter = 0
-                for dim_items in dimensions_list:
-                    item_json[dimension_fields[dim_items_iter]] = dim_items[iter]
-                    dim_items_iter = dim_items_iter + 1
-                for metric_iter in range(num_metrics):
-                    item_json[metric_fields[metric_iter]] = item[metric_iter]
-                iter = iter + 1
-                response_list.append(item_json)
-            response_df = pd.DataFrame(response_list)
-            response_df = self.clean_pandas(response_df)
+                dimension_values = [item[0][field] for item in response_dimensions]
+                if schema is None:
+                    columns_dict[field] = np.array(dimension_values, dtype=object)
+                elif get_dimension_dtype(schema, field) == 'category':
+                    columns_dict[field] = to_categorical(dimension_values)
+                else:
+                    columns_dict[field] = pd.array(dimension_values, dtype=get_dimension_dtype(schema, field))
+            # one 2-D object array holds the metric values, so each column is a slice of it
+            metrics_array = np.array(response_metrics, dtype=object)
+            for metric_index, field in enumerate(metric_fields):
+                metric_array = self.metric_values_to_array(metrics_array[:, metric_index])
+                metric_dtype = get_metric_dtype(schema, field) if schema is not None else None
+                if metric_dtype is not None:
+                    try:
+                        metric_array = pd.array(metric_array, dtype=metric_dtype)
+                    except (TypeError, ValueError):
+                        # e.g. a count with fractional values: keep the inferred numeric dtype
+                        pass
+                columns_dict[field] = metric_array
+            response_df = pd.DataFrame(columns_dict)
         else:
             log_msg = """method=DataAccess.BaiduApi.BaiduAnalytics.{method} 
                          message='Zero records of data returned from Baidu Analytics' 
@@ -145,10 +429,48 @@ class BaiduAnalytics:
             response_df = None
         return response_df
 
+    def metric_values_to_array(self, metric_values):
+        """ Convert the values of a metric to a numeric array
+
+        Args:
+            metric_values (numpy.ndarray): values of one metric as returned by Baidu Analytics
+
+        Returns:
+            metric_array (numpy.ndarray): values of the metric with '--' replaced by NaN
+                (numeric unless the metric has values that are not numbers)
+
+        """
+        # copying the values makes the array contiguous, which makes the conversion several times faster
+        metric_array = np.array(metric_values, dtype=object)
+        metric_array[metric_array == '--'] = np.nan
+        try:
+            metric_array = pd.to_numeric(metric_array)
+        except (TypeError, ValueError):
+            pass
+        return metric_array
+
     def clean_pandas(self, response_df):
+        """ Replace the '--' Baidu Analytics uses for missing values with NaN
+
+        api_response_to_pandas already does this for every metric; this is kept for DataFrames built elsewhere.
+
+        Args:
+            response_df (pandas.DataFrame):
+
+        Returns:
+            response_df (pandas.DataFrame):
+
+        """
         if is_in('avg_visit_time', response_df.columns.values):
             response_df['avg_visit_time'] = response_df['avg_visit_time'].replace('--', np.nan)
         if is_in('bounce_ratio', response_df.columns.values):
             response_df['bounce_ratio'] = response_df['bounce_ratio'].replace('--', np.nan)
         return response_df
 
+    def close(self):
+        """ Close the object's idle keep-alive connections
+
+        Returns:
+
+        """
+        self.http_pool.close()
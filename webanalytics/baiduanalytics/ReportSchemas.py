@@ -0,0 +1,119 @@
+#!/usr/bin/python
+
+"""Output schemas of the Baidu Tongji report methods
+
+Maps each report method of the getData API to the dtypes of the columns BaiduAnalytics.api_response_to_pandas
+creates for it. Dimension values repeat a lot (districts, sources, pages), so dimensions are categorical.
+Counts are nullable integers and ratios, times and money are floats; '--' (no value) becomes a missing value.
+
+Report methods that are not registered get the default schema: categorical dimensions and the metric dtypes in
+METRICDTYPES. Metrics that are not in METRICDTYPES are converted to whichever numeric dtype fits their values.
+
+Report methods: https://tongji.baidu.com/api/manual/Chapter1/getData.html
+
+"""
+
+import threading
+
+
+DEFAULTDIMENSIONDTYPE = 'category'
+
+# dtype of each metric the getData API returns
+METRICDTYPES = {'pv_count': 'Int64',
+                'pv_ratio': 'float64',
+                'visit_count': 'Int64',
+                'visitor_count': 'Int64',
+                'new_visitor_count': 'Int64',
+                'new_visitor_ratio': 'float64',
+                'ip_count': 'Int64',
+                'bounce_ratio': 'float64',
+                'avg_visit_time': 'float64',
+                'avg_visit_pages': 'float64',
+                'average_stay_time': 'float64',
+                'exit_count': 'Int64',
+                'exit_ratio': 'float64',
+                'outward_count': 'Int64',
+                'visit1_count': 'Int64',
+                'visitor_ratio': 'float64',
+                'trans_count': 'Int64',
+                'trans_ratio': 'float64',
+                'avg_trans_cost': 'float64',
+                'income': 'float64',
+                'profit': 'float64',
+                'roi': 'float64',
+                'contri_pv': 'float64'}
+
+# dimensions: dtype of each dimension field (fields that are not listed get DEFAULTDIMENSIONDTYPE)
+# metrics: dtypes of metrics that differ from METRICDTYPES for this report method
+_REPORT_SCHEMAS = {'overview/getTimeTrendRpt': {'dimensions': {'name': 'category'}, 'metrics': {}},
+                   'trend/time/a': {'dimensions': {'name': 'category'}, 'metrics': {}},
+                   'source/all/a': {'dimensions': {'name': 'category'}, 'metrics': {}},
+                   'source/engine/a': {'dimensions': {'name': 'category'}, 'metrics': {}},
+                   'source/searchword/a': {'dimensions': {'name': 'category'}, 'metrics': {}},
+                   'source/link/a': {'dimensions': {'name': 'category'}, 'metrics': {}},
+                   'visit/toppage/a': {'dimensions': {'name': 'category'}, 'metrics': {}},
+                   'visit/landingpage/a': {'dimensions': {'name': 'category'}, 'metrics': {}},
+                   'visit/topdomain/a': {'dimensions': {'name': 'category'}, 'metrics': {}},
+                   'visit/district/a': {'dimensions': {'name': 'category', 'area': 'category'}, 'metrics': {}},
+                   'visit/world/a': {'dimensions': {'name': 'category', 'area': 'category'}, 'metrics': {}}}
+_REPORT_SCHEMAS_LOCK = threading.Lock()
+
+
+def register_report_schema(report_method, dimension_dtypes=None, metric_dtypes=None):
+    """ Register (or replace) the output schema of a report method
+
+    Args:
+        report_method (str): report method, e.g. visit/district/a
+        dimension_dtypes (dict): dtype of each dimension field (fields that are not listed are categorical)
+        metric_dtypes (dict): dtypes of metrics that differ from METRICDTYPES
+
+    Returns:
+
+    Example:
+        from webanalytics.baiduanalytics.ReportSchemas import register_report_schema
+        register_report_schema('visit/district/a', dimension_dtypes={'name': 'category', 'area': 'category'})
+    """
+    with _REPORT_SCHEMAS_LOCK:
+        _REPORT_SCHEMAS[report_method] = {'dimensions': dict(dimension_dtypes or {}),
+                                          'metrics': dict(metric_dtypes or {})}
+
+
+def get_report_schema(report_method):
+    """ Get the output schema of a report method
+
+    Args:
+        report_method (str): report method, e.g. visit/district/a
+
+    Returns:
+        schema (dict): dimensions (dtype of each dimension field) and metrics (dtypes that differ from METRICDTYPES)
+            (the default schema if the report method is not registered)
+    """
+    with _REPORT_SCHEMAS_LOCK:
+        schema = _REPORT_SCHEMAS.get(report_method, {'dimensions': {}, 'metrics': {}})
+        return {'dimensions': dict(schema['dimensions']), 'metrics': dict(schema['metrics'])}
+
+
+def get_dimension_dtype(schema, field):
+    """ Get the dtype of a dimension field
+
+    Args:
+        schema (dict): schema returned by get_report_schema
+        field (str): name of the dimension field
+
+    Returns:
+        dtype (str): dtype of the field
+    """
+    return schema['dimensions'].get(field, DEFAULTDIMENSIONDTYPE)
+
+
+def get_metric_dtype(schema, metric_name):
+    """ Get the dtype of a metric
+
+    Args:
+        schema (dict): schema returned by get_report_schema
+        metric_name (str): name of the metric, e.g. pv_count
+
+    Returns:
+        dtype (str): dtype of the metric (None if it is unknown)
+    """
+    return schema['metrics'].get(metric_name, METRICDTYPES.get(metric_name))
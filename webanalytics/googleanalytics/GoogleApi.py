@@ -12,35 +12,50 @@ Each of the classes allows you to utilize various Google APIs.
 
 from common.util.ConfigAppUtility import ConfigAppUtility
 from common.util.Logging import Logging
-from common.util.OSHelpers import get_log_filepath
-
+from common.util.OSHelpers import get_log_filepath, get_cache_dir
+from common.util.DataFrameCache import get_fingerprint
+from common.util.ListMethods import chunk_list
+from common.util.DataFrameMethods import to_categorical, unify_categories, concat_dataframes
+from common.util.ResponseSpool import ResponseSpool
+from common.util.SingleFlight import SingleFlight
+from common.util.DateTimeMethods import add_days_to_date_str, subtract_days
+from webanalytics.googleanalytics.RequestScheduler import get_current_retry_count
+
+from concurrent.futures import ThreadPoolExecutor
 import argparse
+import json
 import os
+import threading
+import time
 import pandas as pd
+import numpy as np
 import logging
 
 from googleapiclient import discovery
 from googleapiclient.http import build_http
 
 
-def init(api_name, api_version, api_settings_dict, discovery_filename=None):
-    """ Initialize a Google API service
+# Credentials and authorized service objects shared by the whole process (see init)
+_CREDENTIALS = dict()
+_SERVICES = dict()
+_SERVICES_LOCK = threading.RLock()
+# Authorized HTTP objects of each thread (see get_thread_http)
+_THREAD_HTTPS = threading.local()
+
+
+def get_credentials(api_name, api_settings_dict):
+    """ Get the OAuth 2.0 credentials for a Google API
+
+    The credentials are loaded (or the OAuth flow is run) only once per process for each API and client secrets file.
 
     Args:
         api_name: (str) name of the Google API
-        api_version: (str) version of the Google API
         api_settings_dict: (dict) dictionary with Google API settings
-        discovery_filename: (str) filename for pre-prepped Google API service
 
     Returns:
-        service: ()
+        credentials: (oauth2client.client.OAuth2Credentials) credentials for the API
 
     """
-
-    # Set logging levels so we don't log stuff that doesn't really matter
-    logging.getLogger("googleapiclient.discovery_cache").setLevel(logging.ERROR)
-    logging.getLogger("googleapiclient.discovery").setLevel(logging.WARNING)
-
     # Import libraries from oauth2client
     try:
         from oauth2client import client
@@ -50,18 +65,6 @@ def init(api_name, api_version, api_settings_dict, discovery_filename=None):
         raise ImportError(
             'GoogleApi requires oauth2client. Please install oauth2client and try again.')
 
-    # Set the Google API scope
-    scope = 'https://www.googleapis.com/auth/' + api_name
-
-    # Parser command-line arguments.
-    parent_parsers = [tools.argparser]
-    parent_parsers.extend([])
-    parser = argparse.ArgumentParser(
-        description=__doc__,
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        parents=parent_parsers)
-    flags = parser.parse_args([])
-
     # Name of a file containing the OAuth 2.0 information for this
     # application, including client_id and client_secret, which are found
     # on the API Access tab on the Google APIs
@@ -69,48 +72,186 @@ def init(api_name, api_version, api_settings_dict, discovery_filename=None):
     client_secrets = os.path.join(os.path.dirname(__file__),
                                   api_settings_dict['client_secrets_file'])
 
-    # Set up a Flow object to be used if we need to authenticate.
-    flow = client.flow_from_clientsecrets(client_secrets,
-                                          scope=scope,
-                                          message=tools.message_if_missing(client_secrets))
-
-    # Prepare credentials, and authorize HTTP object with them.
-    # If the credentials don't exist or are invalid run through the native client
-    # flow. The Storage object will ensure that if successful the good
-    # credentials will get written back to a file.
-    storage = file.Storage(api_name + '.dat')
-    credentials = storage.get()
-    if credentials is None or credentials.invalid:
-        credentials = tools.run_flow(flow, storage, flags)
-    http = credentials.authorize(http=build_http())
-
-    if discovery_filename is None:
-        # Construct a service object via the discovery service.
-        # print('Constructing a service object via the discovery service.')
-        service = discovery.build(api_name, api_version, http=http)
-    else:
-        # Construct a service object using a local discovery document file.
-        with open(discovery_filename) as discovery_file:
-            service = discovery.build_from_document(
-                discovery_file.read(),
-                base='https://www.googleapis.com/',
-                http=http)
+    with _SERVICES_LOCK:
+        credentials = _CREDENTIALS.get((api_name, client_secrets))
+        if credentials is not None and not credentials.invalid:
+            return credentials
+
+        # Set the Google API scope
+        scope = 'https://www.googleapis.com/auth/' + api_name
+
+        # Set up a Flow object to be used if we need to authenticate.
+        flow = client.flow_from_clientsecrets(client_secrets,
+                                              scope=scope,
+                                              message=tools.message_if_missing(client_secrets))
+
+        # Prepare credentials.
+        # If the credentials don't exist or are invalid run through the native client
+        # flow. The Storage object will ensure that if successful the good
+        # credentials will get written back to a file.
+        storage = file.Storage(api_name + '.dat')
+        credentials = storage.get()
+        if credentials is None or credentials.invalid:
+            # Parser command-line arguments.
+            parent_parsers = [tools.argparser]
+            parent_parsers.extend([])
+            parser = argparse.ArgumentParser(
+                description=__doc__,
+                formatter_class=argparse.RawDescriptionHelpFormatter,
+                parents=parent_parsers)
+            flags = parser.parse_args([])
+            credentials = tools.run_flow(flow, storage, flags)
+        _CREDENTIALS[(api_name, client_secrets)] = credentials
+    return credentials
+
+
+def get_discovery_document(api_name, api_version, http, discovery_dir=None):
+    """ Get the discovery document of a Google API
+
+    Looks for the document in discovery_dir (e.g. documents bundled with the application) and then in the
+    user's cache directory. The document is only fetched over the network if it is in neither place,
+    and it is then saved to the cache directory so later runs can build the service offline.
+
+    Args:
+        api_name: (str) name of the Google API
+        api_version: (str) version of the Google API
+        http: (httplib2.Http) HTTP object used to fetch the document if it is not cached
+        discovery_dir: (str) directory with bundled discovery documents named {api_name}.{api_version}.json
+
+    Returns:
+        discovery_document: (str) discovery document as JSON
+
+    """
+    discovery_document_filename = '{api}.{version}.json'.format(api=api_name, version=api_version)
+    cache_path = os.path.join(get_cache_dir('GoogleDiscovery'), discovery_document_filename)
+    for discovery_path in [os.path.join(discovery_dir, discovery_document_filename) if discovery_dir else None,
+                           cache_path]:
+        if discovery_path is not None and os.path.exists(discovery_path):
+            with open(discovery_path) as discovery_file:
+                return discovery_file.read()
+
+    # Fetch the document the same way discovery.build does and cache it
+    for discovery_uri in [discovery.DISCOVERY_URI, discovery.V2_DISCOVERY_URI]:
+        resp, content = http.request(discovery_uri.format(api=api_name, apiVersion=api_version))
+        if resp.status < 400:
+            discovery_document = content.decode('utf-8') if isinstance(content, bytes) else content
+            tmp_cache_path = cache_path + '.{pid}.tmp'.format(pid=os.getpid())
+            with open(tmp_cache_path, 'w') as discovery_file:
+                discovery_file.write(discovery_document)
+            os.replace(tmp_cache_path, cache_path)
+            return discovery_document
+    raise discovery.UnknownApiNameOrVersion(
+        'name: {api}  version: {version}'.format(api=api_name, version=api_version))
+
+
+def get_thread_http(credentials):
+    """ Get an HTTP object authorized with credentials that belongs to the current thread
+
+    httplib2.Http objects are not thread-safe, so every thread that sends requests gets its own.
+
+    Args:
+        credentials: (oauth2client.client.OAuth2Credentials) credentials for the API
+
+    Returns:
+        http: (httplib2.Http) authorized HTTP object
+    """
+    thread_https = getattr(_THREAD_HTTPS, 'https', None)
+    if thread_https is None:
+        thread_https = _THREAD_HTTPS.https = dict()
+    http = thread_https.get(id(credentials))
+    if http is None:
+        http = thread_https[id(credentials)] = credentials.authorize(http=build_http())
+    return http
+
+
+def init(api_name, api_version, api_settings_dict, discovery_filename=None, http=None):
+    """ Initialize a Google API service
+
+    Service objects are built from cached discovery documents (see get_discovery_document) and are shared
+    by the whole process: calling init again for the same API, version and client secrets returns the same service.
+
+    If http is given, the service sends its requests with it instead of an HTTP object authorized with the
+    API's credentials, e.g. to record or replay traffic with common.util.HttpCassette.
+
+    Args:
+        api_name: (str) name of the Google API
+        api_version: (str) version of the Google API
+        api_settings_dict: (dict) dictionary with Google API settings
+            discovery_dir (optional): directory with bundled discovery documents
+        discovery_filename: (str) filename for pre-prepped Google API service
+        http: (httplib2.Http) HTTP object to send the requests with, e.g. common.util.HttpCassette.ReplayHttp
+
+    Returns:
+        service: (googleapiclient.discovery.Resource) authorized service object
+
+    """
+
+    # Set logging levels so we don't log stuff that doesn't really matter
+    logging.getLogger("googleapiclient.discovery_cache").setLevel(logging.ERROR)
+    logging.getLogger("googleapiclient.discovery").setLevel(logging.WARNING)
+
+    service_key = (api_name, api_version, api_settings_dict['client_secrets_file'], discovery_filename,
+                   id(http) if http is not None else None)
+    with _SERVICES_LOCK:
+        service = _SERVICES.get(service_key)
+        if service is not None:
+            return service
+
+        if http is None:
+            # Authorize HTTP object with the credentials.
+            credentials = get_credentials(api_name, api_settings_dict)
+            http = credentials.authorize(http=build_http())
+
+        if discovery_filename is None:
+            # Construct a service object using a cached discovery document.
+            discovery_document = get_discovery_document(api_name, api_version, http,
+                                                        api_settings_dict.get('discovery_dir'))
+            service = discovery.build_from_document(discovery_document, http=http)
+        else:
+            # Construct a service object using a local discovery document file.
+            with open(discovery_filename) as discovery_file:
+                service = discovery.build_from_document(
+                    discovery_file.read(),
+                    base='https://www.googleapis.com/',
+                    http=http)
+        _SERVICES[service_key] = service
     return service
 
 
+# Account summaries indexes shared by all GoogleAnalytics objects in the process (see get_account_summaries_index)
+_ACCOUNT_SUMMARIES_INDEXES = dict()
+_ACCOUNT_SUMMARIES_LOCK = threading.Lock()
+# Identical GA API v4 queries made concurrently by any GoogleAnalytics objects in the process share one call
+_QUERY_FLIGHTS = SingleFlight()
+
+
 class GoogleAnalytics:
     """Interact with Google Analytics (GA)"""
 
     MAXRETURNEDROWS = 100000  # GA API v4 will never return more than 100,000 rows at once
     MAXMETRICS = 10  # GA API v4 will only allow you to pull 10 metrics in one report
     MAXDIMENSIONS = 9  # GA API v4 will only allow you to pull 7 dimensions in one report
-
-    def __init__(self, account_name=None, property_name=None, profile_name=None, ga_settings=None, logging_obj=None):
+    MAXREPORTREQUESTS = 5  # GA API v4 will only allow you to send 5 report requests in one batchGet call
+    # dtypes of the GA API v4 metric types (https://developers.google.com/analytics/devguides/reporting/core/v4/rest/v4/reports/batchGet#MetricType)
+    METRICTYPEDTYPES = {'INTEGER': 'int64',
+                        'FLOAT': 'float64',
+                        'CURRENCY': 'float64',
+                        'PERCENT': 'float64',
+                        'TIME': 'float64'}
+    ACCOUNTSUMMARIESTTLSECONDS = 24 * 60 * 60  # the account/property/view index is rebuilt once a day
+    MAXCONCURRENTREQUESTS = 10  # GA API v4 allows 10 concurrent requests per view
+    MAXRESULTSV3 = 10000  # GA API v3 will never return more than 10,000 rows at once
+    RAWRESPONSESMODES = ('memory', 'drop', 'spool')  # what query_reporting_api_v4 does with the raw responses
+
+    def __init__(self, account_name=None, property_name=None, profile_name=None, ga_settings=None, logging_obj=None,
+                 response_cache=None, scheduler=None, request_ledger=None, response_spool=None, http=None):
         """ Create a GoogleAnalytics object
 
         Initializes a GoogleAnalytics object,
         creates a service to use for interacting with your Google Analytics account,
         and sets the profile ID if account_name, property_name and profile_name are provided.
+        The profile ID is looked up in the cached account summaries index, so no Management API calls are made
+        for a view that is already in the index.
 
         Args:
             account_name (str): name of the GA account
@@ -118,6 +259,16 @@ class GoogleAnalytics:
             profile_name (str): name of the GA profile on the GA property of the GA account
             ga_settings (dict): settings for Google Analytics
             logging_obj: (common.Util.Logging.Logging) initialized logging object
+            response_cache: (common.util.DataFrameCache.DataFrameCache) on-disk cache for query results
+                Golden results are cached forever and all other results expire after the cache's TTL.
+            scheduler: (webanalytics.googleanalytics.RequestScheduler.RequestScheduler) scheduler used to run
+                report tasks concurrently. Every HTTP request is sent through it (see execute_request).
+            request_ledger: (webanalytics.googleanalytics.RequestLedger.RequestLedger) ledger in which the
+                data quality and latency metadata of every page of a GA API v4 report is recorded
+            response_spool: (common.util.ResponseSpool.ResponseSpool) archive for raw GA API v4 responses
+                (see query_reporting_api_v4)
+            http: (httplib2.Http) HTTP object to send all requests with instead of HTTP objects authorized with
+                the GA credentials, e.g. common.util.HttpCassette.RecordingHttp or ReplayHttp (see init)
 
         Example:
             ga = GoogleAnalytics(account_name="www.usana.com",
@@ -131,8 +282,15 @@ class GoogleAnalytics:
         config_app_util = ConfigAppUtility()
         if ga_settings is None:
             ga_settings = config_app_util.get_settings_dict('GA')
-        self.service_old = init('analytics', 'v3', ga_settings)
-        self.service = init('analytics', 'v4', ga_settings)
+        self.ga_settings = ga_settings
+        self.service_old = init('analytics', 'v3', ga_settings, http=http)
+        self.service = init('analytics', 'v4', ga_settings, http=http)
+        # With a custom HTTP object, requests are sent with the services' HTTP object (see execute_request)
+        self.credentials = get_credentials('analytics', ga_settings) if http is None else None
+        self.response_cache = response_cache
+        self.scheduler = scheduler
+        self.request_ledger = request_ledger
+        self.response_spool = response_spool
         self.profile_id = None
 
         if account_name is not None and property_name is not None and profile_name is not None:
@@ -143,27 +301,96 @@ class GoogleAnalytics:
             log_msg = "message='The profile ID has not been set. This needs to be set prior to executing any queries.'"
             self.logging_obj.log(self.logging_obj.WARN, log_msg)
 
-    def get_account_by_name(self, account_name):
-        """ Query the Accounts collection to get an account by its name
+    def get_account_summaries_index(self, refresh=False):
+        """ Get an index of the names and IDs of all accounts, properties and views (aka profiles) the user can access
+
+        The index is built from the Management API accountSummaries.list method, which returns the whole
+        account/property/view tree in one call (per 1000 accounts).
+        It is cached in memory (shared by all GoogleAnalytics objects in the process) and in a JSON file
+        in the user's cache directory (shared by all processes). The cache expires after ACCOUNTSUMMARIESTTLSECONDS.
+
+        Args:
+            refresh: (bool) ignore the cached index and rebuild it from the Management API
+
+        Returns:
+            index: (dict) account names mapped to {'id', 'name', 'webProperties'} where webProperties maps
+                property names to {'id', 'name', 'profiles'} and profiles maps view names to {'id', 'name', 'type'}
+
+        """
+        cache_path = os.path.join(get_cache_dir('GoogleAnalytics'),
+                                  'account_summaries_{fingerprint}.json'.format(
+                                      fingerprint=get_fingerprint(self.ga_settings.get('client_secrets_file'))[:16]))
+        with _ACCOUNT_SUMMARIES_LOCK:
+            if not refresh:
+                # Check the in-process cache first, then the file that is shared between processes
+                (created_at, index) = _ACCOUNT_SUMMARIES_INDEXES.get(cache_path, (0, None))
+                if index is None:
+                    try:
+                        with open(cache_path) as cache_file:
+                            cache_dict = json.load(cache_file)
+                        (created_at, index) = (cache_dict['created_at'], cache_dict['index'])
+                    except (OSError, ValueError, KeyError):
+                        index = None
+                if index is not None and time.time() - created_at < self.ACCOUNTSUMMARIESTTLSECONDS:
+                    _ACCOUNT_SUMMARIES_INDEXES[cache_path] = (created_at, index)
+                    return index
+
+            log_msg = """
+                    method='DataAccess.GoogleApi.GoogleAnalytics.get_account_summaries_index'
+                    message='Building the account summaries index from the Management API'
+                    """
+            self.logging_obj.log(self.logging_obj.INFO, log_msg)
+            index = dict()
+            start_index = 1
+            while start_index is not None:
+                account_summaries = self.execute_request(self.service_old.management().accountSummaries().list(
+                    start_index=start_index))
+                for account in account_summaries.get('items', []):
+                    webproperties = dict()
+                    for webproperty in account.get('webProperties', []):
+                        profiles = dict()
+                        for profile in webproperty.get('profiles', []):
+                            profiles[profile['name']] = {'id': profile['id'],
+                                                         'name': profile['name'],
+                                                         'type': profile.get('type')}
+                        webproperties[webproperty['name']] = {'id': webproperty['id'],
+                                                              'name': webproperty['name'],
+                                                              'profiles': profiles}
+                    index[account['name']] = {'id': account['id'],
+                                              'name': account['name'],
+                                              'webProperties': webproperties}
+                if account_summaries.get('nextLink'):
+                    start_index = account_summaries['startIndex'] + account_summaries['itemsPerPage']
+                else:
+                    start_index = None
+
+            created_at = time.time()
+            _ACCOUNT_SUMMARIES_INDEXES[cache_path] = (created_at, index)
+            tmp_cache_path = cache_path + '.{pid}.tmp'.format(pid=os.getpid())
+            with open(tmp_cache_path, 'w') as cache_file:
+                json.dump({'created_at': created_at, 'index': index}, cache_file)
+            os.replace(tmp_cache_path, cache_path)
+        return index
+
+    def get_account_by_name(self, account_name, refresh=False):
+        """ Get an account by its name
 
         One user may have access to multiple Google Analytics accounts.
         This method returns an account object that corresponds to the desired account based on the account name.
+        The account is looked up in the account summaries index (see get_account_summaries_index).
 
         Args:
             account_name: (string) name of the account
+            refresh: (bool) rebuild the account summaries index before looking up the account
 
         Returns:
             account: (dict) account from GA
 
         Example:
-            account = ga.getAccountByName("www.usana.com")
+            account = ga.get_account_by_name("www.usana.com")
 
         """
-        accounts = self.service_old.management().accounts().list().execute()
-
-        account = None
-        if accounts.get('items'):
-            account = next(acnt for acnt in accounts.get('items') if acnt["name"] == account_name)
+        account = self.get_account_summaries_index(refresh).get(account_name)
 
         if account is None:
             log_msg = "The account named " + account_name + " does not exist!"
@@ -171,8 +398,8 @@ class GoogleAnalytics:
 
         return account
 
-    def get_webproperty_by_name(self, account_name, property_name):
-        """ Query the Webproperties collection to get a property by its name
+    def get_webproperty_by_name(self, account_name, property_name, refresh=False):
+        """ Get a property by its name
 
         Each Google Analytics account can have multiple properties.
         The following link explains how to set up a property on an account:
@@ -181,19 +408,18 @@ class GoogleAnalytics:
         Args:
             account_name: (string) name of the GA account
             property_name: (string) name of the property on a GA account
+            refresh: (bool) rebuild the account summaries index before looking up the property
 
         Returns:
             webproperty:
             account: (dict) account from GA
 
         """
-        account = self.get_account_by_name(account_name)
-        webproperties = self.service_old.management().webproperties().list(
-            accountId=account['id']).execute()
+        account = self.get_account_by_name(account_name, refresh)
 
         webproperty = None
-        if webproperties.get('items'):
-            webproperty = next(wp for wp in webproperties.get('items') if wp["name"] == property_name)
+        if account is not None:
+            webproperty = account['webProperties'].get(property_name)
 
         if webproperty is None:
             log_msg = "The property named " + property_name + " does not exist!"
@@ -202,11 +428,12 @@ class GoogleAnalytics:
         return (webproperty, account)
 
     def get_profile_by_name(self, account_name, property_name, profile_name):
-        """Traverses Management API to return the profile based on names of the account, property and profile
+        """Uses the account summaries index to return the profile based on names of the account, property and profile
 
-        Query the Profile collection to get an profile by its name.
         Webproperties can have multiple views (aka profiles).
         This method returns an object for a profile based on its name.
+        If the profile is not in the cached index (e.g. the view was created recently),
+        the index is rebuilt from the Management API once before giving up.
 
         Args:
             account_name: (string) name of the GA account
@@ -219,35 +446,99 @@ class GoogleAnalytics:
             account: (dict) account from GA
 
         Usage Example:
+            (profile, property, account) = ga.get_profile_by_name("www.usana.com", "usana.com", "*www.usana.com all")
+
+        """
+        profile = None
+        for refresh in [False, True]:
+            (property, account) = self.get_webproperty_by_name(account_name, property_name, refresh)
+            if property is not None:
+                profile = property['profiles'].get(profile_name)
+            if profile is not None:
+                break
 
+        if profile is None:
+            log_msg = """
+                     method='DataAccess.GoogleApi.GoogleAnalytics.get_profile_by_name'
+                     message='Error trying to find the desired view'
+                     account_name='{account_name}'
+                     property_name='{property_name}'
+                     profile_name='{view_name}'""".format(account_name=account_name,
+                                                          property_name=property_name,
+                                                          view_name=profile_name)
+            self.logging_obj.log(self.logging_obj.ERROR, log_msg)
+            raise Exception(log_msg)
+
+        return (profile, property, account)
+
+    def execute_request(self, request):
+        """ Execute a Google API request
+
+        If the object has a scheduler, the request is sent through it (rate limited and retried on its own).
 
+        Args:
+            request: (googleapiclient.http.HttpRequest) request to execute
+
+        Returns:
+            response: (dict) response from the Google API
         """
+        if self.scheduler is None:
+            return self.send_request(request)
+        return self.scheduler.execute(self.profile_id, self.send_request, request)
 
-        (property, account) = self.get_webproperty_by_name(account_name, property_name)
+    def send_request(self, request):
+        """ Send a Google API request once
 
-        profiles = self.service_old.management().profiles().list(
-            accountId=account['id'],
-            webPropertyId=property['id']).execute()
+        httplib2.Http objects are not thread-safe, so the request is sent with an authorized HTTP object
+        that belongs to the current thread (see get_thread_http).
 
-        profile = None
-        if profiles.get('items'):
-            try:
-                profile = next(p for p in profiles.get('items') if p["name"] == profile_name)
-            except Exception as ex:
-                self.logging_obj.log(self.logging_obj.ERROR,
-                                     """
-                                     method='DataAccess.GoogleApi.GoogleAnalytics.get_profile_by_name'
-                                     message='Error trying to find the desired view'
-                                     profile_name='{view_name}'
-                                     exception_message='{ex_msg}'""".format(ex_msg=str(ex),
-                                                                            view_name=profile_name))
-                raise ex
+        Args:
+            request: (googleapiclient.http.HttpRequest) request to send
 
-        if profile is None:
-            log_msg = "The profile named " + profile_name + " does not exist!"
-            print(log_msg)
+        Returns:
+            response: (dict) response from the Google API
+        """
+        if self.credentials is None:
+            return request.execute()
+        response = request.execute(http=get_thread_http(self.credentials))
+        return response
 
-        return (profile, property, account)
+    def execute_measured_request(self, request):
+        """ Execute a Google API request and measure its latency and response size
+
+        The size of the response body is captured by wrapping the request's postproc method,
+        which googleapiclient calls with the raw content of the response.
+        If the object has a scheduler, the latency is the one of the successful attempt (without rate limiting
+        waits and retry backoffs).
+
+        Args:
+            request: (googleapiclient.http.HttpRequest) request to execute
+
+        Returns:
+            response: (dict) response from the Google API
+            latency_seconds: (float) seconds taken to execute the request
+            response_bytes: (int) size of the response body or None if it could not be measured
+            retry_count: (int) number of times the request was retried by the scheduler
+        """
+        response_sizes = []
+        postproc = getattr(request, 'postproc', None)
+        if postproc is not None:
+            def measured_postproc(resp, content):
+                response_sizes.append(len(content or b''))
+                return postproc(resp, content)
+            request.postproc = measured_postproc
+
+        def send_measured_request():
+            start_time = time.perf_counter()
+            response_i = self.send_request(request)
+            return response_i, time.perf_counter() - start_time, get_current_retry_count()
+
+        if self.scheduler is None:
+            (response, latency_seconds, retry_count) = send_measured_request()
+        else:
+            (response, latency_seconds, retry_count) = self.scheduler.execute(self.profile_id, send_measured_request)
+        response_bytes = response_sizes[-1] if response_sizes else None
+        return response, latency_seconds, response_bytes, retry_count
 
     def get_profile_id(self, profile):
         """ Gets the profile ID given a profile
@@ -280,7 +571,10 @@ class GoogleAnalytics:
                                dimensions_names_cs_list,
                                filters_names=None,
                                sort_names=None,
-                               start_index=None):
+                               start_index=None,
+                               sampling_level=None,
+                               max_results=None,
+                               auto_paginate=False):
         """ Query Google Analytics Core Reporting API (v3)
 
         Link to the Developer Guide for the Core Reporting API: https://developers.google.com/analytics/devguides/reporting/core/v3/coreDevguide
@@ -289,6 +583,10 @@ class GoogleAnalytics:
         Complete list of query parameters (Core Reporting API - Reference Guide): https://developers.google.com/analytics/devguides/reporting/core/v3/reference
         Complete list of dimensions & metrics: https://developers.google.com/analytics/devguides/reporting/core/dimsmets
 
+        By default one page is returned and the columns are strings.
+        If auto_paginate is True, all pages are returned in one dataframe with typed columns
+        (see query_all_pages_reporting_api_v3).
+
         Args:
             start_date: (str) start date
             end_date: (str) end date
@@ -297,14 +595,153 @@ class GoogleAnalytics:
             sort_names: (str)
             filters_names: (str)
             start_index: (str)
+            sampling_level: (str) DEFAULT, FASTER or HIGHER_PRECISION
+            max_results: (int) maximum number of rows per page (GA allows up to MAXRESULTSV3)
+            auto_paginate: (bool) get all pages starting at start_index
 
         Returns:
-            data_dict: (dict) Data dictionary returned by GA
+            data_dict: (dict) Data dictionary returned by GA (empty if the data comes from the response cache).
+                If auto_paginate is True, the responses of all pages keyed by dataset{i}.
             data_df: (pandas.DataFrame) Data returned by GA as a dataframe
 
         """
-        # Get response from GA
-        data_dict = self.service_old.data().ga().get(
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = {'api': 'v3',
+                         'viewId': self.profile_id,
+                         'startDate': start_date,
+                         'endDate': end_date,
+                         'metrics': metrics_names_cs_list,
+                         'dimensions': dimensions_names_cs_list,
+                         'filters': filters_names,
+                         'sort': sort_names,
+                         'startIndex': start_index,
+                         'samplingLevel': sampling_level,
+                         'maxResults': max_results,
+                         'autoPaginate': auto_paginate}
+            data_df = self.get_cached_response(cache_key)
+            if data_df is not None:
+                return dict(), data_df
+
+        if auto_paginate:
+            (data_dict, data_df) = self.query_all_pages_reporting_api_v3(start_date,
+                                                                         end_date,
+                                                                         metrics_names_cs_list,
+                                                                         dimensions_names_cs_list,
+                                                                         filters_names,
+                                                                         sort_names,
+                                                                         start_index,
+                                                                         sampling_level,
+                                                                         max_results)
+        else:
+            # Get response from GA
+            data_dict = self.get_report_page_v3(start_date,
+                                                end_date,
+                                                metrics_names_cs_list,
+                                                dimensions_names_cs_list,
+                                                filters_names,
+                                                sort_names,
+                                                start_index,
+                                                sampling_level,
+                                                max_results)
+            # Create dataframe from GA's dictionary response
+            data_df = self.api_response_to_dataframe_v3([data_dict])
+
+        if cache_key is not None:
+            # GA API v3 does not say whether the data is golden, so these entries always expire after the TTL
+            self.response_cache.put(cache_key, data_df, is_final=False)
+        return (data_dict, data_df)
+
+    def query_all_pages_reporting_api_v3(self,
+                                         start_date,
+                                         end_date,
+                                         metrics_names_cs_list,
+                                         dimensions_names_cs_list,
+                                         filters_names=None,
+                                         sort_names=None,
+                                         start_index=None,
+                                         sampling_level=None,
+                                         max_results=None):
+        """ Get all pages of a GA Core Reporting API (v3) query
+
+        GA API v3 reports totalResults on the first page, so the start index of every remaining page is known
+        after the first request. The remaining pages are requested concurrently (see map_requests) and all rows
+        are put into one dataframe whose columns are typed from columnHeaders[].dataType.
+
+        Args:
+            start_date: (str) start date
+            end_date: (str) end date
+            metrics_names_cs_list: (str) metric names, comma-separated list
+            dimensions_names_cs_list: (str) dimension names, comma-separated list
+            filters_names: (str)
+            sort_names: (str)
+            start_index: (int) index of the first row to get (starting at 1)
+            sampling_level: (str) DEFAULT, FASTER or HIGHER_PRECISION
+            max_results: (int) maximum number of rows per page (defaults to MAXRESULTSV3)
+
+        Returns:
+            data_dict: (dict) responses returned by GA keyed by dataset{i}
+            data_df: (pandas.DataFrame) Data returned by GA as a dataframe
+        """
+        if start_index is None:
+            start_index = 1
+        if max_results is None:
+            max_results = self.MAXRESULTSV3
+        first_page_dict = self.get_report_page_v3(start_date, end_date, metrics_names_cs_list,
+                                                  dimensions_names_cs_list, filters_names, sort_names,
+                                                  start_index, sampling_level, max_results)
+
+        # GA may return fewer rows per page than max_results, so step by the page size it actually used
+        items_per_page = first_page_dict.get('itemsPerPage') or max_results
+        start_indexes = list(range(int(start_index) + items_per_page, first_page_dict.get('totalResults', 0) + 1,
+                                   items_per_page))
+        if start_indexes:
+            log_msg = """
+                    method='DataAccess.GoogleApi.GoogleAnalytics.query_all_pages_reporting_api_v3'
+                    message='Getting the remaining pages concurrently'
+                    total_results='{total_results}'
+                    num_pages='{num_pages}'
+                    """.format(total_results=first_page_dict.get('totalResults'),
+                               num_pages=len(start_indexes) + 1)
+            self.logging_obj.log(self.logging_obj.INFO, log_msg)
+        pages_list = [first_page_dict] + self.map_requests(
+            self.get_report_page_v3,
+            [(start_date, end_date, metrics_names_cs_list, dimensions_names_cs_list, filters_names, sort_names,
+              page_start_index, sampling_level, max_results) for page_start_index in start_indexes])
+
+        data_dict = dict()
+        for i, page_dict in enumerate(pages_list):
+            data_dict["dataset{i}".format(i=i)] = page_dict
+        data_df = self.api_response_to_dataframe_v3(pages_list, typed=True)
+        return data_dict, data_df
+
+    def get_report_page_v3(self,
+                           start_date,
+                           end_date,
+                           metrics_names_cs_list,
+                           dimensions_names_cs_list,
+                           filters_names=None,
+                           sort_names=None,
+                           start_index=None,
+                           sampling_level=None,
+                           max_results=None):
+        """ Get one page of a GA Core Reporting API (v3) query
+
+        Args:
+            start_date: (str) start date
+            end_date: (str) end date
+            metrics_names_cs_list: (str) metric names, comma-separated list
+            dimensions_names_cs_list: (str) dimension names, comma-separated list
+            filters_names: (str)
+            sort_names: (str)
+            start_index: (int) index of the first row to get (starting at 1)
+            sampling_level: (str) DEFAULT, FASTER or HIGHER_PRECISION
+            max_results: (int) maximum number of rows in the page
+
+        Returns:
+            data_dict: (dict) Data dictionary returned by GA
+        """
+        data_dict = self.execute_request(self.service_old.data().ga().get(
             ids='ga:' + self.profile_id,
             start_date=start_date,
             end_date=end_date,
@@ -312,29 +749,206 @@ class GoogleAnalytics:
             dimensions=dimensions_names_cs_list,
             sort=sort_names,
             filters=filters_names,
-            start_index=start_index
-        ).execute()
-        # Create dataframe from GA's dictionary response
-        data_df = pd.DataFrame(data_dict.get('rows'))
-        column_headers = []
-        for header in data_dict.get('columnHeaders'):
-            column_headers.append(header.get('name'))
-        data_df.columns = column_headers
-        return (data_dict, data_df)
+            start_index=start_index,
+            max_results=max_results,
+            samplingLevel=sampling_level
+        ))
+        return data_dict
+
+    def api_response_to_dataframe_v3(self, pages_list, typed=False):
+        """ Convert the pages of a GA API v3 response to one dataframe
+
+        Args:
+            pages_list: (list of dict) pages returned by GA
+            typed: (bool) convert the columns to the dtype of their dataType (see METRICTYPEDTYPES)
+                instead of keeping every column as strings
+
+        Returns:
+            data_df: (pandas.DataFrame) Data returned by GA as a dataframe
+        """
+        column_headers = pages_list[0].get('columnHeaders', [])
+        rows = [row for page_dict in pages_list for row in page_dict.get('rows', [])]
+        columns_dict = dict()
+        # transpose the rows into one tuple of values per column
+        columns = list(zip(*rows)) or [()] * len(column_headers)
+        for header, values in zip(column_headers, columns):
+            if typed and header.get('dataType') in self.METRICTYPEDTYPES:
+                columns_dict[header.get('name')] = self.metric_values_to_array_v4(values, header.get('dataType'))
+            else:
+                columns_dict[header.get('name')] = np.array(values, dtype=object)
+        data_df = pd.DataFrame(columns_dict)
+        return data_df
 
     def query_reporting_api_v4(self,
                                start_date,
                                end_date,
                                metrics_names_cs_list,
                                dimensions_names_cs_list,
-                               dimension_filters_dict=None):
+                               dimension_filters_dict=None,
+                               sampling_level=None,
+                               avoid_sampling=False,
+                               raw_responses='memory'):
         """ Query Google Analytics Core Reporting API (v4)
 
         Link to Developer Guide batchGet method: https://developers.google.com/analytics/devguides/reporting/core/v4/rest/v4/reports/batchGet
         Dimensions & Metrics Explorer: https://developers.google.com/analytics/devguides/reporting/core/dimsmets
         Limits & Quotas: https://developers.google.com/analytics/devguides/reporting/core/v4/limits-quotas
 
-        GA only allows you to pull 10 metrics and 7 dimensions at once.
+        GA only allows you to pull 10 metrics and 9 dimensions in one report.
+        If more than 10 metrics are requested, the metrics are split into groups of MAXMETRICS.
+        Each group is sent as its own report request and up to MAXREPORTREQUESTS report requests
+        are packed into one batchGet call. The reports are merged back together on the dimensions.
+
+        All pages are collected from iter_reporting_api_v4 and concatenated once for each report.
+        Use iter_reporting_api_v4 directly to process one page at a time.
+        If the object has a scheduler, the batches of report requests are sent concurrently.
+
+        If the object has a response_cache, the merged dataframe is cached.
+        Spool queries always call GA (the cache holds no raw responses to spool) but still cache the dataframe.
+        Golden data is cached forever and all other data expires after the cache's TTL.
+        Whether all of the data is golden is also kept in data_df.attrs['isDataGolden'] (for cached data too),
+        e.g. for deciding whether a day needs to be extracted again.
+
+        Identical queries (same view and parameters) made concurrently in the process share one in-flight query.
+        Every caller gets its own shallow copy of the dataframe, so renaming its columns does not affect the others.
+
+        If avoid_sampling is True, sampled date ranges are split in half and queried again (see query_unsampled_reporting_api_v4).
+
+        raw_responses decides what happens to the raw response of each batchGet call once it has been decoded:
+            memory: all raw responses are returned in reports_dict
+            drop: the rows are dropped from the raw responses, so reports_dict only holds their metadata
+                (column headers, golden and sampling status, row counts)
+            spool: each raw response is written to a compressed NDJSON file of the object's response_spool
+                (a ResponseSpool in the user's cache directory if it has none) as soon as it arrives,
+                and a handle to the file is returned instead of reports_dict
+        With drop and spool only about one page of raw rows is held in memory at a time.
+
+        Args:
+            start_date: (str) start date
+            end_date: (str) end date
+            metrics_names_cs_list: (str) metric names, comma-separated list
+            dimensions_names_cs_list: (str) dimension names, comma-separated list
+            dimension_filters_dict: (dict) dictionary of dimension filters where the keys are the dimension names to filter and the values are a list of REGEX search terms
+            sampling_level: (str) DEFAULT, SMALL or LARGE
+            avoid_sampling: (bool) re-query sampled date ranges in smaller pieces until the data is not sampled
+            raw_responses: (str) memory, drop or spool (see RAWRESPONSESMODES)
+
+        Returns:
+            reports_dict: (dict) Responses returned by GA (one for each batchGet call, empty if the data comes from the response cache)
+                If raw_responses is spool, always a common.util.ResponseSpool.SpoolHandle to the archived responses.
+            data_df: (pandas.DataFrame) Data returned by GA as a dataframe
+        """
+        if raw_responses not in self.RAWRESPONSESMODES:
+            raise ValueError("raw_responses must be one of {modes}".format(modes=self.RAWRESPONSESMODES))
+        query_key = {'api': 'v4',
+                     'viewId': self.profile_id,
+                     'startDate': start_date,
+                     'endDate': end_date,
+                     'metrics': metrics_names_cs_list,
+                     'dimensions': dimensions_names_cs_list,
+                     'filters': dimension_filters_dict,
+                     'samplingLevel': sampling_level,
+                     'avoidSampling': avoid_sampling}
+        ((reports_dict, data_df), is_shared) = _QUERY_FLIGHTS.do(get_fingerprint(dict(query_key,
+                                                                                      rawResponses=raw_responses)),
+                                                                  self.execute_query_reporting_api_v4,
+                                                                  query_key,
+                                                                  raw_responses)
+        if is_shared:
+            log_msg = """
+                    method='DataAccess.GoogleApi.GoogleAnalytics.query_reporting_api_v4'
+                    message='Shared the result of an identical in-flight query'
+                    start_date='{start_date}'
+                    end_date='{end_date}'
+                    """.format(start_date=start_date,
+                               end_date=end_date)
+            self.logging_obj.log(self.logging_obj.DEBUG, log_msg)
+        if isinstance(reports_dict, dict):
+            reports_dict = dict(reports_dict)
+        return reports_dict, data_df.copy(deep=False)
+
+    def execute_query_reporting_api_v4(self, query_key, raw_responses='memory'):
+        """ Run a GA API v4 query (see query_reporting_api_v4)
+
+        Args:
+            query_key: (dict) parameters of the query created by query_reporting_api_v4
+            raw_responses: (str) memory, drop or spool (see RAWRESPONSESMODES)
+
+        Returns:
+            reports_dict: (dict) Responses returned by GA or a common.util.ResponseSpool.SpoolHandle
+            data_df: (pandas.DataFrame) Data returned by GA as a dataframe
+        """
+        start_date = query_key['startDate']
+        end_date = query_key['endDate']
+        metrics_names_cs_list = query_key['metrics']
+        dimensions_names_cs_list = query_key['dimensions']
+        dimension_filters_dict = query_key['filters']
+        sampling_level = query_key['samplingLevel']
+        avoid_sampling = query_key['avoidSampling']
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = query_key
+            # a cache hit has no raw responses, so spool queries skip the lookup to always return a SpoolHandle
+            data_df = self.get_cached_response(cache_key) if raw_responses != 'spool' else None
+            if data_df is not None:
+                return dict(), data_df
+
+        spool_writer = None
+        if raw_responses == 'spool':
+            if self.response_spool is None:
+                self.response_spool = ResponseSpool(spool_dir=os.path.join(get_cache_dir('GoogleAnalytics'),
+                                                                           'raw_responses'),
+                                                    logging_obj=self.logging_obj)
+            spool_writer = self.response_spool.open('{view_id}_{start_date}_{end_date}'.format(
+                view_id=self.profile_id,
+                start_date=start_date,
+                end_date=end_date))
+
+        try:
+            if avoid_sampling:
+                (reports_dict, data_df) = self.query_unsampled_reporting_api_v4(start_date,
+                                                                                end_date,
+                                                                                metrics_names_cs_list,
+                                                                                dimensions_names_cs_list,
+                                                                                dimension_filters_dict,
+                                                                                sampling_level,
+                                                                                raw_responses,
+                                                                                spool_writer)
+            else:
+                (reports_dict, data_df) = self.get_reports_v4(start_date,
+                                                              end_date,
+                                                              metrics_names_cs_list,
+                                                              dimensions_names_cs_list,
+                                                              dimension_filters_dict,
+                                                              sampling_level,
+                                                              raw_responses,
+                                                              spool_writer)
+        except Exception:
+            if spool_writer is not None:
+                spool_writer.abort()
+            raise
+
+        data_df.attrs['isDataGolden'] = self.is_data_golden(reports_dict)
+        if cache_key is not None:
+            self.response_cache.put(cache_key, data_df, is_final=data_df.attrs['isDataGolden'])
+        if spool_writer is not None:
+            return spool_writer.close(), data_df
+        return reports_dict, data_df
+
+    def get_reports_v4(self,
+                       start_date,
+                       end_date,
+                       metrics_names_cs_list,
+                       dimensions_names_cs_list,
+                       dimension_filters_dict=None,
+                       sampling_level=None,
+                       raw_responses='memory',
+                       spool_writer=None):
+        """ Get all pages of all reports of a GA API v4 query and merge them into one dataframe
+
+        This is query_reporting_api_v4 without the response cache and sampling avoidance.
+        Unless raw_responses is memory, each raw response is reduced to its metadata as soon as it has been
+        decoded (and written to spool_writer first if there is one).
 
         Args:
             start_date: (str) start date
@@ -342,23 +956,402 @@ class GoogleAnalytics:
             metrics_names_cs_list: (str) metric names, comma-separated list
             dimensions_names_cs_list: (str) dimension names, comma-separated list
             dimension_filters_dict: (dict) dictionary of dimension filters where the keys are the dimension names to filter and the values are a list of REGEX search terms
+            sampling_level: (str) DEFAULT, SMALL or LARGE
+            raw_responses: (str) memory, drop or spool (see query_reporting_api_v4)
+            spool_writer: (common.util.ResponseSpool.SpoolWriter) writer the raw responses are spooled to
 
         Returns:
-            reports_dict: (dict) Response returned by GA
+            reports_dict: (dict) Responses returned by GA (one for each batchGet call)
             data_df: (pandas.DataFrame) Data returned by GA as a dataframe
         """
+        if self.scheduler is None:
+            date_range = {'startDate': start_date, 'endDate': end_date}
+            pages = ((self.archive_raw_response_v4(reports_dict_i, date_range, raw_responses, spool_writer), data_dfs_i)
+                     for (reports_dict_i, data_dfs_i) in self.iter_reporting_api_v4(start_date,
+                                                                                    end_date,
+                                                                                    metrics_names_cs_list,
+                                                                                    dimensions_names_cs_list,
+                                                                                    dimension_filters_dict,
+                                                                                    sampling_level))
+        else:
+            # Send the batches of report requests concurrently
+            report_requests_list = self.create_report_requests_v4(start_date,
+                                                                  end_date,
+                                                                  metrics_names_cs_list,
+                                                                  dimensions_names_cs_list,
+                                                                  dimension_filters_dict,
+                                                                  sampling_level)
+            futures = [self.scheduler.submit(self.profile_id, self.get_batch_pages_v4, report_requests_list, batch_offset,
+                                             raw_responses, spool_writer)
+                       for batch_offset in range(0, len(report_requests_list), self.MAXREPORTREQUESTS)]
+            pages = [page for future in futures for page in future.result()]
+
+        reports_dict = dict()
+        pages_dict = dict()
+        i = 0
+        for (reports_dict_i, data_dfs_i) in pages:
+            reports_dict["dataset{i}".format(i=i)] = reports_dict_i
+            for report_request_index, data_df_i in data_dfs_i.items():
+                pages_dict.setdefault(report_request_index, []).append(data_df_i)
+            i = i + 1
+
+        data_dfs = [self.concat_pages_v4(pages_dict[report_request_index]) for report_request_index in sorted(pages_dict)]
+        data_df = self.merge_report_dataframes_v4(data_dfs, dimensions_names_cs_list.split(","))
+        return reports_dict, data_df
+
+    def query_unsampled_reporting_api_v4(self,
+                                         start_date,
+                                         end_date,
+                                         metrics_names_cs_list,
+                                         dimensions_names_cs_list,
+                                         dimension_filters_dict=None,
+                                         sampling_level=None,
+                                         raw_responses='memory',
+                                         spool_writer=None):
+        """ Query GA API v4 and avoid sampling by splitting sampled date ranges in half
+
+        The whole date range is queried first. Every date range that comes back sampled is split in half and
+        both halves are queried again (concurrently), down to single days. The unsampled pieces are concatenated.
+        Single days that are still sampled are kept and listed in data_df.attrs['sampledDateRanges'].
+
+        The rows of different date ranges are not aggregated, so ga:date should be one of the dimensions.
+        start_date and end_date must be of the format YYYY-MM-DD.
+
+        Args:
+            start_date: (str) start date
+            end_date: (str) end date
+            metrics_names_cs_list: (str) metric names, comma-separated list
+            dimensions_names_cs_list: (str) dimension names, comma-separated list
+            dimension_filters_dict: (dict) dictionary of dimension filters where the keys are the dimension names to filter and the values are a list of REGEX search terms
+            sampling_level: (str) DEFAULT, SMALL or LARGE
+            raw_responses: (str) memory, drop or spool (see query_reporting_api_v4)
+            spool_writer: (common.util.ResponseSpool.SpoolWriter) writer the raw responses are spooled to
+
+        Returns:
+            reports_dict: (dict) Responses returned by GA (one for each batchGet call)
+            data_df: (pandas.DataFrame) Data returned by GA as a dataframe
+        """
+        if 'ga:date' not in dimensions_names_cs_list.split(","):
+            log_msg = """
+                    method='DataAccess.GoogleApi.GoogleAnalytics.query_unsampled_reporting_api_v4'
+                    message='ga:date is not one of the dimensions, so rows of different date ranges will not be aggregated if the date range is split.'
+                    """
+            self.logging_obj.log(self.logging_obj.WARN, log_msg)
+
+        results_list = []
+        sampled_date_ranges = []
+        date_ranges = [(start_date, end_date)]
+        while date_ranges:
+            # Query all date ranges of this level of the bisection concurrently
+            level_results_list = self.map_requests(
+                self.get_reports_v4,
+                [(range_start_date, range_end_date, metrics_names_cs_list, dimensions_names_cs_list,
+                  dimension_filters_dict, sampling_level, raw_responses, spool_writer)
+                 for (range_start_date, range_end_date) in date_ranges])
+            next_date_ranges = []
+            for ((range_start_date, range_end_date), (reports_dict_i, data_df_i)) in zip(date_ranges, level_results_list):
+                num_days = subtract_days(range_start_date, range_end_date)
+                if not self.is_data_sampled(reports_dict_i):
+                    results_list.append((range_start_date, reports_dict_i, data_df_i))
+                elif num_days == 0:
+                    sampled_date_ranges.append([range_start_date, range_end_date])
+                    results_list.append((range_start_date, reports_dict_i, data_df_i))
+                else:
+                    mid_date = add_days_to_date_str(range_start_date, num_days // 2)
+                    log_msg = """
+                            method='DataAccess.GoogleApi.GoogleAnalytics.query_unsampled_reporting_api_v4'
+                            message='The data is sampled. Splitting the date range in half.'
+                            start_date='{start_date}'
+                            end_date='{end_date}'
+                            """.format(start_date=range_start_date,
+                                       end_date=range_end_date)
+                    self.logging_obj.log(self.logging_obj.INFO, log_msg)
+                    next_date_ranges.append((range_start_date, mid_date))
+                    next_date_ranges.append((add_days_to_date_str(mid_date, 1), range_end_date))
+            date_ranges = next_date_ranges
+
+        reports_dict = dict()
+        data_dfs = []
+        for (range_start_date, reports_dict_i, data_df_i) in sorted(results_list, key=lambda result: result[0]):
+            for reports_dict_ij in reports_dict_i.values():
+                reports_dict["dataset{i}".format(i=len(reports_dict))] = reports_dict_ij
+            if not data_df_i.empty:
+                data_dfs.append(data_df_i)
+        data_df = concat_dataframes(data_dfs)
+
+        if sampled_date_ranges:
+            log_msg = """
+                    method='DataAccess.GoogleApi.GoogleAnalytics.query_unsampled_reporting_api_v4'
+                    message='These days are sampled even when queried one day at a time. Do not trust for analysis!'
+                    sampled_date_ranges='{sampled_date_ranges}'
+                    """.format(sampled_date_ranges=sampled_date_ranges)
+            self.logging_obj.log(self.logging_obj.WARN, log_msg)
+        data_df.attrs['sampledDateRanges'] = sampled_date_ranges
+        return reports_dict, data_df
+
+    def map_requests(self, fn, args_list):
+        """ Call fn concurrently for each set of arguments
+
+        Uses the object's scheduler if it has one and otherwise a thread pool of MAXCONCURRENTREQUESTS threads.
+
+        Args:
+            fn: (callable) method that sends GA requests
+            args_list: (list of tuples) positional arguments for each call of fn
+
+        Returns:
+            results: (list) results of fn in the same order as args_list
+        """
+        if len(args_list) == 1:
+            return [fn(*args_list[0])]
+        if self.scheduler is not None:
+            return self.scheduler.map(self.profile_id, fn, args_list)
+        with ThreadPoolExecutor(max_workers=min(self.MAXCONCURRENTREQUESTS, len(args_list))) as executor:
+            results = list(executor.map(lambda args: fn(*args), args_list))
+        return results
+
+    def iter_reporting_api_v4(self,
+                              start_date,
+                              end_date,
+                              metrics_names_cs_list,
+                              dimensions_names_cs_list,
+                              dimension_filters_dict=None,
+                              sampling_level=None):
+        """ Iterate over the pages of a Google Analytics Core Reporting API (v4) query
+
+        Sends the same report requests as query_reporting_api_v4 but yields the data one batchGet call at a time,
+        so only about one page (at most MAXRETURNEDROWS rows per report) is held in memory.
+        Each report in a batch is paginated separately, so later pages only contain the reports that have more data.
+
+        Args:
+            start_date: (str) start date
+            end_date: (str) end date
+            metrics_names_cs_list: (str) metric names, comma-separated list
+            dimensions_names_cs_list: (str) dimension names, comma-separated list
+            dimension_filters_dict: (dict) dictionary of dimension filters where the keys are the dimension names to filter and the values are a list of REGEX search terms
+            sampling_level: (str) DEFAULT, SMALL or LARGE
+
+        Yields:
+            reports_dict_i: (dict) Response returned by GA for one batchGet call
+            data_dfs_i: (dict) page of data as a dataframe for each report in the response,
+                keyed by the index of the report's metric group
+
+        Example:
+            for (reports_dict_i, data_dfs_i) in ga.iter_reporting_api_v4('2019-01-01', '2019-01-31',
+                                                                         'ga:pageviews,ga:sessions',
+                                                                         'ga:date,ga:pagePath'):
+                s3_bucket_obj.pandas_to_s3_parquet(data_dfs_i[0], key)
+        """
+        report_requests_list = self.create_report_requests_v4(start_date,
+                                                              end_date,
+                                                              metrics_names_cs_list,
+                                                              dimensions_names_cs_list,
+                                                              dimension_filters_dict,
+                                                              sampling_level)
+        for batch_offset in range(0, len(report_requests_list), self.MAXREPORTREQUESTS):
+            for (reports_dict_i, data_dfs_i) in self.iter_batch_pages_v4(report_requests_list, batch_offset):
+                yield reports_dict_i, data_dfs_i
+
+    def iter_batch_pages_v4(self, report_requests_list, batch_offset):
+        """ Iterate over the pages of one batch of report requests
+
+        The batch is made of up to MAXREPORTREQUESTS report requests starting at batch_offset.
+        Each report in a batch is paginated separately, so later pages only ask for the reports that have more pages.
+
+        Args:
+            report_requests_list: (list of dict) report requests created by create_report_requests_v4
+            batch_offset: (int) index of the first report request of the batch
+
+        Yields:
+            reports_dict_i: (dict) Response returned by GA for one batchGet call
+            data_dfs_i: (dict) page of data as a dataframe for each report in the response,
+                keyed by the index of the report's metric group
+        """
+        batch_report_requests_list = report_requests_list[batch_offset:batch_offset + self.MAXREPORTREQUESTS]
+        page_tokens = ['0'] * len(batch_report_requests_list)
+        pending_reports = list(range(len(batch_report_requests_list)))
+        i = 0
+        while pending_reports:
+            # GA API v4 outputs a list of dictionaries - one dict for each report request in the batch.
+            # Only this call is retried if it fails, so the pages that have already been received are kept
+            (reports_dict_i, latency_seconds, response_bytes, retry_count) = self.execute_measured_request(
+                self.service.reports().batchGet(
+                    body={
+                        'reportRequests': [dict(batch_report_requests_list[j], pageToken=page_tokens[j])
+                                           for j in pending_reports]
+                    }
+                ))
+
+            # Log possible issues with the data set pulled from GA
+            self.check_response_data_quality(reports_dict_i)
+            if self.request_ledger is not None:
+                self.record_response_v4(reports_dict_i,
+                                        [batch_report_requests_list[j] for j in pending_reports],
+                                        [page_tokens[j] for j in pending_reports],
+                                        i,
+                                        latency_seconds,
+                                        response_bytes,
+                                        retry_count)
+
+            data_dfs_i = dict()
+            next_pending_reports = []
+            for report_index, j in enumerate(pending_reports):
+                # Turn the dict response to a pandas DataFrame
+                data_dfs_i[batch_offset + j] = self.api_response_to_dataframe_v4(reports_dict_i, report_index)
+
+                next_page_token = self.get_next_page_token(reports_dict_i, report_index)
+                if next_page_token is not None:
+                    log_msg = """
+                            method='DataAccess.GoogleApi.GoogleAnalytics.iter_batch_pages_v4'
+                            message='Google Analytics API v4 has more pages for this report. The method will loop until we get all the data.'
+                            i='{i}'
+                            report_index='{report_index}'
+                            page_token_i='{page_token_i}'
+                            """.format(i=i,
+                                       report_index=batch_offset + j,
+                                       page_token_i=next_page_token)
+                    self.logging_obj.log(self.logging_obj.WARN, log_msg)
+                    page_tokens[j] = next_page_token
+                    next_pending_reports.append(j)
+            pending_reports = next_pending_reports
+            i = i + 1
+
+            yield reports_dict_i, data_dfs_i
+
+    def record_response_v4(self, response, report_requests_list, page_tokens, page_index, latency_seconds,
+                           response_bytes, retry_count=0):
+        """ Record the metadata of each report in a batchGet response in the request ledger
+
+        Latency, response bytes and retries are measured per batchGet call, so they are shared by the reports
+        of the call. The fingerprint of a report request leaves out the page token, so all pages of a report
+        have the same fingerprint.
+
+        Args:
+            response: (dict) response from GA
+            report_requests_list: (list of dict) report requests of the call (without page tokens)
+            page_tokens: (list of str) page token sent with each report request
+            page_index: (int) index of the call among the calls for the batch
+            latency_seconds: (float) seconds taken by the call
+            response_bytes: (int) size of the response body
+            retry_count: (int) number of times the call was retried
+
+        Returns:
+
+        """
+        entries_list = []
+        for report_request, page_token, report in zip(report_requests_list, page_tokens,
+                                                      response.get('reports', [])):
+            report_data = report.get('data', {})
+            date_range = report_request['dateRanges'][0]
+            entries_list.append({'view_id': report_request.get('viewId'),
+                                 'start_date': date_range.get('startDate'),
+                                 'end_date': date_range.get('endDate'),
+                                 'fingerprint': get_fingerprint(report_request),
+                                 'page_index': page_index,
+                                 'page_token': page_token,
+                                 'is_data_golden': report_data.get('isDataGolden'),
+                                 'samples_read_counts': report_data.get('samplesReadCounts'),
+                                 'sampling_space_sizes': report_data.get('samplingSpaceSizes'),
+                                 'row_count': len(report_data.get('rows', [])),
+                                 'response_bytes': response_bytes,
+                                 'latency_seconds': latency_seconds,
+                                 'retry_count': retry_count})
+        self.request_ledger.record_entries(entries_list)
+
+    def get_batch_pages_v4(self, report_requests_list, batch_offset, raw_responses='memory', spool_writer=None):
+        """ Get all pages of one batch of report requests (see iter_batch_pages_v4)
+
+        Args:
+            report_requests_list: (list of dict) report requests created by create_report_requests_v4
+            batch_offset: (int) index of the first report request of the batch
+            raw_responses: (str) memory, drop or spool (see query_reporting_api_v4)
+            spool_writer: (common.util.ResponseSpool.SpoolWriter) writer the raw responses are spooled to
+
+        Returns:
+            pages_list: (list of tuples) (reports_dict_i, data_dfs_i) for each batchGet call
+        """
+        date_range = report_requests_list[batch_offset]['dateRanges'][0]
+        pages_list = [(self.archive_raw_response_v4(reports_dict_i, date_range, raw_responses, spool_writer),
+                       data_dfs_i)
+                      for (reports_dict_i, data_dfs_i) in self.iter_batch_pages_v4(report_requests_list, batch_offset)]
+        return pages_list
+
+    def archive_raw_response_v4(self, response, date_range, raw_responses='memory', spool_writer=None):
+        """ Spool and/or drop the rows of a decoded GA API v4 response
+
+        Args:
+            response: (dict) response from GA
+            date_range: (dict) startDate and endDate of the request
+            raw_responses: (str) memory, drop or spool (see query_reporting_api_v4)
+            spool_writer: (common.util.ResponseSpool.SpoolWriter) writer the raw response is spooled to
+
+        Returns:
+            response: (dict) the response if raw_responses is memory and its metadata otherwise
+                (see get_response_metadata_v4)
+        """
+        if spool_writer is not None:
+            spool_writer.write({'viewId': self.profile_id,
+                                'startDate': date_range.get('startDate'),
+                                'endDate': date_range.get('endDate'),
+                                'response': response})
+        if raw_responses == 'memory':
+            return response
+        return self.get_response_metadata_v4(response)
+
+    def get_response_metadata_v4(self, response):
+        """ Get a copy of a GA API v4 response without its rows
+
+        The copy is enough for is_data_golden, is_data_sampled and check_response_data_quality.
+
+        Args:
+            response: (dict) response from GA
+
+        Returns:
+            response_metadata: (dict) response with the rows of every report removed
+        """
+        reports_list = []
+        for report in response.get('reports', []):
+            report_metadata = {key: value for key, value in report.items() if key != 'data'}
+            report_metadata['data'] = {key: value for key, value in report.get('data', {}).items() if key != 'rows'}
+            reports_list.append(report_metadata)
+        response_metadata = dict(response, reports=reports_list)
+        return response_metadata
+
+    def create_report_requests_v4(self,
+                                  start_date,
+                                  end_date,
+                                  metrics_names_cs_list,
+                                  dimensions_names_cs_list,
+                                  dimension_filters_dict=None,
+                                  sampling_level=None):
+        """ Create the report requests for a GA API v4 query
+
+        The metrics are split into groups of MAXMETRICS and one report request is created for each group.
+
+        Args:
+            start_date: (str) start date
+            end_date: (str) end date
+            metrics_names_cs_list: (str) metric names, comma-separated list
+            dimensions_names_cs_list: (str) dimension names, comma-separated list
+            dimension_filters_dict: (dict) dictionary of dimension filters where the keys are the dimension names to filter and the values are a list of REGEX search terms
+            sampling_level: (str) DEFAULT, SMALL or LARGE
+
+        Returns:
+            report_requests_list: (list of dict) report requests without a pageToken
+        """
         metrics_names_list = metrics_names_cs_list.split(",")
         metrics_body_list = []
         for metric_name in metrics_names_list:
             metrics_body_list.append({'expression': metric_name})
 
-        if len(metrics_body_list) > self.MAXMETRICS:
+        metrics_groups_list = chunk_list(metrics_body_list, self.MAXMETRICS)
+        if len(metrics_groups_list) > 1:
             log_msg = """
-                    method='DataAccess.GoogleApi.GoogleAnalytics.query_reporting_api_v4'
-                    message='GA only allows you to pull {max_metrics} metrics at once and you are asking for {num_metrics}.'
+                    method='DataAccess.GoogleApi.GoogleAnalytics.create_report_requests_v4'
+                    message='GA only allows you to pull {max_metrics} metrics in one report and you are asking for {num_metrics}. The metrics will be split into {num_reports} reports.'
                     """.format(max_metrics=self.MAXMETRICS,
-                               num_metrics=len(metrics_body_list))
-            self.logging_obj.log(self.logging_obj.WARN, log_msg)
+                               num_metrics=len(metrics_body_list),
+                               num_reports=len(metrics_groups_list))
+            self.logging_obj.log(self.logging_obj.INFO, log_msg)
 
         dimensions_names_list = dimensions_names_cs_list.split(",")
         dimensions_body_list = []
@@ -367,7 +1360,7 @@ class GoogleAnalytics:
 
         if len(dimensions_body_list) > self.MAXDIMENSIONS:
             log_msg = """
-                    method='DataAccess.GoogleApi.GoogleAnalytics.query_reporting_api_v4'
+                    method='DataAccess.GoogleApi.GoogleAnalytics.create_report_requests_v4'
                     message='GA only allows you to pull {max_dims} dimensions at once and you are asking for {num_dims}.'
                     """.format(max_dims=self.MAXDIMENSIONS,
                                num_dims=len(dimensions_body_list))
@@ -380,110 +1373,215 @@ class GoogleAnalytics:
                                                     'operator': 'REGEXP',
                                                     'expressions': dimension_filter_value})
 
-        page_token_i = '0'
-        is_max_returned_rows = True
-        reports_dict = dict()
-        data_df = pd.DataFrame()
-        i = 0
-        while is_max_returned_rows:
-            # GA API v4 outputs a list of dictionaries - one dict for each report.
-            # This method only returns one report.
-            reports_dict_i = self.service.reports().batchGet(
-                body={
-                    'reportRequests': [
-                        {
-                            'viewId': self.profile_id,
-                            'dateRanges': [{'startDate': start_date, 'endDate': end_date}],
-                            'metrics': metrics_body_list,
-                            'dimensions': dimensions_body_list,
-                            'pageSize': self.MAXRETURNEDROWS,
-                            'pageToken': page_token_i,
-                            'dimensionFilterClauses': [{
-                                'filters': dimension_filters_body_list
-                            }]
-                        }]
-                }
-            ).execute()
+        report_requests_list = []
+        for metrics_group_body_list in metrics_groups_list:
+            report_request = {'viewId': self.profile_id,
+                              'dateRanges': [{'startDate': start_date, 'endDate': end_date}],
+                              'metrics': metrics_group_body_list,
+                              'dimensions': dimensions_body_list,
+                              'pageSize': self.MAXRETURNEDROWS,
+                              'dimensionFilterClauses': [{
+                                  'filters': dimension_filters_body_list
+                              }]}
+            if sampling_level is not None:
+                report_request['samplingLevel'] = sampling_level
+            report_requests_list.append(report_request)
+        return report_requests_list
+
+    def concat_pages_v4(self, data_dfs):
+        """ Concatenate the pages of one report into one dataframe
+
+        The pages are concatenated in one step instead of appending them one at a time.
+        The categories of the dimension columns are unified first, so the dimensions stay categorical.
 
-            # Log possible issues with the data set pulled from GA
-            self.check_response_data_quality(reports_dict_i)
+        Args:
+            data_dfs: (list of pandas.DataFrame) pages of a report
 
-            # Turn the dict response to a pandas DataFrame
-            data_df_i = self.api_response_to_dataframe_v4(reports_dict_i)
+        Returns:
+            data_df: (pandas.DataFrame) all pages of the report
+        """
+        data_df = concat_dataframes(data_dfs)
+        return data_df
 
-            reports_dict["dataset{i}".format(i=i)] = reports_dict_i
-            data_df = data_df.append(data_df_i, ignore_index=True)
+    def merge_report_dataframes_v4(self, data_dfs, dimensions_names_list):
+        """ Merge the dataframes of reports that were split by metrics back into one dataframe
 
-            if data_df_i.shape[0] == self.MAXRETURNEDROWS:
-                log_msg = """
-                        method='DataAccess.GoogleApi.GoogleAnalytics.query_reporting_api_v4'
-                        message='The number of rows in the dataframe returned by Google Analytics API v4 is the same size as the max that the API allows. The method will loop until we get all the data.'
-                        i='{i}'
-                        page_token_i='{page_token_i}'
-                        """.format(i=i,
-                                   page_token_i=page_token_i)
-                self.logging_obj.log(self.logging_obj.WARN, log_msg)
-                page_token_i = self.get_next_page_token(reports_dict_i)
-            else:
-                is_max_returned_rows = False
-            i = i + 1
+        The categories of the dimension columns are unified first, so the merge joins on the integer codes
+        and the merged dimensions stay categorical.
 
-        return reports_dict, data_df
+        Args:
+            data_dfs: (list of pandas.DataFrame) one dataframe for each report, all with the same dimensions
+            dimensions_names_list: (list of str) dimension names to merge the reports on
+
+        Returns:
+            data_df: (pandas.DataFrame) merged dataframe
+        """
+        data_df = pd.DataFrame()
+        data_dfs = [data_df_i for data_df_i in data_dfs if not data_df_i.empty]
+        data_dfs = unify_categories(data_dfs, dimensions_names_list)
+        for data_df_i in data_dfs:
+            if data_df.empty:
+                data_df = data_df_i
+            else:
+                data_df = pd.merge(data_df, data_df_i, on=dimensions_names_list, how='outer')
+        return data_df
 
-    def api_response_to_dataframe_v4(self, response):
+    def api_response_to_dataframe_v4(self, response, report_index=0):
         """ Convert a GA API v4 response to a dataframe
 
+        The rows are decoded column by column: one array is filled for each dimension and metric.
+        Dimension values (e.g. page paths, countries) repeat heavily, so the dimensions are dictionary-encoded
+        into categorical columns: each distinct value is stored once and the rows only hold integer codes.
+        The dtype of each metric is taken from its type in the metric header (see METRICTYPEDTYPES).
+        If the report has more than one date range, the metrics of the first date range keep their names
+        and the metrics of the other date ranges get a suffix, e.g. ga:sessions_dateRange1.
+
         Args:
             response: (dict) response from GA
+            report_index: (int) index of the report in the response to convert
 
         Returns:
-            df: (pandas.DataFrame) response from GA as a dataframe
+            df: (pandas.DataFrame) report from GA as a dataframe
         """
-        list = []
-        # get report data
-        for report in response.get('reports', []):
-            # set column headers
-            column_header = report.get('columnHeader', {})
-            dimension_headers = column_header.get('dimensions', [])
-            metric_headers = column_header.get('metricHeader', {}).get('metricHeaderEntries', [])
-            rows = report.get('data', {}).get('rows', [])
-
-            for row in rows:
-                # create dict for each row
-                dict = {}
-                dimensions = row.get('dimensions', [])
-                dateRangeValues = row.get('metrics', [])
-
-                # fill dict with dimension header (key) and dimension value (value)
-                for header, dimension in zip(dimension_headers, dimensions):
-                    dict[header] = dimension
-
-                # fill dict with metric header (key) and metric value (value)
-                for i, values in enumerate(dateRangeValues):
-                    for metric, value in zip(metric_headers, values.get('values')):
-                        # set int as int, float a float
-                        if ',' in value or '.' in value:
-                            dict[metric.get('name')] = float(value)
-                        else:
-                            dict[metric.get('name')] = int(value)
-
-                list.append(dict)
-
-            df = pd.DataFrame(list)
-            return df
-
-    def get_next_page_token(self, response):
-        next_page_token = response['reports'][0]['nextPageToken']
+        reports = response.get('reports', [])
+        if report_index >= len(reports):
+            return pd.DataFrame()
+        report = reports[report_index]
+        # get column headers
+        column_header = report.get('columnHeader', {})
+        dimension_headers = column_header.get('dimensions', [])
+        metric_headers = column_header.get('metricHeader', {}).get('metricHeaderEntries', [])
+        rows = report.get('data', {}).get('rows', [])
+
+        columns_dict = dict()
+        # transpose the rows into one tuple of values per dimension
+        dimension_columns = list(zip(*[row.get('dimensions', []) for row in rows])) or [()] * len(dimension_headers)
+        for dimension_header, dimension_values in zip(dimension_headers, dimension_columns):
+            columns_dict[dimension_header] = to_categorical(dimension_values)
+
+        # each row has one list of metric values per date range
+        num_date_ranges = len(rows[0].get('metrics', [])) if rows else 1
+        for date_range_index in range(num_date_ranges):
+            metric_columns = list(zip(*[row['metrics'][date_range_index]['values'] for row in rows])) \
+                or [()] * len(metric_headers)
+            for metric_header, metric_values in zip(metric_headers, metric_columns):
+                column_name = self.get_metric_column_name_v4(metric_header.get('name'), date_range_index)
+                columns_dict[column_name] = self.metric_values_to_array_v4(metric_values, metric_header.get('type'))
+
+        df = pd.DataFrame(columns_dict)
+        return df
+
+    def get_metric_column_name_v4(self, metric_name, date_range_index):
+        """ Get the name of a metric column for a date range
+
+        Args:
+            metric_name: (str) name of the metric, e.g. ga:sessions
+            date_range_index: (int) index of the date range in the report request
+
+        Returns:
+            column_name: (str) metric_name for the first date range and metric_name_dateRange{i} for the others
+        """
+        if date_range_index == 0:
+            column_name = metric_name
+        else:
+            column_name = "{metric_name}_dateRange{i}".format(metric_name=metric_name, i=date_range_index)
+        return column_name
+
+    def metric_values_to_array_v4(self, metric_values, metric_type):
+        """ Convert the string values of a metric to a typed numpy array
+
+        Args:
+            metric_values: (tuple of str) values of one metric as returned by GA
+            metric_type: (str) type of the metric in the metric header, e.g. INTEGER or CURRENCY
+
+        Returns:
+            metric_array: (numpy.ndarray) values of the metric
+        """
+        dtype = self.METRICTYPEDTYPES.get(metric_type, 'float64')
+        try:
+            metric_array = np.array(metric_values, dtype=dtype)
+        except ValueError:
+            # GA can format large or averaged INTEGER values with a decimal point
+            metric_array = np.array(metric_values, dtype='float64')
+        return metric_array
+
+    def get_cached_response(self, cache_key):
+        """ Get the dataframe of a query from the response cache
+
+        Args:
+            cache_key: (dict) parameters of the query
+
+        Returns:
+            data_df: (pandas.DataFrame) cached data or None if the query is not cached
+        """
+        data_df, cache_metadata = self.response_cache.get(cache_key)
+        if data_df is not None:
+            log_msg = """
+                    method='DataAccess.GoogleApi.GoogleAnalytics.get_cached_response'
+                    message='Using cached response instead of querying GA'
+                    start_date='{start_date}'
+                    end_date='{end_date}'
+                    is_data_golden='{is_data_golden}'
+                    """.format(start_date=cache_key['startDate'],
+                               end_date=cache_key['endDate'],
+                               is_data_golden=cache_metadata['is_final'])
+            self.logging_obj.log(self.logging_obj.INFO, log_msg)
+            data_df.attrs['isDataGolden'] = cache_metadata['is_final']
+        return data_df
+
+    def is_data_sampled(self, reports_dict):
+        """ Check whether any report of a GA API v4 query is sampled
+
+        Args:
+            reports_dict: (dict) responses returned by query_reporting_api_v4
+
+        Returns:
+            out: (bool) indicates whether or not any of the data is sampled
+        """
+        out = False
+        for reports_dict_i in reports_dict.values():
+            for report in reports_dict_i.get('reports', []):
+                out = out or 'samplesReadCounts' in report.get('data', {})
+        return out
+
+    def is_data_golden(self, reports_dict):
+        """ Check whether every report of a GA API v4 query is golden
+
+        Data is golden when the exact same request will not produce any new results if asked at a later point in time.
+
+        Args:
+            reports_dict: (dict) responses returned by query_reporting_api_v4
+
+        Returns:
+            out: (bool) indicates whether or not all of the data is golden
+        """
+        out = len(reports_dict) > 0
+        for reports_dict_i in reports_dict.values():
+            for report in reports_dict_i.get('reports', []):
+                out = out and bool(report.get('data', {}).get('isDataGolden', False))
+        return out
+
+    def get_next_page_token(self, response, report_index=0):
+        """ Get the token of the next page of a report
+
+        Args:
+            response: (dict) response from GA
+            report_index: (int) index of the report in the response
+
+        Returns:
+            next_page_token: (str) token of the next page or None if the report has no more pages
+        """
+        next_page_token = response['reports'][report_index].get('nextPageToken')
         return next_page_token
 
     def check_response_data_quality(self, api_response):
         """Checks the data quality of the response the GA API returned
 
-        Logs the following data quality issues:
+        Logs the following data quality issues for every report in the response:
         1) Golden data
         2) Sampling - based on https://developers.google.com/analytics/devguides/reporting/core/v4/basics#sampling
 
-        TODO: log these things in a table in the database as it's important to know (especially sampling)
+        The same things are recorded per page in the request ledger if the object has one (see record_response_v4).
 
         Args:
             api_response (dict): response from GA API
@@ -491,42 +1589,43 @@ class GoogleAnalytics:
         Returns:
 
         """
-        # Check to see if the data is golden (if it is not, this means it could change over time)
-        try:
-            is_data_golden = api_response['reports'][0]['data']['isDataGolden']
-        except:
-            log_msg = """
-                        method='DataAccess.GoogleApi.GoogleAnalytics.check_response_data_quality'
-                        message='The isDataGolden key does not exist.'
-                        """
-            self.logging_obj.log(self.logging_obj.DEBUG, log_msg)
-        else:
-            if not is_data_golden:
+        for report in api_response.get('reports', []):
+            # Check to see if the data is golden (if it is not, this means it could change over time)
+            try:
+                is_data_golden = report['data']['isDataGolden']
+            except:
                 log_msg = """
                             method='DataAccess.GoogleApi.GoogleAnalytics.check_response_data_quality'
-                            message='This data set is not golden (data is golden when the exact same request will not 
-                                produce any new results if asked at a later point in time).'
+                            message='The isDataGolden key does not exist.'
                             """
+                self.logging_obj.log(self.logging_obj.DEBUG, log_msg)
+            else:
+                if not is_data_golden:
+                    log_msg = """
+                                method='DataAccess.GoogleApi.GoogleAnalytics.check_response_data_quality'
+                                message='This data set is not golden (data is golden when the exact same request will not 
+                                    produce any new results if asked at a later point in time).'
+                                """
+                    self.logging_obj.log(self.logging_obj.WARN, log_msg)
+            # Check to see if the data set is sampled
+            try:
+                samples_read_counts = report['data']['samplesReadCounts']
+                sampling_space_sizes = report['data']['samplingSpaceSizes']
+            except:
+                log_msg = """
+                            method='DataAccess.GoogleApi.GoogleAnalytics.check_response_data_quality'
+                            message='This data set is not sampled! Yay!!! :)'
+                            """
+                self.logging_obj.log(self.logging_obj.DEBUG, log_msg)
+            else:
+                log_msg = """
+                            method='DataAccess.GoogleApi.GoogleAnalytics.check_response_data_quality'
+                            message='This data set IS sampled!!! Do not trust for analysis!'
+                            samples_read_counts='{samples_read_counts}'
+                            sampling_space_sizes='{sampling_space_sizes}'
+                            """.format(samples_read_counts=samples_read_counts,
+                                       sampling_space_sizes=sampling_space_sizes)
                 self.logging_obj.log(self.logging_obj.WARN, log_msg)
-        # Check to see if the data set is sampled
-        try:
-            samples_read_counts = api_response['reports'][0]['data']['samplesReadCounts']
-            sampling_space_sizes = api_response['reports'][0]['data']['samplingSpaceSizes']
-        except:
-            log_msg = """
-                        method='DataAccess.GoogleApi.GoogleAnalytics.check_response_data_quality'
-                        message='This data set is not sampled! Yay!!! :)'
-                        """
-            self.logging_obj.log(self.logging_obj.DEBUG, log_msg)
-        else:
-            log_msg = """
-                        method='DataAccess.GoogleApi.GoogleAnalytics.check_response_data_quality'
-                        message='This data set IS sampled!!! Do not trust for analysis!'
-                        samples_read_counts='{samples_read_counts}'
-                        sampling_space_sizes='{sampling_space_sizes}'
-                        """.format(samples_read_counts=samples_read_counts,
-                                   sampling_space_sizes=sampling_space_sizes)
-            self.logging_obj.log(self.logging_obj.WARN, log_msg)
 
 
 
@@ -0,0 +1,208 @@
+#!/usr/bin/python
+
+"""Keep a persistent ledger of Google Analytics report requests
+
+Every page of a GA API v4 report is recorded in a local SQLite database with its data quality
+(golden and sampling status) and performance (row count, response bytes, latency and retries) metadata.
+Cache invalidation, incremental re-pulls and latency dashboards can query the ledger instead of the logs.
+
+"""
+
+from common.util.Logging import check_logger
+from common.util.OSHelpers import get_cache_dir
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+
+
+class RequestLedger:
+    """Record the metadata of GA report requests in a SQLite database"""
+
+    TABLENAME = 'ga_report_requests'
+    COLUMNS = ['recorded_at',
+               'view_id',
+               'start_date',
+               'end_date',
+               'fingerprint',
+               'page_index',
+               'page_token',
+               'is_data_golden',
+               'samples_read_counts',
+               'sampling_space_sizes',
+               'row_count',
+               'response_bytes',
+               'latency_seconds',
+               'retry_count']
+
+    def __init__(self, db_path=None, logging_obj=None):
+        """ Create a webanalytics.googleanalytics.RequestLedger.RequestLedger object
+
+        Args:
+            db_path: (str) path to the SQLite database (defaults to the user's home directory > Cache > GoogleAnalytics)
+            logging_obj: (common.Util.Logging.Logging) logger
+
+        Example:
+            from webanalytics.googleanalytics.RequestLedger import RequestLedger
+            request_ledger = RequestLedger()
+            ga = GoogleAnalytics(account_name="www.usana.com",
+                                 property_name="usana.com",
+                                 profile_name="*www.usana.com all",
+                                 request_ledger=request_ledger)
+        """
+        if db_path is None:
+            db_path = os.path.join(get_cache_dir('GoogleAnalytics'), 'request_ledger.sqlite3')
+        else:
+            db_dir = os.path.dirname(os.path.abspath(db_path))
+            os.makedirs(db_dir, exist_ok=True)
+        self.db_path = db_path
+        self.logging_obj = check_logger(logging_obj)
+        # One connection is shared by all threads, so every use of it must hold the lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self.lock:
+            self.create_table()
+
+    def create_table(self):
+        """ Create the ledger table and its indexes if they do not exist
+
+        Returns:
+
+        """
+        # WAL lets other processes (e.g. dashboards) read the ledger while it is being written
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                recorded_at REAL NOT NULL,
+                view_id TEXT,
+                start_date TEXT,
+                end_date TEXT,
+                fingerprint TEXT NOT NULL,
+                page_index INTEGER,
+                page_token TEXT,
+                is_data_golden INTEGER,
+                samples_read_counts TEXT,
+                sampling_space_sizes TEXT,
+                row_count INTEGER,
+                response_bytes INTEGER,
+                latency_seconds REAL,
+                retry_count INTEGER
+            )""".format(table_name=self.TABLENAME))
+        self.connection.execute("""
+            CREATE INDEX IF NOT EXISTS {table_name}_view_dates
+            ON {table_name} (view_id, start_date, end_date)""".format(table_name=self.TABLENAME))
+        self.connection.execute("""
+            CREATE INDEX IF NOT EXISTS {table_name}_fingerprint
+            ON {table_name} (fingerprint)""".format(table_name=self.TABLENAME))
+        self.connection.commit()
+
+    def record_entries(self, entries_list):
+        """ Record entries in the ledger
+
+        Args:
+            entries_list: (list of dict) entries keyed by the names in COLUMNS (missing keys are stored as NULL).
+                samples_read_counts and sampling_space_sizes may be lists; they are stored as JSON.
+
+        Returns:
+
+        """
+        if not entries_list:
+            return
+        values_list = []
+        for entry in entries_list:
+            entry = dict(entry)
+            entry.setdefault('recorded_at', time.time())
+            for column in ['samples_read_counts', 'sampling_space_sizes']:
+                if entry.get(column) is not None:
+                    entry[column] = json.dumps(entry[column])
+            if entry.get('is_data_golden') is not None:
+                entry['is_data_golden'] = int(bool(entry['is_data_golden']))
+            values_list.append(tuple(entry.get(column) for column in self.COLUMNS))
+
+        sql = 'INSERT INTO {table_name} ({columns}) VALUES ({placeholders})'.format(
+            table_name=self.TABLENAME,
+            columns=', '.join(self.COLUMNS),
+            placeholders=', '.join(['?'] * len(self.COLUMNS)))
+        try:
+            with self.lock:
+                with self.connection:
+                    self.connection.executemany(sql, values_list)
+        except sqlite3.Error as ex:
+            # The ledger is bookkeeping, so a failed write must not fail the GA query
+            log_msg = """
+                        method='webanalytics.googleanalytics.RequestLedger.RequestLedger.record_entries'
+                        message='Could not record entries in the request ledger'
+                        db_path='{db_path}'
+                        exception_message='{ex_msg}'
+                        """.format(db_path=self.db_path,
+                                   ex_msg=str(ex))
+            self.logging_obj.log(self.logging_obj.WARN, log_msg)
+
+    def get_entries(self, view_id=None, start_date=None, end_date=None, fingerprint=None):
+        """ Get entries from the ledger
+
+        Args:
+            view_id: (str) only get entries of this view
+            start_date: (str) only get entries whose date range ends on or after this date (yyyy-mm-dd)
+            end_date: (str) only get entries whose date range starts on or before this date (yyyy-mm-dd)
+            fingerprint: (str) only get entries of this request (see common.util.DataFrameCache.get_fingerprint)
+
+        Returns:
+            entries_df: (pandas.DataFrame) entries ordered by the time they were recorded
+        """
+        conditions = []
+        params = []
+        if view_id is not None:
+            conditions.append('view_id = ?')
+            params.append(str(view_id))
+        if start_date is not None:
+            conditions.append('end_date >= ?')
+            params.append(start_date)
+        if end_date is not None:
+            conditions.append('start_date <= ?')
+            params.append(end_date)
+        if fingerprint is not None:
+            conditions.append('fingerprint = ?')
+            params.append(fingerprint)
+        sql = 'SELECT * FROM {table_name}'.format(table_name=self.TABLENAME)
+        if conditions:
+            sql = sql + ' WHERE ' + ' AND '.join(conditions)
+        sql = sql + ' ORDER BY recorded_at, id'
+        with self.lock:
+            entries_df = pd.read_sql_query(sql, self.connection, params=params)
+        return entries_df
+
+    def get_non_golden_date_ranges(self, view_id, start_date=None, end_date=None):
+        """ Get the date ranges of a view whose latest request did not return golden data
+
+        These are the date ranges an incremental pull needs to request again.
+
+        Args:
+            view_id: (str) ID of the view
+            start_date: (str) only consider date ranges ending on or after this date (yyyy-mm-dd)
+            end_date: (str) only consider date ranges starting on or before this date (yyyy-mm-dd)
+
+        Returns:
+            date_ranges: (list of tuples) (start_date, end_date) of each non-golden date range
+        """
+        entries_df = self.get_entries(view_id, start_date, end_date)
+        if entries_df.empty:
+            return []
+        # The latest request of a fingerprint supersedes the earlier ones
+        latest_df = entries_df.drop_duplicates('fingerprint', keep='last')
+        non_golden_df = latest_df[latest_df['is_data_golden'] != 1]
+        date_ranges = sorted(set(zip(non_golden_df['start_date'], non_golden_df['end_date'])))
+        return date_ranges
+
+    def close(self):
+        """ Close the connection to the database
+
+        Returns:
+
+        """
+        with self.lock:
+            self.connection.close()
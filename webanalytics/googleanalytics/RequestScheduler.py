@@ -0,0 +1,301 @@
+#!/usr/bin/python
+
+"""Run Google Analytics report requests concurrently within quota
+
+GA API v4 allows 10 concurrent requests per view and limits the requests per second of a project.
+The RequestScheduler runs report tasks (date shards, metric groups, views) on a thread pool.
+Every HTTP request a task sends goes through RequestScheduler.execute, which
+    1) limits the requests per second with a token bucket (one token per HTTP request)
+    2) limits the concurrent requests per view
+    3) retries the request (and only that request) if it fails with 429, 500 or 503,
+       using exponential backoff with jitter
+    4) counts the requests, so the reported throughput is in HTTP requests per second
+Tasks themselves are neither rate limited nor retried, so a paginated task that fails on page N
+only sends page N again.
+
+Limits & Quotas: https://developers.google.com/analytics/devguides/reporting/core/v4/limits-quotas
+
+"""
+
+from common.util.Logging import check_logger
+from common.util.RateLimiter import TokenBucketRateLimiter
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import random
+import threading
+import time
+
+
+RETRYSTATUSCODES = (429, 500, 503)
+
+# State of the task and request running on the current thread
+_task_context = threading.local()
+
+
+def get_current_retry_count():
+    """ Get the number of retries of the request being executed on the current thread
+
+    Returns:
+        retry_count: (int) number of times the current request has been retried (0 outside of a scheduler)
+    """
+    return getattr(_task_context, 'retry_count', 0)
+
+
+def get_error_status(ex):
+    """ Get the HTTP status code of an exception raised by a Google API call
+
+    Args:
+        ex: (Exception) exception, e.g. googleapiclient.errors.HttpError
+
+    Returns:
+        status: (int) HTTP status code or None if the exception has no HTTP response
+    """
+    status = getattr(getattr(ex, 'resp', None), 'status', None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    """Run GA report tasks concurrently and send their requests with rate limiting, per-view concurrency limits and retries"""
+
+    MAXREQUESTSPERVIEW = 10  # GA API v4 allows 10 concurrent requests per view
+
+    def __init__(self,
+                 max_workers=10,
+                 requests_per_second=10,
+                 max_requests_per_view=MAXREQUESTSPERVIEW,
+                 max_retries=5,
+                 base_backoff_seconds=1,
+                 max_backoff_seconds=64,
+                 logging_obj=None):
+        """ Create a RequestScheduler object
+
+        Args:
+            max_workers: (int) number of threads running tasks
+            requests_per_second: (float) sustained requests per second allowed by the project's quota
+            max_requests_per_view: (int) maximum number of concurrent requests for one view
+            max_retries: (int) maximum number of retries of a request that fails with a retryable status
+            base_backoff_seconds: (float) backoff before the first retry (doubled for every retry)
+            max_backoff_seconds: (float) maximum backoff between retries
+            logging_obj: (common.Util.Logging.Logging) logger
+
+        Example:
+            from webanalytics.googleanalytics.RequestScheduler import RequestScheduler
+            scheduler = RequestScheduler(max_workers=10, requests_per_second=10)
+            # the GoogleAnalytics objects send their requests through scheduler.execute
+            ga_apis = {view_id: GoogleAnalytics(ga_settings=ga_settings, scheduler=scheduler) for view_id in view_ids}
+            futures = [scheduler.submit(view_id, ga_apis[view_id].query_reporting_api_v4,
+                                        date, date, metrics_names_cs_list, dimensions_names_cs_list)
+                       for view_id in ga_apis for date in dates]
+            results = [future.result() for future in futures]
+            scheduler.log_throughput()
+        """
+        self.max_workers = max_workers
+        self.max_requests_per_view = max_requests_per_view
+        self.max_retries = max_retries
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.logging_obj = check_logger(logging_obj)
+        self.rate_limiter = TokenBucketRateLimiter(requests_per_second)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.view_semaphores = dict()
+        self.lock = threading.Lock()
+        self.num_tasks = 0
+        self.num_requests = 0
+        self.num_retries = 0
+        self.num_failures = 0
+        self.started_at = None
+
+    def get_view_semaphore(self, view_id):
+        """ Get the semaphore limiting the concurrent requests of a view
+
+        Args:
+            view_id: (str) ID of the view (or profile)
+
+        Returns:
+            semaphore: (threading.BoundedSemaphore) semaphore of the view
+        """
+        with self.lock:
+            if view_id not in self.view_semaphores:
+                self.view_semaphores[view_id] = threading.BoundedSemaphore(self.max_requests_per_view)
+            return self.view_semaphores[view_id]
+
+    def get_backoff_seconds(self, retry_count):
+        """ Get the time to wait before a retry
+
+        Args:
+            retry_count: (int) number of the retry (starting at 0)
+
+        Returns:
+            backoff_seconds: (float) exponential backoff plus random jitter
+        """
+        backoff_seconds = min(self.max_backoff_seconds, self.base_backoff_seconds * 2 ** retry_count)
+        return backoff_seconds + random.uniform(0, self.base_backoff_seconds)
+
+    def submit(self, view_id, fn, *args, **kwargs):
+        """ Schedule a task
+
+        The task is not rate limited or retried itself: the HTTP requests it sends through execute are.
+        If this is called from a task that is already running on the scheduler, fn runs right away on the same
+        thread so that nested tasks can never deadlock the thread pool.
+
+        Args:
+            view_id: (str) ID of the view (or profile) the task is for
+            fn: (callable) function that sends the request(s)
+            *args: positional arguments of fn
+            **kwargs: keyword arguments of fn
+
+        Returns:
+            future: (concurrent.futures.Future) result of fn
+        """
+        with self.lock:
+            if self.started_at is None:
+                self.started_at = time.monotonic()
+            self.num_tasks = self.num_tasks + 1
+        if getattr(_task_context, 'scheduler', None) is self:
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as ex:
+                future.set_exception(ex)
+            return future
+        return self.executor.submit(self.run_task, fn, args, kwargs)
+
+    def map(self, view_id, fn, args_list):
+        """ Run fn for each set of arguments and return the results in order
+
+        Args:
+            view_id: (str) ID of the view (or profile) the tasks are for
+            fn: (callable) function that sends the request(s)
+            args_list: (list of tuples) positional arguments for each call of fn
+
+        Returns:
+            results: (list) results of fn in the same order as args_list
+        """
+        futures = [self.submit(view_id, fn, *args) for args in args_list]
+        results = [future.result() for future in futures]
+        return results
+
+    def run_task(self, fn, args, kwargs):
+        """ Run a task on a worker thread
+
+        Args:
+            fn: (callable) function that sends the request(s)
+            args: (tuple) positional arguments of fn
+            kwargs: (dict) keyword arguments of fn
+
+        Returns:
+            result: result of fn
+        """
+        _task_context.scheduler = self
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _task_context.scheduler = None
+
+    def execute(self, view_id, fn, *args, **kwargs):
+        """ Send one HTTP request within the rate limit and the view's concurrency limit, retrying it when GA
+        returns a retryable status
+
+        Every attempt takes a token from the rate limiter. fn must send exactly one HTTP request.
+
+        Args:
+            view_id: (str) ID of the view (or profile) the request is for
+            fn: (callable) function that sends the request, e.g. googleapiclient.http.HttpRequest.execute
+            *args: positional arguments of fn
+            **kwargs: keyword arguments of fn
+
+        Returns:
+            result: result of fn
+        """
+        with self.lock:
+            if self.started_at is None:
+                self.started_at = time.monotonic()
+        outer_retry_count = get_current_retry_count()
+        retry_count = 0
+        try:
+            while True:
+                _task_context.retry_count = retry_count
+                self.rate_limiter.acquire()
+                try:
+                    with self.get_view_semaphore(view_id):
+                        result = fn(*args, **kwargs)
+                except Exception as ex:
+                    status = get_error_status(ex)
+                    if status not in RETRYSTATUSCODES or retry_count >= self.max_retries:
+                        with self.lock:
+                            self.num_failures = self.num_failures + 1
+                        raise
+                    backoff_seconds = self.get_backoff_seconds(retry_count)
+                    log_msg = """
+                            method='webanalytics.googleanalytics.RequestScheduler.RequestScheduler.execute'
+                            message='Retrying GA request'
+                            view_id='{view_id}'
+                            status='{status}'
+                            retry_count='{retry_count}'
+                            backoff_seconds='{backoff_seconds:.2f}'
+                            """.format(view_id=view_id,
+                                       status=status,
+                                       retry_count=retry_count + 1,
+                                       backoff_seconds=backoff_seconds)
+                    self.logging_obj.log(self.logging_obj.WARN, log_msg)
+                    with self.lock:
+                        self.num_retries = self.num_retries + 1
+                    time.sleep(backoff_seconds)
+                    retry_count = retry_count + 1
+                else:
+                    with self.lock:
+                        self.num_requests = self.num_requests + 1
+                    return result
+        finally:
+            _task_context.retry_count = outer_retry_count
+
+    def get_throughput(self):
+        """ Get the throughput achieved by the scheduler so far
+
+        Returns:
+            throughput_dict: (dict) number of scheduled tasks, successful HTTP requests, retries and failures,
+                elapsed seconds since the first task or request and successful HTTP requests per second
+        """
+        with self.lock:
+            elapsed_seconds = time.monotonic() - self.started_at if self.started_at is not None else 0.0
+            throughput_dict = {'num_tasks': self.num_tasks,
+                               'num_requests': self.num_requests,
+                               'num_retries': self.num_retries,
+                               'num_failures': self.num_failures,
+                               'elapsed_seconds': elapsed_seconds,
+                               'requests_per_second': self.num_requests / elapsed_seconds if elapsed_seconds > 0 else 0.0}
+        return throughput_dict
+
+    def log_throughput(self):
+        """ Log the throughput achieved by the scheduler so far
+
+        Returns:
+            throughput_dict: (dict) see get_throughput
+        """
+        throughput_dict = self.get_throughput()
+        log_msg = """
+                method='webanalytics.googleanalytics.RequestScheduler.RequestScheduler.log_throughput'
+                message='GA request throughput'
+                num_tasks='{num_tasks}'
+                num_requests='{num_requests}'
+                num_retries='{num_retries}'
+                num_failures='{num_failures}'
+                elapsed_seconds='{elapsed_seconds:.2f}'
+                requests_per_second='{requests_per_second:.2f}'
+                """.format(**throughput_dict)
+        self.logging_obj.log(self.logging_obj.INFO, log_msg)
+        return throughput_dict
+
+    def shutdown(self, wait=True):
+        """ Shut down the thread pool
+
+        Args:
+            wait: (bool) wait for the scheduled requests to finish
+
+        Returns:
+
+        """
+        self.executor.shutdown(wait=wait)
@@ -10,8 +10,12 @@ from common.util.Logging import Logging
 from webanalytics.googleanalytics.GoogleApi import GoogleAnalytics as GoogleAnalyticsApi
 #from common.dataaccess.SqlDatabase import SqlDatabase
 from common.dataaccess.AmazonWebServicesApi import S3Bucket
-from common.util.DateTimeMethods import get_curr_date_str, add_days_to_date_str, is_date1_lteq_date2
+from common.util.DateTimeMethods import get_curr_date_str, add_days_to_date_str, subtract_days
+from common.util.DataFrameCache import DataFrameCache, DEFAULTTTLSECONDS
+from webanalytics.googleanalytics.RequestLedger import RequestLedger
 from webanalytics.googleanalytics.examples.tasks import execute_dailysitecontent_export
+from webanalytics.googleanalytics.examples.sitecontent import DESCRIPTIONFORS3KEY as DAILYSITECONTENTREPORTNAME
+from webanalytics.googleanalytics.examples.watermarks import WatermarkStore
 
 import sys, getopt
 import pandas as pd
@@ -67,6 +71,25 @@ def main(argv):
                                  creds_profile_name=aws_settings_dict['creds_profile_name'],
                                  region_name=aws_settings_dict['region_name'],
                                  logging_obj=logger)
+        if 'multipart_chunksize_mb' in aws_settings_dict or 'max_concurrency' in aws_settings_dict:
+            multipart_chunksize_mb = aws_settings_dict.get('multipart_chunksize_mb')
+            max_concurrency = aws_settings_dict.get('max_concurrency')
+            s3_bucket_obj.transfer_profiles.set_bucket_override(
+                aws_settings_dict['s3_bucket'],
+                multipart_chunksize=int(multipart_chunksize_mb) * 1024 * 1024 if multipart_chunksize_mb else None,
+                max_concurrency=int(max_concurrency) if max_concurrency else None)
+
+        # Initialize the GA response cache (golden days are not requested again)
+        response_cache = DataFrameCache(cache_dir=gaapi_settings_dict.get('response_cache_dir'),
+                                        ttl_seconds=int(gaapi_settings_dict.get('response_cache_ttl_seconds',
+                                                                                DEFAULTTTLSECONDS)),
+                                        logging_obj=logger)
+
+        # Initialize the ledger of GA request metadata (golden/sampling status, latency, retries)
+        request_ledger = RequestLedger(db_path=gaapi_settings_dict.get('request_ledger_path'), logging_obj=logger)
+
+        # Initialize the store of which days have been loaded (days loaded with golden data are not extracted again)
+        watermark_store = WatermarkStore(db_path=gaapi_settings_dict.get('watermark_db_path'), logger=logger)
 
         # Initialize accessor to the SQL Server database
         #ga_db = SqlDatabase(server=database_settings_dict['server_name'],
@@ -110,26 +133,33 @@ def main(argv):
                                         property_name=property_name,
                                         profile_name=profile_name,
                                         ga_settings=gaapi_settings_dict,
-                                        logging_obj=logger)
+                                        logging_obj=logger,
+                                        response_cache=response_cache,
+                                        request_ledger=request_ledger)
 
-            # Loop by date and run the data pipeline
-            start_date_i = start_date
-            end_date_i = add_days_to_date_str(start_date_i, 0)
+            # Loop by date and run the data pipeline for the days that are new or not golden yet
+            dates_list = watermark_store.get_dates_to_extract(ga_db_view_id, DAILYSITECONTENTREPORTNAME,
+                                                              start_date, end_date)
+            log_msg = """
+                message='Skipping days that were already loaded with golden data'
+                num_days_to_extract='{num_days_to_extract}'
+                num_days_skipped='{num_days_skipped}'
+                """.format(num_days_to_extract=len(dates_list),
+                           num_days_skipped=subtract_days(start_date, end_date) + 1 - len(dates_list))
+            logger.log(logger.INFO, log_msg)
 
-            while is_date1_lteq_date2(start_date_i, end_date):
+            for date_i in dates_list:
                 log_msg = """
                     ****************************
                     message='Running data pipeline for the date range {start_date_i} - {end_date_i}'
                     ****************************
-                    """.format(start_date_i=start_date_i,
-                               end_date_i=end_date_i)
+                    """.format(start_date_i=date_i,
+                               end_date_i=date_i)
                 logger.log(logger.INFO, log_msg)
 
-                execute_dailysitecontent_export(ga_api, s3_bucket_obj, ga_db_view_id, start_date_i, end_date_i, logger)
-
-                # Increment start and end dates
-                start_date_i = add_days_to_date_str(end_date_i, 1)
-                end_date_i = add_days_to_date_str(start_date_i, 0)
+                is_data_golden = execute_dailysitecontent_export(ga_api, s3_bucket_obj, ga_db_view_id, date_i, date_i,
+                                                                 logger)
+                watermark_store.mark_loaded(ga_db_view_id, DAILYSITECONTENTREPORTNAME, date_i, is_data_golden)
 
     except Exception as ex:
         logger.log(logger.ERROR, "message='Error running {filename}' exception_message='{ex_msg}'".format(filename=__file__,
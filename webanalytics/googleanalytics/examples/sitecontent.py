@@ -5,14 +5,13 @@
 """
 
 from webanalytics.googleanalytics.examples.ietl import IEtl
-from webanalytics.googleanalytics.examples.tools.FeatureExtractors import get_page_path_levels, \
-    extract_page_path_level_n, extract_source_medium
+from webanalytics.googleanalytics.examples.tools.FeatureExtractors import extract_page_path_level_n, \
+    extract_source_medium
 from webanalytics.googleanalytics.examples.tools.GoogleAnalyticsColumnRenamer import update_spark_df_column_names, \
     update_column_names
 
 import inspect
 import pandas as pd
-import numpy as np
 
 
 DESCRIPTIONFORS3KEY = "daily_site_content"
@@ -37,66 +36,38 @@ class DailySiteContent(IEtl):
                          logger=logger)
         # Set values for S3 bucket key
         self.s3_bucket_key = self.get_s3_key(DESCRIPTIONFORS3KEY)
+        # Whether the extracted data is golden (set by extract)
+        self.is_data_golden = False
 
     def extract(self):
-        metrics_names_cs_list1 = 'ga:pageviews,ga:uniquePageviews,ga:timeOnPage,ga:avgTimeOnPage,ga:entrances,ga:bounceRate,ga:exitRate,ga:pageValue'
+        # GA only allows 10 metrics in one report, so query_reporting_api_v4 splits these metrics into two reports
+        # and sends them in one batchGet call
+        metrics_names_cs_list = 'ga:pageviews,ga:uniquePageviews,ga:timeOnPage,ga:avgTimeOnPage,ga:entrances,' \
+                                'ga:bounceRate,ga:exitRate,ga:pageValue,ga:entranceRate,ga:pageviewsPerSession,' \
+                                'ga:exits,ga:avgSessionDuration,ga:sessions'
         dimensions_names_cs_list = 'ga:date,ga:sourceMedium,ga:country,ga:landingPagePath,ga:hostname,ga:pagePath,ga:previousPagePath,ga:pageDepth,ga:exitPagePath'
         dimension_filters_dict = None
 
         log_msg = """
                     method='webanalytics.googleanalytics.examples.sitecontent.DailySiteContent.{method}'
-                    message='Getting 1st set of site content summary data'
+                    message='Getting site content summary data'
                     metrics_names_cs_list='{metrics_names}'
                     dimensions_names_cs_list='{dimensions_names}'
                     start_date='{s_date}'
                     end_date='{e_date}'
                     """.format(method=inspect.stack()[0][3],
-                               metrics_names=metrics_names_cs_list1,
+                               metrics_names=metrics_names_cs_list,
                                dimensions_names=dimensions_names_cs_list,
                                s_date=self.start_date,
                                e_date=self.end_date)
         self.logger.log(self.logger.INFO, log_msg)
-        (reports_dict1, data_df1) = self.data_source.query_reporting_api_v4(self.start_date, self.end_date,
-                                                                            metrics_names_cs_list1,
-                                                                            dimensions_names_cs_list,
-                                                                            dimension_filters_dict)
-        metrics_names_cs_list2 = 'ga:entranceRate,ga:pageviewsPerSession,ga:exits,ga:avgSessionDuration,ga:sessions'
-        log_msg = """
-                    method='webanalytics.googleanalytics.examples.sitecontent.DailySiteContent.{method}'
-                    message='Getting 2nd set of site content summary data'
-                    metrics_names_cs_list='{metrics_names}'
-                    dimensions_names_cs_list='{dimensions_names}'
-                    start_date='{s_date}'
-                    end_date='{e_date}'
-                    """.format(method=inspect.stack()[0][3],
-                               metrics_names=metrics_names_cs_list2,
-                               dimensions_names=dimensions_names_cs_list,
-                               s_date=self.start_date,
-                               e_date=self.end_date)
-        self.logger.log(self.logger.INFO, log_msg)
-        (reports_dict2, data_df2) = self.data_source.query_reporting_api_v4(self.start_date, self.end_date,
-                                                                            metrics_names_cs_list2,
-                                                                            dimensions_names_cs_list,
-                                                                            dimension_filters_dict)
-        if data_df1.empty or data_df2.empty:
-            log_msg = """
-                        method='webanalytics.googleanalytics.examples.sitecontent.DailySiteContent.{method}'
-                        message='Not merging daily site content data because at least one of the responses is empty'
-                        """.format(method=inspect.stack()[0][3])
-            self.logger.log(self.logger.WARN, log_msg)
-            data_df = data_df1
-        else:
-            data_df = pd.merge(data_df1, data_df2,
-                               on=['ga:date',
-                                   'ga:sourceMedium',
-                                   'ga:country',
-                                   'ga:landingPagePath',
-                                   'ga:hostname',
-                                   'ga:pagePath',
-                                   'ga:previousPagePath',
-                                   'ga:pageDepth',
-                                   'ga:exitPagePath'],
-                               how='outer')
+        # The raw responses are not used, so they are dropped as soon as each page has been decoded
+        (reports_dict, data_df) = self.data_source.query_reporting_api_v4(self.start_date, self.end_date,
+                                                                          metrics_names_cs_list,
+                                                                          dimensions_names_cs_list,
+                                                                          dimension_filters_dict,
+                                                                          raw_responses='drop')
+        self.is_data_golden = bool(data_df.attrs.get('isDataGolden', False))
         return data_df
 
     def transform(self, response):
@@ -113,107 +84,22 @@ class DailySiteContent(IEtl):
             response.columns = new_column_names
 
             # Extract page path levels and source/medium
-            source_medium_series = response['SourceMedium']
-            page_path_series = response['PagePath']
-            landing_page_path_series = response['LandingPagePath']
-            exit_page_path_series = response['ExitPagePath']
-            previous_page_path_series = response['PreviousPagePath']
-
-            source = []
-            medium = []
-            page_path_level1 = []
-            page_path_level2 = []
-            landing_page_path_level1 = []
-            landing_page_path_level2 = []
-            exit_page_path_level1 = []
-            exit_page_path_level2 = []
-            previous_page_path_level1 = []
-            previous_page_path_level2 = []
-
-            for iter in range(len(source_medium_series)):
-
-                source_iter, medium_iter = extract_source_medium(source_medium_series[iter])
-
-                page_path_levels_list = get_page_path_levels(page_path_series[iter])
-                page_path_level1_val = extract_page_path_level_n(page_path_levels_list, 1)
-                page_path_level2_val = extract_page_path_level_n(page_path_levels_list, 2)
-
-                landing_levels_list_iter = get_page_path_levels(landing_page_path_series[iter])
-                landing_page_path_level1_iter = extract_page_path_level_n(landing_levels_list_iter, 1)
-                landing_page_path_level2_iter = extract_page_path_level_n(landing_levels_list_iter, 2)
-
-                exit_levels_list_iter = get_page_path_levels(exit_page_path_series[iter])
-                exit_page_path_level1_iter = extract_page_path_level_n(exit_levels_list_iter, 1)
-                exit_page_path_level2_iter = extract_page_path_level_n(exit_levels_list_iter, 2)
-
-                previous_levels_list_iter = get_page_path_levels(previous_page_path_series[iter])
-                previous_page_path_level1_iter = extract_page_path_level_n(previous_levels_list_iter, 1)
-                previous_page_path_level2_iter = extract_page_path_level_n(previous_levels_list_iter, 2)
-
-                source.append(source_iter)
-                medium.append(medium_iter)
-
-                page_path_level1.append(page_path_level1_val)
-                page_path_level2.append(page_path_level2_val)
-
-                landing_page_path_level1.append(landing_page_path_level1_iter)
-                landing_page_path_level2.append(landing_page_path_level2_iter)
-
-                exit_page_path_level1.append(exit_page_path_level1_iter)
-                exit_page_path_level2.append(exit_page_path_level2_iter)
-
-                previous_page_path_level1.append(previous_page_path_level1_iter)
-                previous_page_path_level2.append(previous_page_path_level2_iter)
-
-            response = response.assign(Source=source,
-                                       Medium=medium,
-                                       PagePathLevel1=page_path_level1,
-                                       PagePathLevel2=page_path_level2,
-                                       LandingPagePathLevel1=landing_page_path_level1,
-                                       LandingPagePathLevel2=landing_page_path_level2,
-                                       ExitPagePathLevel1=exit_page_path_level1,
-                                       ExitPagePathLevel2=exit_page_path_level2,
-                                       PreviousPagePathLevel1=previous_page_path_level1,
-                                       PreviousPagePathLevel2=previous_page_path_level2)
+            # The dimensions are categorical, so each feature is extracted once per distinct value
+            # (the categories) instead of once per row
+            page_path_levels = dict()
+            for column_name in ['PagePath', 'LandingPagePath', 'ExitPagePath', 'PreviousPagePath']:
+                for n in [1, 2]:
+                    page_path_levels['{column_name}Level{n}'.format(column_name=column_name, n=n)] = \
+                        response[column_name].map(lambda page_path, n=n: extract_page_path_level_n(page_path, n))
+            response = response.assign(Source=response['SourceMedium'].map(
+                                           lambda source_medium: extract_source_medium(source_medium)[0]),
+                                       Medium=response['SourceMedium'].map(
+                                           lambda source_medium: extract_source_medium(source_medium)[1]),
+                                       **page_path_levels)
 
             # Prepare a DataFrame for loading into a staging table
-            num_rows = response.shape[0]
-            data_tuples = list(zip([self.ga_view_id] * num_rows,
-                                   response['DateMst'],
-                                   response['SourceMedium'],
-                                   response['Country'],
-                                   response['LandingPagePath'],
-                                   response['Hostname'],
-                                   response['PagePath'],
-                                   response['PreviousPagePath'],
-                                   response['PageDepth'],
-                                   response['ExitPagePath'],
-                                   response['Pageviews'],
-                                   response['UniquePageviews'],
-                                   response['TimeOnPageSeconds'],
-                                   response['AvgTimeOnPageSeconds'],
-                                   response['Entrances'],
-                                   response['BounceRate'],
-                                   response['ExitRate'],
-                                   response['PageValue'],
-                                   response['EntranceRate'],
-                                   response['PageviewsPerSession'],
-                                   response['Exits'],
-                                   response['AvgSessionDurationSeconds'],
-                                   response['Sessions'],
-                                   response['Source'],
-                                   response['Medium'],
-                                   response['PagePathLevel1'],
-                                   response['PagePathLevel2'],
-                                   response['LandingPagePathLevel1'],
-                                   response['LandingPagePathLevel2'],
-                                   response['ExitPagePathLevel1'],
-                                   response['ExitPagePathLevel2'],
-                                   response['PreviousPagePathLevel1'],
-                                   response['PreviousPagePathLevel2']
-                                   ))
-            transformed_response_column_names = np.insert(response.columns.values, 0, 'ViewId')
-            transformed_response = pd.DataFrame(data_tuples, columns=transformed_response_column_names)
+            transformed_response = response.copy()
+            transformed_response.insert(0, 'ViewId', self.ga_view_id)
 
         return transformed_response
 
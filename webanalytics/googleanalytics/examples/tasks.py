@@ -6,9 +6,15 @@ from webanalytics.googleanalytics.examples.sitecontent import DailySiteContent
 
 
 def execute_dailysitecontent_export(ga_api_obj, s3_bucket, ga_view_id, start_date, end_date, logger):
+    """ Move daily site content data from GA to S3
+
+    Returns:
+        is_data_golden (bool): whether the loaded data was golden (i.e. the days are final)
+    """
     export = DailySiteContent(ga_api_obj, s3_bucket, ga_view_id, start_date, end_date, logger)
     response = export.extract()
     transformed_response = export.transform(response)
     export.load(transformed_response)
+    return export.is_data_golden
 
 
@@ -0,0 +1,137 @@
+#!/usr/bin/python
+
+"""Keep track of which days of each report have been loaded
+
+GA data for a day can change until it is golden, so the data pipeline re-extracts recent days.
+The WatermarkStore records, per view and report, every day that has been loaded and whether the loaded
+data was golden. Days whose loaded data was golden are final and never need to be extracted again.
+
+"""
+
+from common.util.Logging import check_logger
+from common.util.OSHelpers import get_cache_dir
+from common.util.DateTimeMethods import add_days_to_date_str, is_date1_lteq_date2, get_curr_datetime_str
+
+import os
+import sqlite3
+import threading
+
+
+class WatermarkStore:
+    """Store the load state of each day of each report of each GA view in a SQLite database"""
+
+    TABLENAME = 'report_day_watermarks'
+
+    def __init__(self, db_path=None, logger=None):
+        """ Create a WatermarkStore object
+
+        Args:
+            db_path (str): path to the SQLite database (defaults to the user's home directory > Cache > GoogleAnalytics)
+            logger (common.util.Logging.Logging): logger object
+
+        Example:
+            watermark_store = WatermarkStore()
+            dates_list = watermark_store.get_dates_to_extract(1, 'daily_site_content', '2019-01-01', '2019-01-07')
+        """
+        if db_path is None:
+            db_path = os.path.join(get_cache_dir('GoogleAnalytics'), 'watermarks.sqlite3')
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.logger = check_logger(logger)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self.lock:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS {table_name} (
+                    view_id TEXT NOT NULL,
+                    report_name TEXT NOT NULL,
+                    report_date TEXT NOT NULL,
+                    is_final INTEGER NOT NULL,
+                    loaded_at TEXT NOT NULL,
+                    PRIMARY KEY (view_id, report_name, report_date)
+                )""".format(table_name=self.TABLENAME))
+            self.connection.commit()
+
+    def get_final_dates(self, view_id, report_name, start_date, end_date):
+        """ Get the days of a report that have been loaded with golden data
+
+        Args:
+            view_id: ID of the view (or profile)
+            report_name (str): name of the report, e.g. daily_site_content
+            start_date (str): first day (yyyy-mm-dd)
+            end_date (str): last day (yyyy-mm-dd)
+
+        Returns:
+            final_dates (set of str): final days between start_date and end_date
+        """
+        with self.lock:
+            cursor = self.connection.execute("""
+                SELECT report_date FROM {table_name}
+                WHERE view_id = ? AND report_name = ? AND report_date BETWEEN ? AND ? AND is_final = 1
+                """.format(table_name=self.TABLENAME), (str(view_id), report_name, start_date, end_date))
+            final_dates = set(row[0] for row in cursor.fetchall())
+        return final_dates
+
+    def get_dates_to_extract(self, view_id, report_name, start_date, end_date):
+        """ Get the days of a report that are new or were not golden when they were loaded
+
+        Args:
+            view_id: ID of the view (or profile)
+            report_name (str): name of the report, e.g. daily_site_content
+            start_date (str): first day (yyyy-mm-dd)
+            end_date (str): last day (yyyy-mm-dd)
+
+        Returns:
+            dates_list (list of str): days between start_date and end_date that need to be extracted, in order
+        """
+        final_dates = self.get_final_dates(view_id, report_name, start_date, end_date)
+        dates_list = []
+        date_i = start_date
+        while is_date1_lteq_date2(date_i, end_date):
+            if date_i not in final_dates:
+                dates_list.append(date_i)
+            date_i = add_days_to_date_str(date_i, 1)
+        return dates_list
+
+    def mark_loaded(self, view_id, report_name, report_date, is_final):
+        """ Record that a day of a report has been loaded
+
+        Args:
+            view_id: ID of the view (or profile)
+            report_name (str): name of the report, e.g. daily_site_content
+            report_date (str): day that was loaded (yyyy-mm-dd)
+            is_final (bool): whether the loaded data was golden
+
+        Returns:
+
+        """
+        with self.lock:
+            with self.connection:
+                self.connection.execute("""
+                    INSERT OR REPLACE INTO {table_name} (view_id, report_name, report_date, is_final, loaded_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    """.format(table_name=self.TABLENAME),
+                                        (str(view_id), report_name, report_date, int(bool(is_final)),
+                                         get_curr_datetime_str()))
+        log_msg = """
+                    method='webanalytics.googleanalytics.examples.watermarks.WatermarkStore.mark_loaded'
+                    message='Updated watermark'
+                    view_id='{view_id}'
+                    report_name='{report_name}'
+                    report_date='{report_date}'
+                    is_final='{is_final}'
+                    """.format(view_id=view_id,
+                               report_name=report_name,
+                               report_date=report_date,
+                               is_final=bool(is_final))
+        self.logger.log(self.logger.DEBUG, log_msg)
+
+    def close(self):
+        """ Close the connection to the database
+
+        Returns:
+
+        """
+        with self.lock:
+            self.connection.close()